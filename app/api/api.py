@@ -5,10 +5,14 @@ from .endpoints import auth_api
 from .endpoints import coveragemap_api
 from .endpoints import nielsen_api
 from .endpoints import useradmin_api
+from .endpoints import metrics_api
+from .endpoints import export_api
 api_router = APIRouter()
 
 api_router.include_router(auth_api.router, prefix="/auth", tags=["auth"])
 api_router.include_router(engagement_api.router, prefix="/engagement", tags=["engagement"])
 api_router.include_router(coveragemap_api.router, prefix="/map", tags=["map"])
 api_router.include_router(nielsen_api.router, prefix="/nielsen", tags=["nielsen"])
-api_router.include_router(useradmin_api.router, prefix="/useradmin", tags=["useradmin"])
\ No newline at end of file
+api_router.include_router(useradmin_api.router, prefix="/useradmin", tags=["useradmin"])
+api_router.include_router(metrics_api.router, prefix="/metrics", tags=["metrics"])
+api_router.include_router(export_api.router, prefix="/export", tags=["export"])
\ No newline at end of file
@@ -1,35 +1,179 @@
-from fastapi import APIRouter, Depends
-import json 
-import sys 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from typing import List, Literal, Optional
+import time
 
 # Models 
 from models.api_responses import StandardAPIResponse
-import boto3
+from models.coverage_schemas import CoverageLookupRequest
 
 # Dependencies
-from dependencies import get_s3_client
+from dependencies import get_coverage_storage, get_coverage_tile_storage
+from config import settings
+from utils.response_utils import raw_json_envelope
+from utils.object_cache import ObjectCache
+from utils.storage import ObjectStorage
+from transformations.coverage.coverage_tiles import CoverageTileIndex, get_coverage_tile_index, valid_tile, MAX_TILE_ZOOM
+from transformations.coverage.coverage_layer import get_coverage_layer, resolution_for_zoom
+from transformations.coverage.coverage_lookup import CoverageLookup, get_coverage_lookup
 
 router = APIRouter()
 
+# The coverage geojson rarely changes, keep the raw bytes in memory and revalidate with the storage ETag
+coverage_cache = ObjectCache(ttl_seconds=settings.COVERAGE_CACHE_TTL_SECONDS)
+
 # Returns our Coverage Map Data.
 @router.get("/coverage_snzips", response_model=StandardAPIResponse)
-def get_snzips(s3_client: boto3.client = Depends(get_s3_client)):
-    # Loginto the aws session 
+def get_snzips(request: Request, storage: ObjectStorage = Depends(get_coverage_storage),
+               resolution: Optional[Literal["full", "high", "medium", "low"]] = None,
+               zoom: Optional[int] = Query(None, ge=0, le=MAX_TILE_ZOOM),
+               format: Literal["geojson", "topojson"] = "geojson"):
+    """
+    Get the SN zips coverage geojson, wrapped in the standard response.
+
+    resolution picks a simplified version of the geometries (shared borders are simplified once, so neighbouring zips
+    still line up), or zoom picks the coarsest one that's still about a pixel at that map zoom. The default is full.
+
+    format=topojson returns the layer as TopoJSON instead: every shared border stored once as an arc, with quantized,
+    delta encoded coordinates (a fraction of the geojson's size). Decode it with topojson-client's feature().
+
+    The full geojson bytes from storage are spliced into the response as is (no json parse/dump round trip), simplified
+    versions and topojson encodings are built once per source version and kept in memory.
+    The response carries an ETag (the source ETag + the resolution + the format), a matching If-None-Match gets an empty 304.
+    """
+    if resolution is None:
+        resolution = resolution_for_zoom(zoom) if zoom is not None else "full"
     try:
-        print('Downloading Object')
-        s3_object = s3_client.get_object(Bucket='coveragemapdata', Key='SNzips_no_sub_data.geoJSON')
-        s3_object_body = s3_object['Body'].read()
-        sn_zips_json = json.loads(s3_object_body)
+        coverage = coverage_cache.get(storage, settings.COVERAGE_SNZIPS_KEY)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         return StandardAPIResponse(success=False, message="Failed to retrieve coverage data", data=None)
-    # grab the size of the data in bytes
-    snzips_size = str(sys.getsizeof(sn_zips_json['features'])) + ' bytes'
-    print(snzips_size)
-    return StandardAPIResponse(success=True, message="Coverage data retrieved successfully",
-                                data=sn_zips_json, metadata={'size': snzips_size})
+
+    suffix = "".join(f"-{part}" for part in (resolution, format) if part not in ("full", "geojson"))
+    etag = f'"{coverage.etag.strip(chr(34))}{suffix}"' if suffix else coverage.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if format == "topojson":
+        geojson = get_coverage_layer(coverage.body, coverage.etag).topojson(resolution)
+    elif resolution != "full":
+        geojson = get_coverage_layer(coverage.body, coverage.etag).geojson(resolution)
+    else:
+        geojson = coverage.body
+    # The actual size of the geojson in bytes
+    metadata = {'size': f"{len(geojson)} bytes", 'resolution': resolution, 'format': format, 'etag': etag,
+                'last_modified': coverage.last_modified}
+    body = raw_json_envelope("Coverage data retrieved successfully", geojson, metadata=metadata)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _tile_index(coverage, tile_storage: ObjectStorage) -> CoverageTileIndex:
+    return get_coverage_tile_index(coverage.body, coverage.etag, storage=tile_storage,
+                                   precut_max_zoom=settings.COVERAGE_TILE_PRECUT_MAX_ZOOM,
+                                   stale_after_seconds=settings.COVERAGE_TILE_STALE_SECONDS)
+
+@router.get("/coverage_snzips/tiles", response_model=StandardAPIResponse)
+def get_snzips_tiles_info(request: Request, storage: ObjectStorage = Depends(get_coverage_storage),
+                          tile_storage: ObjectStorage = Depends(get_coverage_tile_storage)):
+    """
+    Get the info the map needs to use the coverage tiles: the tile url template, the bounds of the data and the zoom range.
+    """
+    try:
+        coverage = coverage_cache.get(storage, settings.COVERAGE_SNZIPS_KEY)
+        index = _tile_index(coverage, tile_storage)
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return StandardAPIResponse(success=False, message="Failed to retrieve coverage data", data=None)
+
+    data = {
+        "tiles": [str(request.url_for("get_snzips_tile", z=0, x=0, y=0)).replace("/0/0/0", "/{z}/{x}/{y}")],
+        "bounds": index.bounds,
+        "minzoom": 0,
+        "maxzoom": MAX_TILE_ZOOM,
+        "features": len(index),
+    }
+    return StandardAPIResponse(success=True, message="Coverage tile info retrieved successfully", data=data, metadata={'etag': coverage.etag})
+
+
+@router.get("/coverage_snzips/tiles/{z}/{x}/{y}")
+def get_snzips_tile(z: int, x: int, y: int, request: Request, storage: ObjectStorage = Depends(get_coverage_storage),
+                    tile_storage: ObjectStorage = Depends(get_coverage_tile_storage)):
+    """
+    Get one z/x/y tile of the SN zips coverage layer, a geojson FeatureCollection of the zips that intersect the tile.
+    Tiles are cut from an in memory bounding box index of the geojson and cached, both are rebuilt when the source object changes.
+    The low zoom tiles (up to COVERAGE_TILE_PRECUT_MAX_ZOOM) are pre-cut when the index is built and read from the tile storage.
+    """
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=400, detail=f"Invalid tile {z}/{x}/{y}")
+    try:
+        coverage = coverage_cache.get(storage, settings.COVERAGE_SNZIPS_KEY)
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        raise HTTPException(status_code=502, detail="Failed to retrieve coverage data")
+
+    etag = f'"{coverage.etag.strip(chr(34))}-{z}-{x}-{y}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    tile = _tile_index(coverage, tile_storage).tile(z, x, y)
+    return Response(content=tile, media_type="application/geo+json", headers=headers)
+
+
+def _lookup_results(lookup: CoverageLookup, lats: List[float], lons: List[float], zips: List[str]) -> dict:
+    """
+    Coverage membership of the points and zips, with the zips of the polygons that matched.
+    """
+    point_matches = lookup.lookup_points(lats, lons) if lats else []
+    zip_matches = lookup.lookup_zips(zips) if zips else []
+    return {
+        "points": [{"lat": lat, "lon": lon, "covered": bool(matches), "zips": [lookup.zips[f] for f in matches]}
+                   for lat, lon, matches in zip(lats, lons, point_matches)],
+        "zips": [{"zip": zip_code, "covered": bool(matches)} for zip_code, matches in zip(zips, zip_matches)],
+    }
+
+
+def _get_lookup(storage: ObjectStorage) -> CoverageLookup:
+    try:
+        coverage = coverage_cache.get(storage, settings.COVERAGE_SNZIPS_KEY)
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        raise HTTPException(status_code=502, detail="Failed to retrieve coverage data")
+    return get_coverage_lookup(coverage.body, coverage.etag, settings.COVERAGE_ZIP_PROPERTY)
+
+
+@router.get("/coverage_lookup", response_model=StandardAPIResponse)
+def lookup_coverage(lat: Optional[float] = Query(None, ge=-90, le=90), lon: Optional[float] = Query(None, ge=-180, le=180),
+                    zip: Optional[str] = None, storage: ObjectStorage = Depends(get_coverage_storage)):
+    """
+    Check whether a single point (lat and lon) and/or a zip is in SN coverage.
+    """
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="lat and lon must be given together")
+    if lat is None and zip is None:
+        raise HTTPException(status_code=400, detail="Give a point (lat and lon) or a zip")
+    lookup = _get_lookup(storage)
+    data = _lookup_results(lookup, [lat] if lat is not None else [], [lon] if lon is not None else [], [zip] if zip is not None else [])
+    return StandardAPIResponse(success=True, message="Coverage lookup successful", data=data, metadata={'etag': lookup.version})
+
+
+@router.post("/coverage_lookup", response_model=StandardAPIResponse)
+def lookup_coverage_batch(request_model: CoverageLookupRequest, storage: ObjectStorage = Depends(get_coverage_storage)):
+    """
+    Check a batch of points and/or zips against SN coverage. Points are looked up together: one pass down the
+    spatial index for the whole batch, then one exact point-in-polygon test per candidate polygon.
+    """
+    lookup = _get_lookup(storage)
+    start_time = time.perf_counter()
+    data = _lookup_results(lookup, [point.lat for point in request_model.points], [point.lon for point in request_model.points],
+                           request_model.zips)
+    seconds = time.perf_counter() - start_time
+    n_lookups = len(request_model.points) + len(request_model.zips)
+    metadata = {'etag': lookup.version, 'lookups': n_lookups,
+                'microseconds_per_lookup': round(seconds * 1e6 / n_lookups, 2) if n_lookups else None}
+    return StandardAPIResponse(success=True, message="Coverage lookup successful", data=data, metadata=metadata)
+
 
 @router.get("/tester")
 def tester():
     return StandardAPIResponse(success=True, message="Coverage data retrieved successfully",
-                                data='test', metadata={'size': 'none'})
\ No newline at end of file
+                                data='test', metadata={'size': 'none'})
@@ -0,0 +1,91 @@
+# Fast Api Imports
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Literal
+
+# Dependencies
+from dependencies import get_db
+
+# Models
+from models.engagement_schemas import StartEndEngagement, EngagementBundleRequest
+
+# Crud Operations
+from crud import engagement_crud as eng_crud
+
+# Services
+from transformations.engagement.engagement_bundle import run_engagement_bundle
+from utils.export_utils import (arrow_export_response, excel_export_response, iter_dataframe_chunks, arrow_schema_from_cursor,
+                                arrow_schema_from_dataframe, EXPORT_ROW_GROUP_ROWS)
+
+router = APIRouter()
+
+ExportFormat = Literal["parquet", "arrow"]
+
+
+@router.post("/engagement_data")
+def export_engagement_data(date_range: StartEndEngagement, export_format: ExportFormat = Query("parquet", alias="format"),
+                           include_false_tier: bool = False, db: Session = Depends(get_db)):
+    """
+    Export the raw engagement rows (as get_engagement_data returns them) for a date range as Parquet or an Arrow IPC stream.
+
+    Parameters:
+    - date_range (StartEndEngagement): Contains start_month and end_month in the format "MMMM YYYY".
+    - format: 'parquet' (default) or 'arrow'
+    - include_false_tier: Whether to include the FALSE tier rows
+
+    The rows are read from a server side cursor and written one row group at a time while the response streams.
+    The file's schema comes from the query's column types, so it doesn't depend on the rows in the first chunk.
+    """
+    start_month_str = datetime.strptime(date_range.start_month, "%B %Y").strftime("%Y-%m")
+    end_month_str = datetime.strptime(date_range.end_month, "%B %Y").strftime("%Y-%m")
+    schema = arrow_schema_from_cursor(eng_crud.get_engagement_data_description(db=db, networks=None,
+                                                                               include_false_tier=include_false_tier))
+
+    def frames():
+        # The request's db dependency is closed before a streaming body is sent, so the export opens its own session
+        with contextmanager(get_db)() as db:
+            yield from eng_crud.iter_engagement_data(db=db, start_month=start_month_str, end_month=end_month_str,
+                                                     networks=None, include_false_tier=include_false_tier,
+                                                     chunksize=EXPORT_ROW_GROUP_ROWS)
+
+    filename = f"engagement_{start_month_str}_{end_month_str}"
+    return arrow_export_response(frames(), export_format, filename, schema)
+
+
+@router.post("/engagement_table")
+def export_engagement_table(bundle: EngagementBundleRequest, table: str, export_format: ExportFormat = Query("parquet", alias="format"),
+                            db: Session = Depends(get_db)):
+    """
+    Export one computed engagement table (eg. ytd_sn, mom_data, hev_data, quarter_sn) as Parquet or an Arrow IPC stream.
+
+    Parameters:
+    - bundle (EngagementBundleRequest): The view(s) to compute, same body as /engagement/bundle
+    - table: Name of the table to export, as it's keyed in the engagement responses
+    - format: 'parquet' (default) or 'arrow'
+    """
+    if not bundle.requested_views():
+        raise HTTPException(status_code=400, detail="No engagement views requested")
+
+    tables, _ = run_engagement_bundle(db, bundle)
+    if table not in tables:
+        raise HTTPException(status_code=400, detail=f"Unknown table '{table}', the requested views return: {', '.join(tables)}")
+
+    return arrow_export_response(iter_dataframe_chunks(tables[table]), export_format, table,
+                                 arrow_schema_from_dataframe(tables[table]))
+
+
+@router.post("/engagement_workbook")
+def export_engagement_workbook(bundle: EngagementBundleRequest, db: Session = Depends(get_db)):
+    """
+    Export the engagement dashboard tabs (eg. ytd, mom, hev, quarterly) as an xlsx workbook, one sheet per table.
+
+    Parameters:
+    - bundle (EngagementBundleRequest): The views to include, same body as /engagement/bundle
+    """
+    if not bundle.requested_views():
+        raise HTTPException(status_code=400, detail="No engagement views requested")
+
+    tables, _ = run_engagement_bundle(db, bundle)
+    return excel_export_response(tables, f"engagement_{'_'.join(bundle.requested_views())}")
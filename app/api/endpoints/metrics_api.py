@@ -0,0 +1,44 @@
+from fastapi import APIRouter
+
+# Models
+from models.api_responses import StandardAPIResponse
+
+# Middleware stats
+from middleware.compression import compression_stats
+from middleware.coalescing import coalescing_stats
+
+router = APIRouter()
+
+
+@router.get("/compression", response_model=StandardAPIResponse)
+def get_compression_stats():
+    """
+    Get the per route response compression stats (bytes in/out, ratio, compression cpu seconds).
+    """
+    return StandardAPIResponse(success=True, message="Compression stats retrieved", data=compression_stats.snapshot(), metadata=None)
+
+
+@router.post("/compression/reset", response_model=StandardAPIResponse)
+def reset_compression_stats():
+    """
+    Reset the compression stats, handy after changing the levels.
+    """
+    compression_stats.reset()
+    return StandardAPIResponse(success=True, message="Compression stats reset", data=None, metadata=None)
+
+
+@router.get("/coalescing", response_model=StandardAPIResponse)
+def get_coalescing_stats():
+    """
+    Get the per route request coalescing stats (executions, coalesced waiters, currently/max waiting).
+    """
+    return StandardAPIResponse(success=True, message="Coalescing stats retrieved", data=coalescing_stats.snapshot(), metadata=None)
+
+
+@router.post("/coalescing/reset", response_model=StandardAPIResponse)
+def reset_coalescing_stats():
+    """
+    Reset the coalescing stats.
+    """
+    coalescing_stats.reset()
+    return StandardAPIResponse(success=True, message="Coalescing stats reset", data=None, metadata=None)
@@ -1,37 +1,57 @@
 from fastapi import APIRouter, UploadFile, Form, File, HTTPException, Depends, BackgroundTasks
-from fastapi.responses import FileResponse
-from typing import List
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import Header, Query
+from contextlib import contextmanager
+from typing import List, Optional
 import pandas as pd
 import warnings
 import os
-import glob
 from sqlalchemy.orm import Session
 # Models 
 from models.api_responses import StandardAPIResponse
 from models.nielsen_schemas import NielsenTestSchema, NielsenReportSchema, NielsenSubjectLineSchema, NielsenEMLDownloadSchema
 
 # Dependencies
-from dependencies import get_db
+from dependencies import get_db, get_benchmark_storage, get_upload_store
+from config import settings
+from utils.storage import ObjectStorage
+from utils.job_queue import JobQueue, JobQueueFull, JOB_SUCCEEDED
+from utils.upload_store import UploadStore, upload_id_for
 
 # Nielsen Report Functions
 from transformations.nielsen.test_eml import create_eml_download_email_test
-from transformations.nielsen.nielsen_daily_report import generate_nielsen_daily_report
+from transformations.nielsen.nielsen_daily_report import generate_nielsen_daily_report, generate_nielsen_daily_reports
+from transformations.nielsen.nielsen_daily_report import build_benchmark_cache
+from transformations.nielsen.nielsen_daily_report_funcs import remove_report_directories, NielsenConfigSnapshot
 
 # Nielsen Utils
 from utils.nielsen_utils import verify_columns, verify_date_range, identify_nielsen_file, verify_no_dash_in_date
-from utils.nielsen_utils import serve_latest_benchmark, serve_latest_benchmark_name
+from utils.nielsen_utils import scan_nielsen_sheet, NIELSEN_COLUMNS
+from utils.nielsen_utils import serve_latest_benchmark, serve_latest_benchmark_name, latest_benchmark
 from utils.nielsen_utils import verify_benchmark_date_range, format_date_range
-from utils.nielsen_utils import process_and_sort_daily_files, zip_eml_files
+from utils.nielsen_utils import process_and_sort_daily_files, pair_daily_uploads, load_daily_pairs, zip_eml_files, cache_nielsen_upload
+from utils.nielsen_utils import read_daily_uploads, report_benchmark_files
 # Nielsen Crud
 from crud import nielsen_crud
 
 router = APIRouter()
 
+# Report generation jobs, see the REPORT JOB ENDPOINTS
+nielsen_job_queue = JobQueue(max_workers=settings.NIELSEN_JOB_WORKERS, max_pending=settings.NIELSEN_JOB_MAX_PENDING,
+                             ttl_seconds=settings.NIELSEN_JOB_TTL_SECONDS)
+# The report config (mappings, subject lines, notes, recipients, dma lists) in memory, the CONFIG ENDPOINTS that
+# write it invalidate it
+nielsen_config_snapshot = NielsenConfigSnapshot(ttl_seconds=settings.NIELSEN_CONFIG_TTL_SECONDS)
+
 ###########  DAILY REPORT ENDPOINTS ##########################
 @router.post("/verify_upload_file", response_model=StandardAPIResponse)
-def verify_upload_file(file: UploadFile = File(...)):
+def verify_upload_file(file: UploadFile = File(...), background_tasks: BackgroundTasks = BackgroundTasks(),
+                       upload_store: UploadStore = Depends(get_upload_store)):
     """
     Verify the upload file.
+
+    A valid file gets an upload id (the sha256 of its bytes), its sheet is parsed in the background and kept so
+    generate_nielsen_report can take the id instead of reading the file again.
     """
     print("Verifying: ", file.filename)
     # Verify the file is a valid CSV file
@@ -41,39 +61,44 @@ def verify_upload_file(file: UploadFile = File(...)):
     if file.size == 0:
         return StandardAPIResponse(success=False, message="File is empty. Please upload a valid file.", data=None, metadata=None)
 
-    # Read the excel file
+    # Scan the excel file, only the header and the Dates and Time columns are read.
+    # A second date already fails the file, so the scan can stop there
     try: 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            df = pd.read_excel(file.file, sheet_name='Live+Same Day, TV Households',header = 8,skipfooter=8).ffill()
+            scan = scan_nielsen_sheet(file.file, max_dates=2)
             # Verify the columns are correct
-            if not verify_columns(df, 
-                                  ['Affil.', 'Daypart', 'Custom Range', 'Time', 'Viewing Source', 'Demo',
-                                  'Dates', 'Geography / Metrics', 'RTG % (X.X)', 'Indicator ']):
+            if not verify_columns(scan.columns, NIELSEN_COLUMNS):
                raise Exception(f"Columns in file do not match expected Nielsen column names. "
-                               f"Columns in file: {df.columns.tolist()}, "
-                               f"Expected columns: ['Affil.', 'Daypart', 'Custom Range', 'Time', 'Viewing Source', 'Demo', "
-                               f"'Dates', 'Geography / Metrics', 'RTG % (X.X)', 'Indicator ']")
+                               f"Columns in file: {scan.columns}, "
+                               f"Expected columns: {NIELSEN_COLUMNS}")
             
             # Verify the date range is valid, if so grab the date
-            if not verify_date_range(df): 
+            if not verify_date_range(scan): 
                 raise Exception(f"Could not identiify file because date range is greater than 1."
-                               f"Date range in file: {df['Dates'].unique().tolist()}, ")
+                               f"Date range in file: {scan.dates}, ")
             
             # Verify there is no dash in the date
-            if not verify_no_dash_in_date(df): 
+            if not verify_no_dash_in_date(scan): 
                 raise Exception(f"Looks like there is a dash in one of your dates. Please remove the dash and try again."
-                               f"Date range in file: {df['Dates'].unique().tolist()}, ")
+                               f"Date range in file: {scan.dates}, ")
 
             # If all these checks pass, we can identify the file with the date and type (15min or dayparts)
-            date = df['Dates'].unique().tolist()[0]
-            nielsen_file_type = identify_nielsen_file(df)
+            date = scan.dates[0]
+            nielsen_file_type = identify_nielsen_file(scan)
     except Exception as e:
         print(e)
         return StandardAPIResponse(success=False, message=f"Error verifying the file: {e}", data=None, metadata=None)
     
     
-    return StandardAPIResponse(success=True, message=f"{nielsen_file_type} - {date}", data=None, metadata=None)
+    file.file.seek(0)
+    content = file.file.read()
+    upload_id = upload_id_for(content)
+    background_tasks.add_task(cache_nielsen_upload, upload_store, upload_id, content,
+                              {"file_type": nielsen_file_type, "date": date, "filename": file.filename})
+    
+    return StandardAPIResponse(success=True, message=f"{nielsen_file_type} - {date}",
+                               data={"upload_id": upload_id, "file_type": nielsen_file_type, "date": date}, metadata=None)
 
 
 @router.post("/test_eml_download")
@@ -93,40 +118,39 @@ def generate_nielsen_report(
     toEmail: str = Form(...),
     uploadToDb: bool = Form(...),
     autoDownload: bool = Form(...),
-    file0: UploadFile = File(...),
-    file1: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    file0: Optional[UploadFile] = File(None),
+    file1: Optional[UploadFile] = File(None),
+    uploadId0: Optional[str] = Form(None),
+    uploadId1: Optional[str] = Form(None),
+    benchmarkSource: str = Form("upload"),
+    background_tasks: BackgroundTasks = BackgroundTasks(),
+    benchmark_storage: ObjectStorage = Depends(get_benchmark_storage),
+    upload_store: UploadStore = Depends(get_upload_store)
 ):
     """
     Generate a set of nielsen reports for a single date.
+
+    Each daily file is given as the file itself, the upload id verify_upload_file returned for it, or both
+    (the file is only read if the id has expired).
+    benchmarkSource is "upload" (the uploaded benchmark files) or "history" (the previous month's average of the
+    daily data saved with uploadToDb, falling back to the uploaded files when too few days are stored).
     """
     print(toEmail)
     print(uploadToDb)
-    print(file0.filename)
-    print(file1.filename)
+    print(file0.filename if file0 is not None else uploadId0)
+    print(file1.filename if file1 is not None else uploadId1)
 
-    daily_dayparts_content, daily_15min_content = process_and_sort_daily_files(file0, file1)
+    # The latest benchmark files (local or s3), their cleaned frames are cached in the benchmark storage
+    benchmark_15min_info, benchmark_daypart_info = report_benchmark_files(benchmark_storage, benchmarkSource)
 
-
-    # We should also read the contents of the benchmark file into memory
-    # Eventually we will read these from s3, for now they are on the server
-    # Read the contents of the benchmark files into memory
-    benchmark_15min_name = serve_latest_benchmark_name("Benchmark-15min")
-    benchmark_daypart_name = serve_latest_benchmark_name("Benchmark-Dayparts")
-
-    benchmark_15min_path = os.path.join("resources/nielsen/dailyBenchmark", benchmark_15min_name['filename'])
-    benchmark_daypart_path = os.path.join("resources/nielsen/dailyBenchmark", benchmark_daypart_name['filename'])
-
-    with open(benchmark_15min_path, "rb") as f:
-        benchmark_15min_content = f.read()
-    
-    with open(benchmark_daypart_path, "rb") as f:
-        benchmark_daypart_content = f.read()
+    daily_dayparts_df, daily_15min_df = process_and_sort_daily_files(
+        upload_store, read_daily_uploads([(uploadId0, file0), (uploadId1, file1)]))
 
     # Now we pass the data to the nielsen daily report function
     eml_file_paths = generate_nielsen_daily_report(db, toEmail, 
-                                  benchmark_15min_content, benchmark_daypart_content, 
-                                  daily_15min_content, daily_dayparts_content)
+                                  benchmark_storage, benchmark_15min_info, benchmark_daypart_info, 
+                                  daily_15min_df, daily_dayparts_df, upload_to_db=uploadToDb,
+                                  benchmark_source=benchmarkSource, report_config=nielsen_config_snapshot.get(db))
     
     # TWO distinct outcomes, if autodownload is true, we return two file responses 
     if autoDownload:
@@ -142,6 +166,130 @@ def generate_nielsen_report(
     # IF autodownload is false we return a success message and the eml file paths
     return StandardAPIResponse(success=True, message=f"EML files created", data=eml_file_paths, metadata=None)
 
+### REPORT JOB ENDPOINTS ##########################
+# The same report as generate_nielsen_report, run by the job queue: submitting returns a job id straight away,
+# the client follows the job (polling or server-sent events) and downloads the zipped emls when it's done.
+def run_nielsen_report_job(progress, daily_pairs, to_email, upload_to_db, benchmark_source,
+                           benchmark_15min_info, benchmark_daypart_info, benchmark_storage, upload_store):
+    """
+    The report generation job (one date, or several for a batch), the result is the eml file paths and the zip of them.
+    """
+    # The request's session is closed by now, the job has its own
+    with contextmanager(get_db)() as db:
+        progress('loading_files')
+        daily_files = load_daily_pairs(upload_store, daily_pairs)
+        eml_file_paths = generate_nielsen_daily_reports(db, to_email,
+                                      benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                                      daily_files, upload_to_db=upload_to_db,
+                                      benchmark_source=benchmark_source, progress=progress, workspace=progress.job_id,
+                                      report_config=nielsen_config_snapshot.get(db))
+    progress('zipping')
+    return {"eml_file_paths": eml_file_paths, "zip_path": zip_eml_files(eml_file_paths)}
+
+def _remove_report_job_files(job, to_email):
+    if job.result is not None and os.path.exists(job.result["zip_path"]):
+        os.unlink(job.result["zip_path"])
+    remove_report_directories(to_email, job.id)
+
+def _get_job(job_id: str):
+    job = nielsen_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found (or expired)")
+    return job
+
+@router.post("/generate_nielsen_report_job", status_code=202)
+def generate_nielsen_report_job(
+    toEmail: str = Form(...),
+    uploadToDb: bool = Form(...),
+    file0: Optional[UploadFile] = File(None),
+    file1: Optional[UploadFile] = File(None),
+    uploadId0: Optional[str] = Form(None),
+    uploadId1: Optional[str] = Form(None),
+    benchmarkSource: str = Form("upload"),
+    benchmark_storage: ObjectStorage = Depends(get_benchmark_storage),
+    upload_store: UploadStore = Depends(get_upload_store)
+):
+    """
+    Queue the generation of a set of nielsen reports (same form as generate_nielsen_report), returns the job id.
+    Follow it with /nielsen_report_jobs/{job_id} (status) or /nielsen_report_jobs/{job_id}/events (server-sent
+    events per stage and per DMA), then download the zipped emls from /nielsen_report_jobs/{job_id}/download.
+    """
+    # Checked here so a bad request fails now rather than in the job, the files are only readable during the request
+    benchmark_15min_info, benchmark_daypart_info = report_benchmark_files(benchmark_storage, benchmarkSource)
+    daily_pairs = pair_daily_uploads(upload_store, read_daily_uploads([(uploadId0, file0), (uploadId1, file1)]))
+
+    try:
+        job = nielsen_job_queue.submit("nielsen_report", run_nielsen_report_job, daily_pairs, toEmail, uploadToDb,
+                                       benchmarkSource, benchmark_15min_info, benchmark_daypart_info,
+                                       benchmark_storage, upload_store,
+                                       on_expire=lambda job: _remove_report_job_files(job, toEmail))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StandardAPIResponse(success=True, message="Report job queued", data=job.to_dict(), metadata=None)
+
+@router.post("/generate_nielsen_report_batch_job", status_code=202)
+def generate_nielsen_report_batch_job(
+    toEmail: str = Form(...),
+    uploadToDb: bool = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    uploadIds: Optional[List[str]] = Form(None),
+    benchmarkSource: str = Form("upload"),
+    benchmark_storage: ObjectStorage = Depends(get_benchmark_storage),
+    upload_store: UploadStore = Depends(get_upload_store)
+):
+    """
+    Queue the generation of the reports of several dates in one job (eg. the days after a holiday), returns the job id.
+    Every date needs its 15-minute and dayparts file, as files and/or upload ids (verify_upload_file) in any order.
+    The mappings, report details and benchmarks are read once for all dates. Followed and downloaded like a
+    generate_nielsen_report_job job, the zip has the emls of every date.
+    """
+    benchmark_15min_info, benchmark_daypart_info = report_benchmark_files(benchmark_storage, benchmarkSource)
+    # Paired now so missing, duplicate or expired files are a 400/410 rather than a failed job
+    daily_pairs = pair_daily_uploads(upload_store, [(upload_id, None, None) for upload_id in uploadIds or []] +
+                                     read_daily_uploads([(None, file) for file in files or []]))
+
+    try:
+        job = nielsen_job_queue.submit("nielsen_report_batch", run_nielsen_report_job, daily_pairs, toEmail, uploadToDb,
+                                       benchmarkSource, benchmark_15min_info, benchmark_daypart_info,
+                                       benchmark_storage, upload_store,
+                                       on_expire=lambda job: _remove_report_job_files(job, toEmail))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StandardAPIResponse(success=True, message="Batch report job queued", data=job.to_dict(), metadata=None)
+
+@router.get("/nielsen_report_jobs/{job_id}")
+def get_nielsen_report_job(job_id: str):
+    """
+    Status of a report job, with the eml file paths once it has succeeded.
+    """
+    job = _get_job(job_id)
+    data = job.to_dict()
+    if job.status == JOB_SUCCEEDED:
+        data["eml_file_paths"] = job.result["eml_file_paths"]
+    return StandardAPIResponse(success=True, message=f"Job {job.status}", data=data, metadata=None)
+
+@router.get("/nielsen_report_jobs/{job_id}/events")
+def get_nielsen_report_job_events(job_id: str, after: int = Query(0, ge=0),
+                                  last_event_id: Optional[int] = Header(None)):
+    """
+    The job's progress as server-sent events (status changes, stages, each DMA's images) until it finishes.
+    A reconnecting EventSource resumes after its Last-Event-ID.
+    """
+    _get_job(job_id)
+    return StreamingResponse(nielsen_job_queue.iter_sse(job_id, after=last_event_id or after),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/nielsen_report_jobs/{job_id}/download")
+def download_nielsen_report_job(job_id: str):
+    """
+    The zipped emls of a finished report job.
+    """
+    job = _get_job(job_id)
+    if job.status != JOB_SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}" + (f": {job.error}" if job.error else ""))
+    return FileResponse(job.result["zip_path"], filename="nielsen_reports.zip")
+
 @router.post("/download_daily_eml_report")
 def download_daily_eml_report(
     data: NielsenEMLDownloadSchema,
@@ -163,35 +311,35 @@ def download_daily_eml_report(
 ##### CONFIG ENDPOINTS #######################
 #### BENCHMARK ENDPOINTS #######################
 @router.get("/download_benchmark_15min")
-def download_benchmark_15min():
+def download_benchmark_15min(benchmark_storage: ObjectStorage = Depends(get_benchmark_storage)):
     """
     Get the most recent 15-minute benchmark file.
     """
     
     print("Getting 15min benchmark")
-    return serve_latest_benchmark("Benchmark-15min")
+    return serve_latest_benchmark("Benchmark-15min", benchmark_storage)
 
 @router.get("/get_benchmark_15min_name")
-def get_benchmark_15min_name():
+def get_benchmark_15min_name(benchmark_storage: ObjectStorage = Depends(get_benchmark_storage)):
     """
     Get the name of the most recent 15-minute benchmark file.
     """
-    return serve_latest_benchmark_name("Benchmark-15min")
+    return serve_latest_benchmark_name("Benchmark-15min", benchmark_storage)
 
 
 @router.get("/download_benchmark_dayparts")
-def download_benchmark_dayparts():
+def download_benchmark_dayparts(benchmark_storage: ObjectStorage = Depends(get_benchmark_storage)):
     """
     Get the most recent daypart benchmark file.
     """
-    return serve_latest_benchmark("Benchmark-Dayparts")
+    return serve_latest_benchmark("Benchmark-Dayparts", benchmark_storage)
 
 @router.get("/get_benchmark_dayparts_name")
-def get_benchmark_dayparts_name():
+def get_benchmark_dayparts_name(benchmark_storage: ObjectStorage = Depends(get_benchmark_storage)):
     """
     Get the name of the most recent daypart benchmark file.
     """
-    return serve_latest_benchmark_name("Benchmark-Dayparts")
+    return serve_latest_benchmark_name("Benchmark-Dayparts", benchmark_storage)
 
 
 # Verify the benchmark file is valid 
@@ -207,28 +355,26 @@ def verify_benchmark_file(file: UploadFile = File(...)):
     if file.size == 0:
         return StandardAPIResponse(success=False, message="File is empty. Please upload a valid file.", data=None, metadata=None)
 
-    # Read the excel file
+    # Scan the excel file, only the header and the Dates and Time columns are read.
+    # Only the first date matters for benchmarks, the scan stops once it's sure of the file type
     try: 
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            df = pd.read_excel(file.file, sheet_name='Live+Same Day, TV Households',header = 8,skipfooter=8).ffill()
+            scan = scan_nielsen_sheet(file.file, max_dates=1)
             # Verify the columns are correct
-            if not verify_columns(df, 
-                                  ['Affil.', 'Daypart', 'Custom Range', 'Time', 'Viewing Source', 'Demo',
-                                  'Dates', 'Geography / Metrics', 'RTG % (X.X)', 'Indicator ']):
+            if not verify_columns(scan.columns, NIELSEN_COLUMNS):
                raise Exception(f"Columns in file do not match expected Nielsen column names. "
-                               f"Columns in file: {df.columns.tolist()}, "
-                               f"Expected columns: ['Affil.', 'Daypart', 'Custom Range', 'Time', 'Viewing Source', 'Demo', "
-                               f"'Dates', 'Geography / Metrics', 'RTG % (X.X)', 'Indicator ']")
+                               f"Columns in file: {scan.columns}, "
+                               f"Expected columns: {NIELSEN_COLUMNS}")
 
             # Verify the date range is valid, if so grab the date
-            if not verify_benchmark_date_range(df): 
+            if not verify_benchmark_date_range(scan): 
                 raise Exception(f"Benchmark files must contain a range of dates, seperated by a dash."
-                               f"Date range in file: {df['Dates'].unique().tolist()}, ")
+                               f"Date range in file: {scan.dates}, ")
             
             # If all these checks pass, we can identify the file with the date and type (15min or dayparts)
-            date_range = format_date_range(df)
-            nielsen_file_type = identify_nielsen_file(df)
+            date_range = format_date_range(scan)
+            nielsen_file_type = identify_nielsen_file(scan)
     except Exception as e:
         print(e)
         return StandardAPIResponse(success=False, message=f"Error verifying the file: {e}", data=None, metadata=None)
@@ -236,22 +382,28 @@ def verify_benchmark_file(file: UploadFile = File(...)):
     return StandardAPIResponse(success=True, message=f"Benchmark-{nielsen_file_type}-{date_range}", data=None, metadata=None)
 
 @router.post("/update_benchmark_files")
-def update_benchmark_file(files: List[UploadFile] = File(...)):
+def update_benchmark_file(files: List[UploadFile] = File(...), db: Session = Depends(get_db),
+                          benchmark_storage: ObjectStorage = Depends(get_benchmark_storage)):
     """
     Update the benchmark file.
+    The new benchmarks are cleaned and cached here, so report generation doesn't read them again.
     """
-    # Delete all files in the benchmark folder
-    base_path = "resources/nielsen/dailyBenchmark"
-    for file in glob.glob(f"{base_path}/*"):
-        os.remove(file)
+    # Delete all the current benchmark files (and the cached cleaned ones)
+    for stored_file in benchmark_storage.list():
+        benchmark_storage.delete(stored_file.key)
 
-    # Save the new files
+    # Save the new files (streamed from the upload)
     saved_files = []
     for file in files:
-        file_location = os.path.join(base_path, file.filename)
-        with open(file_location, "wb+") as file_object:
-            file_object.write(file.file.read())
+        benchmark_storage.put(os.path.basename(file.filename), file.file)
         saved_files.append(file.filename)
+
+    try:
+        build_benchmark_cache(nielsen_config_snapshot.get(db), benchmark_storage, latest_benchmark("Benchmark-15min", benchmark_storage),
+                              latest_benchmark("Benchmark-Dayparts", benchmark_storage))
+    except Exception as e:
+        # Not fatal, the first report builds it
+        print(f"Building the benchmark cache failed: {e}")
     
     return StandardAPIResponse(success=True, message=f"Benchmark files updated: {', '.join(saved_files)}", data=None, metadata=None)
 
@@ -273,25 +425,12 @@ def get_subject_lines(db: Session = Depends(get_db)):
 def update_subject_lines(data: List[dict], db: Session = Depends(get_db)):
     """
     Update the subject lines in the database.
+    Their recipients, notes and dma lists are rows keyed by the subject line id, there's nothing to create for them.
     """
-    # The first thing we do is update the subject lines 
     nielsen_crud.update_nielsen_subject_lines(db, data)
-
-    # If there are new subject lines, we need to create the recipient tables
+    nielsen_config_snapshot.invalidate()
     print("Subject lines updated")
     print(data)
-    for subject in data:
-        if not nielsen_crud.check_recpiant_table_exists(db, subject['id']):
-            print(f"Creating table for subject line {subject['id']}")
-            nielsen_crud.create_recipient_table(db, subject['id'])
-        if not nielsen_crud.check_report_note_table_exists(db, subject['id']):
-            print(f"Creating table for report notes {subject['id']}")
-            nielsen_crud.create_report_note_table(db, subject['id'])
-        if not nielsen_crud.check_dma_list_table_exists(db, subject['id']):
-            print(f"Creating table for dma list {subject['id']}")
-            nielsen_crud.create_dma_list_table(db, subject['id'])
-
-
 
     return StandardAPIResponse(success=True, message=f"Subject lines updated", data=None, metadata=None)
 
@@ -300,16 +439,9 @@ def update_subject_lines(data: List[dict], db: Session = Depends(get_db)):
 @router.get("/get_email_recipients")
 def get_email_recipients( db: Session = Depends(get_db)):
     """
-    Get the email recipients from the database
+    Get the email recipients of every subject line from the database, {subject_line_id: [emails]}
     """
-    # First we need to return all the tables that exist for subject lines (usually there is two)
-    subject_lines = nielsen_crud.get_nielsen_subject_lines(db)
-    subject_line_ids = [id for id, _ in subject_lines]
-    print(subject_line_ids)
-    # Then we need to get the recipients for each subject line
-    recipients = {}
-    for id in subject_line_ids: 
-        recipients[str(id)] = nielsen_crud.get_email_recipients(id, db) 
+    recipients = {str(id): emails for id, emails in nielsen_crud.get_email_recipients(db).items()}
 
     return StandardAPIResponse(success=True, message=f"Subject lines retrieved", data=recipients, metadata=None)
 
@@ -317,11 +449,12 @@ def get_email_recipients( db: Session = Depends(get_db)):
 def update_email_recipients(data: dict[str, list[str]], db: Session = Depends(get_db)):
     """
     Update the email recipients in the database.
+    A subject line given an empty list keeps its recipients.
     """
-    for subject_line_id, recipients in data.items():
-        print(subject_line_id, recipients)
-        if len(recipients) > 0:
-            nielsen_crud.update_email_recipients(subject_line_id, recipients, db)
+    print(data)
+    nielsen_crud.update_email_recipients(db, {subject_line_id: recipients for subject_line_id, recipients in data.items()
+                                              if len(recipients) > 0})
+    nielsen_config_snapshot.invalidate()
 
     return StandardAPIResponse(success=True, message=f"Email recipients updated", data=None, metadata=None)
 
@@ -329,15 +462,9 @@ def update_email_recipients(data: dict[str, list[str]], db: Session = Depends(ge
 @router.get("/get_report_notes")
 def get_report_notes(db: Session = Depends(get_db)):
     """
-    Get the report notes from the database.
+    Get the report note of every subject line from the database, {subject_line_id: note}
     """
-        # First we need to return all the tables that exist for subject lines (usually there is two)
-    subject_lines = nielsen_crud.get_nielsen_subject_lines(db)
-    subject_line_ids = [id for id, _ in subject_lines]
-    # Then we need to get the report notes for each subject line
-    report_notes = {}
-    for id in subject_line_ids: 
-        report_notes[str(id)] = nielsen_crud.get_report_notes(id, db) 
+    report_notes = {str(id): note for id, note in nielsen_crud.get_report_notes(db).items()}
 
     print(report_notes)
     return StandardAPIResponse(success=True, message=f"Report notes retrieved", data=report_notes, metadata=None)
@@ -345,24 +472,20 @@ def get_report_notes(db: Session = Depends(get_db)):
 @router.post("/update_report_notes")
 def update_report_notes(data: dict[str, str], db: Session = Depends(get_db)):
     """
-    Update the email recipients in the database.
+    Update the report notes in the database.
     """
-    for subject_line_id, note in data.items():
-        print(subject_line_id, note)
-        nielsen_crud.update_report_notes(subject_line_id, note, db)
+    print(data)
+    nielsen_crud.update_report_notes(db, data)
+    nielsen_config_snapshot.invalidate()
 
     return StandardAPIResponse(success=True, message=f"Report notes updated", data=None, metadata=None)
 
 @router.get("/get_dma_list")
 def get_dma_list(db: Session = Depends(get_db)):
     """
-    Get the dma list from the database.
+    Get the dma list of every subject line from the database, {subject_line_id: [dmas]}
     """
-    subject_lines = nielsen_crud.get_nielsen_subject_lines(db)
-    subject_line_ids = [id for id, _ in subject_lines]
-    dma_list = {}
-    for id in subject_line_ids: 
-        dma_list[str(id)] = nielsen_crud.get_dma_list(id, db)   
+    dma_list = {str(id): dmas for id, dmas in nielsen_crud.get_dma_list(db).items()}
 
     return StandardAPIResponse(success=True, message=f"Dma list retrieved", data=dma_list, metadata=None)
 
@@ -381,7 +504,10 @@ def update_dma_name_mapping(data: list[dict], db: Session = Depends(get_db)):
     """
     Update the dma name mapping in the database.
     """
-    nielsen_crud.update_dma_mapping(db, data)
+    try:
+        nielsen_crud.update_dma_mapping(db, data)
+    finally:
+        nielsen_config_snapshot.invalidate()
 
     # Add logic to add the new dma names to the penetration table
 
@@ -0,0 +1,139 @@
+# Benchmark of the Nielsen daily file cleaning (clean_15min_data, clean_daypart_data) on a synthetic national file.
+# Times the vectorized cleaning against the per cell/per row version it replaced and checks they give the same frame.
+#
+# Run from the app directory: python -m benchmarks.nielsen_cleaning [--geographies 210] [--sources 14] [--repeat 3]
+import argparse
+import contextlib
+import importlib
+import io
+import time
+import warnings
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from transformations.nielsen.nielsen_daily_report_funcs import clean_15min_data, clean_daypart_data
+
+CLEAN_15MIN_MODULE = importlib.import_module("transformations.nielsen.nielsen_daily_report_funcs.clean_15min_data")
+CLEAN_DAYPART_MODULE = importlib.import_module("transformations.nielsen.nielsen_daily_report_funcs.clean_daypart_data")
+
+DAYPARTS = ['03:00 am - 02:00 am', '06:00 am - 09:00 am', 'Prime  ', '03:00 am - 03:00 am', ' Late']
+
+
+# The cleaning helpers as they were before they were vectorized, one call per cell/row
+def _old_strip_strings(df):
+    return df.map(lambda x: x.strip() if isinstance(x, str) else x)
+
+def _old_map_values(values, mapping, default=None):
+    if default is None:
+        return values.apply(lambda x: mapping[x])
+    return values.apply(lambda x: mapping[x] if x in mapping else default)
+
+def _old_map_geography(geographies, geomappingDict):
+    return _old_map_values(geographies, geomappingDict, 'DMA not recognized')
+
+def _old_map_order(times, daypartsorderDict):
+    return _old_map_values(times, daypartsorderDict, 99)
+
+def _old_strip_all_whitespace(values):
+    return values.astype(str).str.replace(r'\s+', '', regex=True)
+
+def _old_rename_full_day(times):
+    return times.apply(lambda x: 'Full Day' if x in ['03:00 am - 02:00 am', '03:00 am - 03:00 am'] else x)
+
+
+def old_cleaning():
+    """
+    Patch the old helpers into the cleaning modules, the cleaning functions then run the way they used to.
+    """
+    stack = contextlib.ExitStack()
+    for module in (CLEAN_15MIN_MODULE, CLEAN_DAYPART_MODULE):
+        for name, old in (("strip_strings", _old_strip_strings), ("map_values", _old_map_values),
+                          ("map_geography", _old_map_geography), ("map_order", _old_map_order),
+                          ("strip_all_whitespace", _old_strip_all_whitespace),
+                          ("rename_full_day", _old_rename_full_day)):
+            if hasattr(module, name):
+                stack.enter_context(mock.patch.object(module, name, old))
+    return stack
+
+
+def national_frames(n_geographies: int = 210, n_sources: int = 14, seed: int = 0):
+    """
+    A national 15min sheet and dayparts sheet (as read_nielsen_sheet returns them) and the mappings to clean them.
+    Every geography x viewing source x time, with the stray whitespace, blank ratings and mixed type columns
+    the real files have.
+
+    :return: (15min sheet, dayparts sheet, station mapping, 15min order mapping, dayparts order mapping, geography mapping)
+    """
+    rng = np.random.default_rng(seed)
+    geographies = [f"Market {i}" for i in range(n_geographies - 3)] + ['Dallas-Ft. Worth', 'Milwaukee', 'Greensboro']
+    sources = [f"SRC{i}" for i in range(n_sources - 2)] + ['S1DF', 'S1MK']
+    times = [f"{h:02d}:{m:02d} am - {h:02d}:{m + 14:02d} am" for h in range(1, 13) for m in (0, 15, 30, 45)]
+    times = [f"{t[:8]}{i}" for i, t in enumerate((times * 2)[:76])]
+
+    def sheet(sheet_times):
+        g, s, t = np.meshgrid(np.arange(len(geographies)), np.arange(len(sources)), np.arange(len(sheet_times)),
+                              indexing='ij')
+        n = g.size
+        rtg = rng.random(n).round(1).astype(object)
+        rtg[rng.random(n) < 0.001] = ' '
+        rtg[rng.random(n) < 0.001] = np.nan
+        return pd.DataFrame({
+            'Affil.': np.where(rng.random(n) < .5, np.array(['ABC '], dtype=object), np.array([7], dtype=object)),
+            'Daypart': 'dp',
+            'Custom Range': ' cr',
+            'Time': np.array([x + (' ' if i % 3 == 0 else '') for i, x in enumerate(sheet_times)], dtype=object)[t.ravel()],
+            'Viewing Source': np.array([x + ' ' for x in sources], dtype=object)[s.ravel()],
+            'Demo': 'HH',
+            'Dates': '10/01/2024',
+            'Geography / Metrics': np.array([' ' + x for x in geographies], dtype=object)[g.ravel()],
+            'RTG % (X.X)': rtg,
+            'Indicator ': np.nan,
+        })
+
+    station_mapping = {x: f"Net{i % 9}" for i, x in enumerate(sources)}
+    geography_mapping = {x: f"DMA {x}" for x in geographies[::2]}
+    order_mapping = {t.replace(' ', ''): i for i, t in enumerate(times)}
+    daypart_order_mapping = {'Full Day': 0, '06:00 am - 09:00 am': 1, 'Prime': 2}
+    return (sheet(times), sheet(DAYPARTS), station_mapping, order_mapping, daypart_order_mapping,
+            geography_mapping)
+
+
+def best_time(func, *args, repeat: int = 3):
+    """ The fastest of repeat runs (the cleaning's prints are silenced), and the result. """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the Nielsen cleaning against the version it replaced")
+    parser.add_argument("--geographies", type=int, default=210)
+    parser.add_argument("--sources", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # The cleaning's pandas warnings (chained assignment, downcasting) are the same for both versions
+    warnings.simplefilter("ignore")
+
+    min15df, daypartsdf, station_mapping, order_mapping, daypart_order_mapping, geography_mapping = \
+        national_frames(args.geographies, args.sources)
+    print(f"15min sheet: {len(min15df)} rows, dayparts sheet: {len(daypartsdf)} rows")
+
+    for name, clean, sheet, order in (("clean_15min_data", clean_15min_data, min15df, order_mapping),
+                                      ("clean_daypart_data", clean_daypart_data, daypartsdf, daypart_order_mapping)):
+        cleaning_args = (sheet, station_mapping, order, geography_mapping)
+        with old_cleaning():
+            old_result, old_seconds = best_time(clean, *cleaning_args, repeat=args.repeat)
+        new_result, new_seconds = best_time(clean, *cleaning_args, repeat=args.repeat)
+        pd.testing.assert_frame_equal(old_result, new_result, check_exact=True)
+        print(f"{name}: old {old_seconds:.3f}s, new {new_seconds:.3f}s ({old_seconds / new_seconds:.1f}x), "
+              f"identical output")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,63 @@ class Settings(BaseSettings):
     PROJECT_NAME: str = "SN Analytics APP API"
     BACKEND_CORS_ORIGINS: list[str] = ["http://localhost:8000"] # for local development only, change to frontend
 
+    # Response compression, bodies under the minimum size aren't worth the cpu
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6 # 1-9
+    COMPRESSION_BROTLI_QUALITY: int = 4 # 0-11, above ~5 gets expensive for dynamic responses
+    COMPRESSION_BROTLI_ENABLED: bool = True
+    # Media type prefixes that are already compressed (or shouldn't be buffered) and are sent as is
+    COMPRESSION_EXCLUDED_MEDIA_TYPES: list[str] = [
+        "application/zip", "application/gzip", "application/x-gzip", "application/octet-stream",
+        "application/vnd.openxmlformats", "application/vnd.apache.parquet", "image/", "video/", "audio/", "text/event-stream",
+    ]
+
+    # Identical concurrent requests to the engagement endpoints share one computation
+    COALESCING_ENABLED: bool = True
+
+    # Background warm-up of the default engagement views, re-run when the data version changes
+    WARMUP_ENABLED: bool = True
+    WARMUP_POLL_SECONDS: int = 300
+    # The warmed views are recomputed at least this often, even if the data version didn't change
+    WARMUP_VIEW_TTL_SECONDS: int = 3600
+    WARMUP_RANK_MONTHS_BACK: int = 7
+    WARMUP_OVER_TIME_MONTHS_BACK: int = 24
+
+    # Where files live, "s3" or "local" per set of files. Local paths are relative to the app directory
+    COVERAGE_STORAGE_BACKEND: str = "s3"
+    COVERAGE_LOCAL_PATH: str = "resources/coverage"
+    BENCHMARK_STORAGE_BACKEND: str = "local"
+    BENCHMARK_LOCAL_PATH: str = "resources/nielsen/dailyBenchmark"
+    BENCHMARK_BUCKET: str = ""
+    BENCHMARK_PREFIX: str = "dailyBenchmark/"
+
+    # Parsed Nielsen uploads, kept between verification and report generation (local directory)
+    UPLOAD_CACHE_PATH: str = "resources/nielsen/uploadCache"
+    UPLOAD_CACHE_TTL_SECONDS: int = 6 * 3600
+
+    # Background jobs (Nielsen report generation): worker threads, jobs allowed to wait, how long finished jobs are kept
+    NIELSEN_JOB_WORKERS: int = 2
+    NIELSEN_JOB_MAX_PENDING: int = 10
+    NIELSEN_JOB_TTL_SECONDS: int = 6 * 3600
+
+    # Nielsen report config (mappings, subject lines...) kept in memory, reloaded after the update endpoints write
+    # and at least every ttl (other worker processes' writes)
+    NIELSEN_CONFIG_TTL_SECONDS: int = 300
+    # Create the subject line config tables on startup, moving the old per subject line tables into them
+    NIELSEN_CONFIG_MIGRATE_ON_STARTUP: bool = True
+
+    # Coverage map source data, cached in process and revalidated against storage (ETag) once the ttl is up
+    COVERAGE_BUCKET: str = "coveragemapdata"
+    COVERAGE_SNZIPS_KEY: str = "SNzips_no_sub_data.geoJSON"
+    COVERAGE_CACHE_TTL_SECONDS: int = 300
+    # Coverage map tiles up to this zoom are pre-cut when the geojson changes and kept in a local directory
+    COVERAGE_TILE_PRECUT_MAX_ZOOM: int = 8
+    COVERAGE_TILE_CACHE_PATH: str = "resources/coverage/tiles"
+    # An older version's stored tiles are deleted once nothing has written them for this long (a few cache ttls)
+    COVERAGE_TILE_STALE_SECONDS: int = 900
+    # Feature property of the coverage geojson that holds the zip code (matched case insensitively)
+    COVERAGE_ZIP_PROPERTY: str = "zip"
+
     model_config = SettingsConfigDict(env_file=".env")
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
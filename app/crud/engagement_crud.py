@@ -2,7 +2,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 import pandas as pd
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Iterator, Optional, List
 import time
 
 def timeit(func):
@@ -80,31 +80,20 @@ def get_engagement_data_one_month(db: Session, month: int, year: int) -> pd.Data
  
 
 
-# Main Engagement Query
-@timeit
-def get_engagement_data(
-    db: Session,
-    start_month: str,
-    end_month: str,
-    networks: Optional[List[str]] = None,
-    include_false_tier: bool = False
-) -> pd.DataFrame:
+def _engagement_data_query(networks: Optional[List[str]] = None, include_false_tier: bool = False) -> str:
     """
-    Fetch engagement data from the database based on specified parameters.
+    Build the engagement data query shared by get_engagement_data and iter_engagement_data.
 
-    :param db: Database session
-    :param start_month: Start date in 'YYYY-MM' format
-    :param end_month: End date in 'YYYY-MM' format
     :param networks: List of networks to include (default is ['Big 4', 'Cable News', 'SN'])
     :param include_false_tier: Whether to include 'FALSE' tier data
-    :return: DataFrame with engagement data
+    :return: The query, with :start_month and :end_month bind parameters
     """
     networks = networks or ['Big 4', 'Cable News', 'SN']
     networks_str = ', '.join(f"'{network}'" for network in networks)
 
     tier_condition = "" if include_false_tier else "AND e.tiername != 'FALSE'"
 
-    query = f"""
+    return f"""
     SELECT
         e.year,
         e.month,
@@ -129,6 +118,49 @@ def get_engagement_data(
     ORDER BY e.year, e.month, e.network, e.specnewsmarket
     """
 
+
+# Data version, changes whenever engagement or periodicity data is loaded
+def get_engagement_data_version(db: Session) -> str:
+    """
+    Get a fingerprint of the engagement and periodicity tables: their insert, update and delete counters from
+    pg_stat_user_tables. Any load changes them, a restatement with the same row count too, and reading them doesn't
+    scan the tables. Used to tell when new data has been loaded and the cached views are stale.
+
+    The counters are kept per server (a stats reset changes the version, a read replica doesn't see the primary's
+    writes), the view cache's ttl is the backstop for that.
+    """
+    result = db.execute(
+        text(
+            "SELECT relname, n_tup_ins, n_tup_upd, n_tup_del "
+            "FROM pg_stat_user_tables "
+            "WHERE schemaname = 'main' AND relname IN ('engagement_raw', 'periodicity') "
+            "ORDER BY relname"
+        )
+    )
+    return ";".join(":".join(str(value) for value in row) for row in result.fetchall())
+
+
+# Main Engagement Query
+@timeit
+def get_engagement_data(
+    db: Session,
+    start_month: str,
+    end_month: str,
+    networks: Optional[List[str]] = None,
+    include_false_tier: bool = False
+) -> pd.DataFrame:
+    """
+    Fetch engagement data from the database based on specified parameters.
+
+    :param db: Database session
+    :param start_month: Start date in 'YYYY-MM' format
+    :param end_month: End date in 'YYYY-MM' format
+    :param networks: List of networks to include (default is ['Big 4', 'Cable News', 'SN'])
+    :param include_false_tier: Whether to include 'FALSE' tier data
+    :return: DataFrame with engagement data
+    """
+    query = _engagement_data_query(networks, include_false_tier)
+
     df = pd.read_sql_query(
         text(query),
         db.connection(),
@@ -138,6 +170,63 @@ def get_engagement_data(
     return df
 
 
+def get_engagement_data_description(
+    db: Session,
+    networks: Optional[List[str]] = None,
+    include_false_tier: bool = False
+):
+    """
+    Get the column names and types of the engagement data query (its cursor.description), without reading any rows.
+    Used to build the export schema before the rows are streamed.
+
+    :param db: Database session
+    :param networks: List of networks to include (default is ['Big 4', 'Cable News', 'SN'])
+    :param include_false_tier: Whether to include 'FALSE' tier data
+    :return: Sequence of (name, type_code, ...) column descriptions
+    """
+    query = _engagement_data_query(networks, include_false_tier)
+
+    result = db.execute(
+        text(f"SELECT * FROM ({query}) q LIMIT 0"),
+        {"start_month": "", "end_month": ""}
+    )
+    description = result.cursor.description
+    result.close()
+    return description
+
+
+def iter_engagement_data(
+    db: Session,
+    start_month: str,
+    end_month: str,
+    networks: Optional[List[str]] = None,
+    include_false_tier: bool = False,
+    chunksize: int = 50000
+) -> Iterator[pd.DataFrame]:
+    """
+    Same as get_engagement_data, but yields the rows chunksize at a time from a server side cursor.
+    Used by the exports, so a multi-year range is never held in memory all at once.
+
+    :param db: Database session
+    :param start_month: Start date in 'YYYY-MM' format
+    :param end_month: End date in 'YYYY-MM' format
+    :param networks: List of networks to include (default is ['Big 4', 'Cable News', 'SN'])
+    :param include_false_tier: Whether to include 'FALSE' tier data
+    :param chunksize: Number of rows per DataFrame
+    :return: Iterator of DataFrames with engagement data
+    """
+    query = _engagement_data_query(networks, include_false_tier)
+
+    # stream_results makes psycopg2 use a named (server side) cursor instead of fetching the whole result
+    connection = db.connection(execution_options={"stream_results": True, "max_row_buffer": chunksize})
+    yield from pd.read_sql_query(
+        text(query),
+        connection,
+        params={"start_month": start_month, "end_month": end_month},
+        chunksize=chunksize
+    )
+
+
 # Periodicity Query
 def get_periodicity_data(
     db: Session,
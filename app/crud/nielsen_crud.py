@@ -1,157 +1,182 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from datetime import date, timedelta
+import io
 import pandas as pd
 
 # Subject Lines
 def get_nielsen_subject_lines(db: Session):
     """
-    Get the subject lines from the Nielsen table.
+    Get the subject lines from the Nielsen table, in id order.
     """
     result = db.execute(
-        text("SELECT * FROM nielsen_report_config.email_subject_lines;")
+        text("SELECT id, subject FROM nielsen_report_config.email_subject_lines ORDER BY id;")
     )
     return result.fetchall()
 
 def update_nielsen_subject_lines(db: Session, subject_lines: list):
     """
-    Update the subject lines in the Nielsen table.
+    Update the subject lines in the Nielsen table (list of {"id", "subject"}), in one statement.
     """
     db.execute(
-        text("UPDATE nielsen_report_config.email_subject_lines SET subject = :subject WHERE id = :id"),
-        subject_lines
+        text("""
+            UPDATE nielsen_report_config.email_subject_lines AS subject_lines SET subject = updated.subject
+            FROM unnest(CAST(:ids AS integer[]), CAST(:subjects AS text[])) AS updated (id, subject)
+            WHERE subject_lines.id = updated.id
+        """),
+        {"ids": [int(subject_line["id"]) for subject_line in subject_lines],
+         "subjects": [subject_line["subject"] for subject_line in subject_lines]}
     )
     db.commit()
 
-# Recipiants 
-def check_recpiant_table_exists(db: Session, subject_line_id: int):
+# Recipients, report notes and dma lists, one row per subject line (and recipient / dma).
+# They used to be a table per subject line (email_recipients_{id}, report_notes_{id}, dma_list_{id}), see
+# migrate_nielsen_report_config. position keeps the order the lists were saved in (the emails list the dmas in it)
+NIELSEN_REPORT_CONFIG_TABLES = {
+    "subject_line_recipients": """
+        subject_line_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        email VARCHAR(255) NOT NULL,
+        PRIMARY KEY (subject_line_id, email)
+    """,
+    "subject_line_notes": """
+        subject_line_id INTEGER PRIMARY KEY,
+        note TEXT NOT NULL
+    """,
+    "subject_line_dmas": """
+        subject_line_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        dma VARCHAR(255) NOT NULL,
+        PRIMARY KEY (subject_line_id, position)
+    """,
+}
+
+# The per subject line tables, moved to the tables above: (table prefix, new table, value column)
+_LEGACY_REPORT_CONFIG_TABLES = [
+    ("email_recipients", "subject_line_recipients", "email"),
+    ("report_notes", "subject_line_notes", "note"),
+    ("dma_list", "subject_line_dmas", "dma"),
+]
+
+def migrate_nielsen_report_config(db: Session) -> int:
+    """
+    Create the subject line tables and move the data of the per subject line tables into them, in one transaction.
+    The old tables are kept, renamed to legacy_{name}, so running it again does nothing.
+    Returns the number of tables moved.
     """
-    Check if the recipient table exists. These tables are created dynamically based on the subject line id.
-    """
-    query = text("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
+    try:
+        # Another worker starting at the same time waits, then finds nothing left to move
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext('nielsen_report_config.migrate'))"))
+        for table, columns in NIELSEN_REPORT_CONFIG_TABLES.items():
+            db.execute(text(f"CREATE TABLE IF NOT EXISTS nielsen_report_config.{table} ({columns})"))
+
+        legacy_tables = db.execute(text("""
+            SELECT table_name FROM information_schema.tables
             WHERE table_schema = 'nielsen_report_config'
-            AND table_name = :table_name
-        )
-    """)
-    result = db.execute(query, {"table_name": f"email_recipients_{subject_line_id}"})
-    exists = result.scalar()
-    result.close()
-    return exists
+            AND table_name ~ '^(email_recipients|report_notes|dma_list)_[0-9]+$'
+            ORDER BY table_name
+        """)).scalars().all()
+        for legacy_table in legacy_tables:
+            prefix, subject_line_id = legacy_table.rsplit("_", 1)
+            _, new_table, column = next(legacy for legacy in _LEGACY_REPORT_CONFIG_TABLES if legacy[0] == prefix)
+            if new_table == "subject_line_notes":
+                # One note per subject line, the reports used the first row
+                insert = (f"(subject_line_id, note) SELECT {int(subject_line_id)}, note "
+                          f"FROM nielsen_report_config.{legacy_table} WHERE note IS NOT NULL LIMIT 1")
+            else:
+                # row_number() over the table as it's scanned, the order the reports read the list in
+                insert = (f"(subject_line_id, position, {column}) SELECT {int(subject_line_id)}, row_number() OVER (), {column} "
+                          f"FROM nielsen_report_config.{legacy_table} WHERE {column} IS NOT NULL")
+            db.execute(text(f"INSERT INTO nielsen_report_config.{new_table} {insert} ON CONFLICT DO NOTHING"))
+            db.execute(text(f"ALTER TABLE nielsen_report_config.{legacy_table} RENAME TO legacy_{legacy_table}"))
+            print(f"Moved nielsen_report_config.{legacy_table} to {new_table}")
+        db.commit()
+        return len(legacy_tables)
+    except Exception:
+        db.rollback()
+        raise
 
-def create_recipient_table(db: Session, subject_line_id: int):
+def _get_subject_line_lists(db: Session, table: str, column: str) -> dict:
     """
-    Create the recipient table. Created dynamically based on the subject line id.
+    {subject_line_id: [values in position order]} of every subject line (an empty list when it has none).
     """
-    db.execute(text(f"CREATE TABLE nielsen_report_config.email_recipients_{subject_line_id} (email VARCHAR(255) PRIMARY KEY)"))
-    print(f"Created table: nielsen_report_config.email_recipients_{subject_line_id}")
-    db.commit()
-
+    result = db.execute(text(f"""
+        SELECT subject_lines.id,
+               COALESCE(array_agg(lists.{column} ORDER BY lists.position) FILTER (WHERE lists.{column} IS NOT NULL),
+                        '{{}}') AS {column}s
+        FROM nielsen_report_config.email_subject_lines AS subject_lines
+        LEFT JOIN nielsen_report_config.{table} AS lists ON lists.subject_line_id = subject_lines.id
+        GROUP BY subject_lines.id
+        ORDER BY subject_lines.id
+    """))
+    return {subject_line_id: list(values) for subject_line_id, values in result}
 
-def get_email_recipients(subject_line_id: int, db: Session):
+def _replace_subject_line_lists(db: Session, table: str, column: str, lists: dict):
     """
-    Get all email recipients.
+    Replace the lists of the subject lines in lists ({subject_line_id: [values]}), the others are left as they are.
     """
-    result = db.execute(
-        text(f"SELECT * FROM nielsen_report_config.email_recipients_{subject_line_id};")
-    )
-    recipients = [row[0] for row in result]  # Convert Row objects to a list of email strings
-    result.close()
-    return recipients
+    ids, positions, values = [], [], []
+    for subject_line_id, subject_line_values in lists.items():
+        for position, value in enumerate(subject_line_values, 1):
+            ids.append(int(subject_line_id))
+            positions.append(position)
+            values.append(value)
+    db.execute(text(f"DELETE FROM nielsen_report_config.{table} WHERE subject_line_id = ANY(CAST(:ids AS integer[]))"),
+               {"ids": [int(subject_line_id) for subject_line_id in lists]})
+    db.execute(text(f"""
+        INSERT INTO nielsen_report_config.{table} (subject_line_id, position, {column})
+        SELECT * FROM unnest(CAST(:ids AS integer[]), CAST(:positions AS integer[]), CAST(:values AS text[]))
+        ON CONFLICT DO NOTHING
+    """), {"ids": ids, "positions": positions, "values": values})
 
-def update_email_recipients(subject_line_id: int, recipients: list, db: Session):
+# Recipients
+def get_email_recipients(db: Session) -> dict:
     """
-    Update the email recipients in the database.
+    Get the email recipients of every subject line, {subject_line_id: [emails]}.
     """
-    db.execute(text(f"DELETE FROM nielsen_report_config.email_recipients_{subject_line_id};"))
-    
-    # Convert recipients to a list of dictionaries
-    recipients_dicts = [{"email": email} for email in recipients]
-    
-    db.execute(
-        text(f"INSERT INTO nielsen_report_config.email_recipients_{subject_line_id} (email) VALUES (:email)"),
-        recipients_dicts
-    )
-    db.commit()
+    return _get_subject_line_lists(db, "subject_line_recipients", "email")
 
-
-# Report Notes
-def check_report_note_table_exists(db: Session, subject_line_id: int):
-    """
-    Check if the report note table exists.
+def update_email_recipients(db: Session, recipients: dict):
     """
-    query = text("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
-            WHERE table_schema = 'nielsen_report_config'
-            AND table_name = :table_name
-        )
-    """)
-    result = db.execute(query, {"table_name": f"report_notes_{subject_line_id}"})
-    exists = result.scalar()
-    result.close()
-    return exists
-
-def create_report_note_table(db: Session, subject_line_id: int):
+    Replace the email recipients of the given subject lines ({subject_line_id: [emails]}), in one transaction.
     """
-    Create the report note table.
-    """ 
-    db.execute(text(f"CREATE TABLE nielsen_report_config.report_notes_{subject_line_id} (note VARCHAR(255))"))
-    print(f"Created table: nielsen_report_config.report_notes_{subject_line_id}")
-    db.commit()
+    try:
+        _replace_subject_line_lists(db, "subject_line_recipients", "email", recipients)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
-def get_report_notes(subject_line_id: int, db: Session):
+# Report Notes
+def get_report_notes(db: Session) -> dict:
     """
-    Get the report note from the database.
+    Get the report note of every subject line, {subject_line_id: note} ("" when it has none).
     """
-    result = db.execute(text(f"SELECT * FROM nielsen_report_config.report_notes_{subject_line_id};"))
-    note = result.scalar()  # Get the first column of the first row
-    result.close()
-    return note if note else ""  # Return an empty string if no note is found
+    result = db.execute(text("""
+        SELECT subject_lines.id, COALESCE(notes.note, '')
+        FROM nielsen_report_config.email_subject_lines AS subject_lines
+        LEFT JOIN nielsen_report_config.subject_line_notes AS notes ON notes.subject_line_id = subject_lines.id
+        ORDER BY subject_lines.id
+    """))
+    return {subject_line_id: note for subject_line_id, note in result}
 
-def update_report_notes(subject_line_id: int, note: str, db: Session):
+def update_report_notes(db: Session, notes: dict):
     """
-    Update the report note in the database.
+    Set the report notes of the given subject lines ({subject_line_id: note}), in one statement.
     """
-    db.execute(text(f"TRUNCATE TABLE nielsen_report_config.report_notes_{subject_line_id}"))
-    db.execute(text(f"INSERT INTO nielsen_report_config.report_notes_{subject_line_id} (note) VALUES (:note)"), {"note": note})
+    db.execute(text("""
+        INSERT INTO nielsen_report_config.subject_line_notes (subject_line_id, note)
+        SELECT * FROM unnest(CAST(:ids AS integer[]), CAST(:notes AS text[]))
+        ON CONFLICT (subject_line_id) DO UPDATE SET note = EXCLUDED.note
+    """), {"ids": [int(subject_line_id) for subject_line_id in notes], "notes": list(notes.values())})
     db.commit()
 
 # Dma List
-def check_dma_list_table_exists(db: Session, subject_line_id: int):
-    """
-    Check if the dma list table exists.
-    """
-    query = text("""
-        SELECT EXISTS (
-            SELECT FROM information_schema.tables 
-            WHERE table_schema = 'nielsen_report_config'
-            AND table_name = :table_name
-        )
-    """)
-    result = db.execute(query, {"table_name": f"dma_list_{subject_line_id}"})
-    exists = result.scalar()
-    result.close()
-    return exists
-
-def create_dma_list_table(db: Session, subject_line_id: int):
-    """
-    Create the dma list table.
-    """ 
-    db.execute(text(f"CREATE TABLE nielsen_report_config.dma_list_{subject_line_id} (dma VARCHAR(255))"))
-    print(f"Created table: nielsen_report_config.dma_list_{subject_line_id}")
-    db.commit()
-
-def get_dma_list(subject_line_id: int, db: Session):
+def get_dma_list(db: Session) -> dict:
     """
-    Get the dma list from the database.
+    Get the dma list of every subject line, {subject_line_id: [dmas]}.
     """
-    result = db.execute(
-        text(f"SELECT * FROM nielsen_report_config.dma_list_{subject_line_id};")
-    )
-    dma_list = [row[0] for row in result]  # Convert Row objects to a list of dma strings
-    result.close()
-    return dma_list
+    return _get_subject_line_lists(db, "subject_line_dmas", "dma")
 
 ########################################################
 # ADJUSTABLE MAPPINGS
@@ -249,24 +274,253 @@ def get_subject_lines_as_dataframe(db: Session) -> pd.DataFrame:
     result = pd.read_sql("SELECT * FROM nielsen_report_config.email_subject_lines", db.connection())
     return result
 
-def get_report_notes_as_dataframe(db: Session, subject_line_id: str|int) -> pd.DataFrame:
-    """
-    Get the report notes from the database.
-    """
-    result = pd.read_sql(f"SELECT * FROM nielsen_report_config.report_notes_{subject_line_id}", db.connection())
-    return result
+##################
+#### THE WHOLE REPORT CONFIG AT ONCE (see report_config.NielsenConfigSnapshot)
+###################
+# Each mapping as one json object (key column -> value column), the database builds the whole config as one value
+NIELSEN_REPORT_MAPPINGS = {
+    'station_network_mapping': ('nielsen_main.station_network_mapping', 'station_name', 'network'),
+    'spectrum_station_names_mapping': ('nielsen_main.spectrum_station_names', 'station_abbr', 'station_name_full'),
+    'daypart_order_mapping': ('nielsen_main.daypart_order_mapping', 'daypart', 'order_in_report_table'),
+    'fifteen_min_order_mapping': ('nielsen_main.fifteen_minute_order_mapping', 'time_slot', 'order_in_x_axis'),
+    'dma_name_mapping': ('nielsen_report_config.dma_name_mapping', 'nielsen_dma_name', 'sn_dma_name'),
+    'dma_penetration_mapping': ('nielsen_report_config.dma_name_mapping', 'sn_dma_name', 'penetration_percent'),
+}
+
+def get_nielsen_report_config(db: Session) -> dict:
+    """
+    The mappings, subject lines and each subject line's note, recipients and dma list, in one query.
+    The mappings are dicts like the get_*_mapping_dict functions return, the rest are lists in subject line id order.
+    """
+    # json (not jsonb) keeps duplicate keys in table order, the last one wins when parsed like set_index().to_dict()
+    mappings_sql = ",\n".join(
+        f"'{name}', (SELECT json_object_agg({key}, {value}) FROM {table} WHERE {key} IS NOT NULL)"
+        for name, (table, key, value) in NIELSEN_REPORT_MAPPINGS.items())
+    config = db.execute(text(f"""
+        SELECT json_build_object(
+            {mappings_sql},
+            'subject_lines', (
+                SELECT json_agg(json_build_object(
+                    'id', subject_lines.id,
+                    'subject', subject_lines.subject,
+                    'note', COALESCE(notes.note, ''),
+                    'recipients', (SELECT COALESCE(json_agg(email ORDER BY position), '[]')
+                                   FROM nielsen_report_config.subject_line_recipients AS recipients
+                                   WHERE recipients.subject_line_id = subject_lines.id),
+                    'dmas', (SELECT COALESCE(json_agg(dma ORDER BY position), '[]')
+                             FROM nielsen_report_config.subject_line_dmas AS dmas
+                             WHERE dmas.subject_line_id = subject_lines.id)
+                ) ORDER BY subject_lines.id)
+                FROM nielsen_report_config.email_subject_lines AS subject_lines
+                LEFT JOIN nielsen_report_config.subject_line_notes AS notes ON notes.subject_line_id = subject_lines.id
+            )
+        )
+    """)).scalar_one()
+    subject_lines = config.pop('subject_lines') or []
+    report_config = {name: mapping or {} for name, mapping in config.items()}
+    report_config['subject_line_ids'] = [subject_line['id'] for subject_line in subject_lines]
+    report_config['subject_lines'] = [subject_line['subject'] for subject_line in subject_lines]
+    report_config['report_notes'] = [subject_line['note'] for subject_line in subject_lines]
+    report_config['report_recipients'] = [subject_line['recipients'] for subject_line in subject_lines]
+    report_config['report_dma_lists'] = [subject_line['dmas'] for subject_line in subject_lines]
+    return report_config
 
-def get_report_recipients_as_dataframe(db: Session, subject_line_id: str|int) -> pd.DataFrame:
-    """
-    Get the report recipients from the database.
-    """
-    result = pd.read_sql(f"SELECT * FROM nielsen_report_config.email_recipients_{subject_line_id}", db.connection())
-    return result
 
-def get_report_dma_lists_as_dataframe(db: Session, subject_line_id: str|int) -> pd.DataFrame:
+
+##################
+#### DAILY NIELSEN DATA, the cleaned daily ratings of each report
+###################
+# Tables are partitioned by month on data_date, partitions are created as data for the month comes in
+NIELSEN_DAILY_SCHEMA = "nielsen_daily"
+NIELSEN_DAILY_TABLES = {
+    "ratings_15min": ["data_date DATE NOT NULL", "dma VARCHAR(255) NOT NULL", "station VARCHAR(255)",
+                      "viewing_source VARCHAR(64)", "time_interval VARCHAR(64)", "chart_order INTEGER",
+                      "rtg DOUBLE PRECISION"],
+    "ratings_dayparts": ["data_date DATE NOT NULL", "dma VARCHAR(255) NOT NULL", "daypart VARCHAR(64)",
+                         "daypart_order INTEGER", "station VARCHAR(255)", "rtg DOUBLE PRECISION"],
+}
+
+def nielsen_daily_columns(table: str) -> list:
+    """
+    The column names of a daily Nielsen table, in table order.
+    """
+    return [column.split()[0] for column in NIELSEN_DAILY_TABLES[table]]
+
+def create_nielsen_daily_partition(db: Session, table: str, data_date: date):
+    """
+    Create the daily Nielsen table and its partition for data_date's month, if they don't exist. Doesn't commit.
+    """
+    month_start = data_date.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {NIELSEN_DAILY_SCHEMA}"))
+    db.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {NIELSEN_DAILY_SCHEMA}.{table} ({', '.join(NIELSEN_DAILY_TABLES[table])})
+        PARTITION BY RANGE (data_date)
+    """))
+    db.execute(text(f"CREATE INDEX IF NOT EXISTS {table}_date_dma_idx ON {NIELSEN_DAILY_SCHEMA}.{table} (data_date, dma)"))
+    db.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {NIELSEN_DAILY_SCHEMA}.{table}_{month_start:%Y_%m}
+        PARTITION OF {NIELSEN_DAILY_SCHEMA}.{table}
+        FOR VALUES FROM ('{month_start.isoformat()}') TO ('{next_month_start.isoformat()}')
+    """))
+
+# Monthly running sums of the daily ratings, per slot (DMA/source/quarter hour, DMA/daypart/station).
+# Kept up to date as days are loaded, so a month's benchmark (the average per slot) is one read of the month's sums.
+NIELSEN_BENCHMARK_SUMS = {
+    "ratings_15min": {"table": "benchmark_sums_15min", "keys": ["dma", "viewing_source", "time_interval"],
+                      "attributes": ["station", "chart_order"]},
+    "ratings_dayparts": {"table": "benchmark_sums_dayparts", "keys": ["dma", "daypart", "station"],
+                         "attributes": ["daypart_order"]},
+}
+
+def _benchmark_sums_types(table: str) -> dict:
+    return {column.split()[0]: column.split()[1] for column in NIELSEN_DAILY_TABLES[table]}
+
+def create_nielsen_benchmark_sums(db: Session, table: str):
+    """
+    Create the running sums table of a daily Nielsen table if it doesn't exist, filled from the days already stored.
+    Doesn't commit.
+    """
+    sums = NIELSEN_BENCHMARK_SUMS[table]
+    exists = db.execute(text("""
+        SELECT EXISTS (
+            SELECT FROM information_schema.tables
+            WHERE table_schema = :schema
+            AND table_name = :table_name
+        )
+    """), {"schema": NIELSEN_DAILY_SCHEMA, "table_name": sums["table"]}).scalar()
+    if exists:
+        return
+
+    types = _benchmark_sums_types(table)
+    slot_columns = sums["keys"] + sums["attributes"]
+    db.execute(text(f"""
+        CREATE TABLE {NIELSEN_DAILY_SCHEMA}.{sums['table']} (
+            month DATE NOT NULL,
+            {', '.join(f'{column} {types[column]}' for column in slot_columns)},
+            rtg_sum DOUBLE PRECISION NOT NULL,
+            day_count INTEGER NOT NULL,
+            PRIMARY KEY (month, {', '.join(sums['keys'])})
+        )
+    """))
+    # Same per day rtg as _update_benchmark_sums, summed over the month's days
+    db.execute(text(f"""
+        INSERT INTO {NIELSEN_DAILY_SCHEMA}.{sums['table']} (month, {', '.join(slot_columns)}, rtg_sum, day_count)
+        SELECT date_trunc('month', data_date)::date, {', '.join(sums['keys'])},
+               {', '.join(f'MAX({column})' for column in sums['attributes'])}, SUM(rtg), COUNT(*)
+        FROM ({_benchmark_day_query(table)}) AS day
+        GROUP BY date_trunc('month', data_date)::date, {', '.join(sums['keys'])}
+    """))
+    print(f"Created table: {NIELSEN_DAILY_SCHEMA}.{sums['table']}")
+
+def _benchmark_day_query(table: str, where: str = "") -> str:
+    # One rtg per day and slot. A slot can have several rows in a day (eg. two Nielsen geographies mapped to the
+    # same DMA), the day's rtg is their average. Days where the slot has no rating don't count
+    sums = NIELSEN_BENCHMARK_SUMS[table]
+    return f"""
+        SELECT data_date, {', '.join(sums['keys'])},
+               {', '.join(f'MAX({column}) AS {column}' for column in sums['attributes'])}, AVG(rtg) AS rtg
+        FROM {NIELSEN_DAILY_SCHEMA}.{table}
+        {where}
+        GROUP BY data_date, {', '.join(sums['keys'])}
+        HAVING COUNT(rtg) > 0
+    """
+
+def _update_benchmark_sums(db: Session, table: str, data_date: date, sign: int):
+    """
+    Add (sign 1) or take out (sign -1) the stored rows of data_date from its month's running sums, O(slots).
+    """
+    sums = NIELSEN_BENCHMARK_SUMS[table]
+    slot_columns = sums["keys"] + sums["attributes"]
+    day = _benchmark_day_query(table, "WHERE data_date = :data_date")
+    params = {"data_date": data_date, "month": data_date.replace(day=1)}
+    if sign < 0:
+        db.execute(text(f"""
+            UPDATE {NIELSEN_DAILY_SCHEMA}.{sums['table']} AS sums
+            SET rtg_sum = sums.rtg_sum - day.rtg, day_count = sums.day_count - 1
+            FROM ({day}) AS day
+            WHERE sums.month = :month AND {' AND '.join(f'sums.{key} = day.{key}' for key in sums['keys'])}
+        """), params)
+        return
+    db.execute(text(f"""
+        INSERT INTO {NIELSEN_DAILY_SCHEMA}.{sums['table']} AS sums (month, {', '.join(slot_columns)}, rtg_sum, day_count)
+        SELECT :month, {', '.join(slot_columns)}, rtg, 1 FROM ({day}) AS day
+        ON CONFLICT (month, {', '.join(sums['keys'])}) DO UPDATE
+        SET rtg_sum = sums.rtg_sum + EXCLUDED.rtg_sum,
+            day_count = sums.day_count + 1,
+            {', '.join(f'{column} = EXCLUDED.{column}' for column in sums['attributes'])}
+    """), params)
+
+def replace_nielsen_daily_data(db: Session, table: str, data_date: date, rows: pd.DataFrame) -> int:
+    """
+    Replace the rows of data_date in a daily Nielsen table, bulk loaded with COPY, and update the month's running sums.
+    rows has the table's columns (nielsen_daily_columns). Returns the number of rows loaded. Doesn't commit,
+    see save_nielsen_daily_data.
+    """
+    # One writer per table at a time, so two loads of a date can't both delete and then both insert.
+    # Held until the transaction ends
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:lock_key))"), {"lock_key": f"{NIELSEN_DAILY_SCHEMA}.{table}"})
+    create_nielsen_daily_partition(db, table, data_date)
+    create_nielsen_benchmark_sums(db, table)
+    # Take the day's previous load out of the sums before it's deleted
+    _update_benchmark_sums(db, table, data_date, -1)
+    db.execute(text(f"DELETE FROM {NIELSEN_DAILY_SCHEMA}.{table} WHERE data_date = :data_date"), {"data_date": data_date})
+
+    columns = nielsen_daily_columns(table)
+    buffer = io.StringIO()
+    rows[columns].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    # COPY needs the driver's cursor, on the session's connection so it's in the same transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {NIELSEN_DAILY_SCHEMA}.{table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+    _update_benchmark_sums(db, table, data_date, 1)
+    return len(rows)
+
+def save_nielsen_daily_data(db: Session, data_date: date, rows_by_table: dict) -> dict:
     """
-    Get the report dma lists from the database.
+    Replace the rows of data_date in the daily Nielsen tables (table -> rows), all in one transaction: loading a date
+    again replaces it, and a failed load leaves every table's previous rows in place.
+    Returns the number of rows loaded per table.
     """
-    result = pd.read_sql(f"SELECT * FROM nielsen_report_config.dma_list_{subject_line_id}", db.connection())
-    return result
-
+    try:
+        # Tables in a fixed order, so concurrent saves take the table locks in the same order
+        loaded = {table: replace_nielsen_daily_data(db, table, data_date, rows_by_table[table])
+                  for table in sorted(rows_by_table)}
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return loaded
+
+def get_nielsen_benchmark(db: Session, table: str, month: date) -> pd.DataFrame:
+    """
+    The benchmark of a month from the running sums: per slot the average rtg over the days stored for the month,
+    with day_count. Empty if nothing is stored for the month.
+    """
+    sums = NIELSEN_BENCHMARK_SUMS[table]
+    if not db.execute(text("SELECT to_regclass(:table_name) IS NOT NULL"),
+                      {"table_name": f"{NIELSEN_DAILY_SCHEMA}.{sums['table']}"}).scalar():
+        return pd.DataFrame(columns=sums["keys"] + sums["attributes"] + ["rtg", "day_count"])
+    return pd.read_sql(text(f"""
+        SELECT {', '.join(sums['keys'] + sums['attributes'])}, rtg_sum / day_count AS rtg, day_count
+        FROM {NIELSEN_DAILY_SCHEMA}.{sums['table']}
+        WHERE month = :month AND day_count > 0
+    """), db.connection(), params={"month": month})
+
+def get_nielsen_daily_dates(db: Session, month: date) -> list:
+    """
+    The dates stored for a month (in ratings_15min), sorted.
+    """
+    if not db.execute(text("SELECT to_regclass(:table_name) IS NOT NULL"),
+                      {"table_name": f"{NIELSEN_DAILY_SCHEMA}.ratings_15min"}).scalar():
+        return []
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    result = db.execute(text(f"""
+        SELECT DISTINCT data_date FROM {NIELSEN_DAILY_SCHEMA}.ratings_15min
+        WHERE data_date >= :month AND data_date < :next_month
+        ORDER BY data_date
+    """), {"month": month, "next_month": next_month})
+    return [row[0] for row in result]
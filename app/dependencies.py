@@ -4,6 +4,9 @@ from dotenv import load_dotenv
 # Connection Logic 
 from utils.connect_db import connect_db
 from utils.aws_clients import create_s3_client, create_ses_client
+from utils.storage import ObjectStorage, create_storage
+from utils.upload_store import UploadStore
+from config import settings
 from models.custom_types import AWSDatabaseCredentials, AWSCredentials
 
 def get_db():
@@ -50,6 +53,34 @@ def get_s3_client():
     )
     return create_s3_client(aws_credentials)
 
+def get_coverage_storage() -> ObjectStorage:
+    """
+    Dependency that provides the storage of the coverage map data (S3 bucket or local directory, see settings).
+    """
+    if settings.COVERAGE_STORAGE_BACKEND == "s3":
+        return create_storage("s3", bucket=settings.COVERAGE_BUCKET, s3_client=get_s3_client())
+    return create_storage(settings.COVERAGE_STORAGE_BACKEND, local_path=settings.COVERAGE_LOCAL_PATH)
+
+def get_coverage_tile_storage() -> ObjectStorage:
+    """
+    Dependency that provides the storage of the pre-cut coverage map tiles (local directory).
+    """
+    return create_storage("local", local_path=settings.COVERAGE_TILE_CACHE_PATH)
+
+def get_benchmark_storage() -> ObjectStorage:
+    """
+    Dependency that provides the storage of the Nielsen benchmark files (local directory or S3, see settings).
+    """
+    if settings.BENCHMARK_STORAGE_BACKEND == "s3":
+        return create_storage("s3", bucket=settings.BENCHMARK_BUCKET, prefix=settings.BENCHMARK_PREFIX, s3_client=get_s3_client())
+    return create_storage(settings.BENCHMARK_STORAGE_BACKEND, local_path=settings.BENCHMARK_LOCAL_PATH)
+
+def get_upload_store() -> UploadStore:
+    """
+    Dependency that provides the store of parsed Nielsen uploads.
+    """
+    return UploadStore(create_storage("local", local_path=settings.UPLOAD_CACHE_PATH), settings.UPLOAD_CACHE_TTL_SECONDS)
+
 def get_JWT_key():
     """
     Dependency that provides the JWT key.
@@ -1,12 +1,40 @@
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager, contextmanager
 
 # Local imports
 from api.api import api_router
 from config import settings
+from middleware.compression import CompressionMiddleware
+from dependencies import get_db
+from transformations.engagement.engagement_warmup import engagement_warmup
+from api.endpoints.nielsen_api import nielsen_job_queue
+from crud.nielsen_crud import migrate_nielsen_report_config
 
-app = FastAPI(title=settings.PROJECT_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The Nielsen subject line config tables (see migrate_nielsen_report_config), idempotent
+    if settings.NIELSEN_CONFIG_MIGRATE_ON_STARTUP:
+        try:
+            with contextmanager(get_db)() as db:
+                moved = migrate_nielsen_report_config(db)
+            print(f"Nielsen report config tables ready ({moved} old tables moved)")
+        except Exception as e:
+            print(f"Migrating the Nielsen report config tables failed: {e}")
+    # Precompute the default engagement views in the background, the app starts serving straight away
+    if settings.WARMUP_ENABLED:
+        engagement_warmup.start(contextmanager(get_db), poll_seconds=settings.WARMUP_POLL_SECONDS,
+                                view_ttl_seconds=settings.WARMUP_VIEW_TTL_SECONDS,
+                                rank_months_back=settings.WARMUP_RANK_MONTHS_BACK,
+                                over_time_months_back=settings.WARMUP_OVER_TIME_MONTHS_BACK)
+    yield
+    engagement_warmup.stop()
+    nielsen_job_queue.shutdown()
+
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
 # Set up CORS
 app.add_middleware(
@@ -17,6 +45,16 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers for testing only
 )
 
+# Compress the larger json/geojson responses (brotli or gzip, negotiated per request)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+    brotli_quality=settings.COMPRESSION_BROTLI_QUALITY,
+    excluded_media_types=tuple(settings.COMPRESSION_EXCLUDED_MEDIA_TYPES),
+    brotli_enabled=settings.COMPRESSION_BROTLI_ENABLED,
+)
+
 # Include the API router
 app.include_router(api_router, prefix="/api")
 
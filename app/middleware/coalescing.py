@@ -0,0 +1,188 @@
+# Single flight request coalescing for the engagement endpoints.
+# When several users open the same default views at once (monday mornings) every request used to run the same
+# queries and pivots. With this route class the first request computes, identical requests that arrive while it's
+# running wait for it and get a copy of its response.
+import asyncio
+import json
+import threading
+from typing import Any, Callable, Coroutine, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from config import settings
+
+
+class CoalescingStats:
+    """
+    Thread safe, per route counts of executed vs coalesced requests.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, int]] = {}
+
+    def _route(self, route: str) -> Dict[str, int]:
+        return self._routes.setdefault(route, {
+            "requests": 0, "executions": 0, "coalesced": 0, "waiting": 0, "max_waiting": 0,
+        })
+
+    def record_execution(self, route: str):
+        with self._lock:
+            stats = self._route(route)
+            stats["requests"] += 1
+            stats["executions"] += 1
+
+    def waiter_started(self, route: str):
+        with self._lock:
+            stats = self._route(route)
+            stats["requests"] += 1
+            stats["waiting"] += 1
+            stats["max_waiting"] = max(stats["max_waiting"], stats["waiting"])
+
+    def waiter_finished(self, route: str, coalesced: bool):
+        with self._lock:
+            stats = self._route(route)
+            stats["waiting"] -= 1
+            if coalesced:
+                stats["coalesced"] += 1
+            else:
+                # The leader's response couldn't be shared, so the waiter ran the request itself
+                stats["executions"] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {route: dict(stats) for route, stats in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            for route in list(self._routes):
+                # Keep the live waiter counts, they're decremented when those requests finish
+                waiting = self._routes[route]["waiting"]
+                self._routes[route] = {"requests": 0, "executions": 0, "coalesced": 0, "waiting": waiting, "max_waiting": waiting}
+
+
+coalescing_stats = CoalescingStats()
+
+# (status code, body, raw headers) of a response that can be handed to the waiting requests
+_SharedResponse = Tuple[int, bytes, list]
+
+
+class RequestCoalescer:
+    """
+    Tracks the in flight requests of one event loop by key. The first caller for a key runs the request,
+    later callers with the same key await its result instead of running it again.
+    """
+    def __init__(self, stats: CoalescingStats = coalescing_stats):
+        self.stats = stats
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, route: str, call: Callable[[], Coroutine[Any, Any, Response]]) -> Response:
+        """
+        Run call() for the key, or wait for the identical request that's already running.
+
+        Exceptions (eg. HTTPException) raised by the running request are raised in the waiting requests too.
+        Responses that can't be copied (streaming, background tasks) aren't shared, the waiters then run call() themselves.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats.waiter_started(route)
+            coalesced = False
+            try:
+                shared: Optional[_SharedResponse] = await asyncio.shield(future)
+                coalesced = shared is not None
+            except asyncio.CancelledError:
+                raise
+            except BaseException:
+                # The running request failed, the waiter gets the same error
+                coalesced = True
+                raise
+            finally:
+                self.stats.waiter_finished(route, coalesced)
+            if shared is None:
+                return await call()
+            return _copy_response(shared)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.stats.record_execution(route)
+        try:
+            response = await call()
+        except asyncio.CancelledError:
+            future.set_result(None)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, there may be no one waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+        future.set_result(_share_response(response))
+        return response
+
+
+def _share_response(response: Response) -> Optional[_SharedResponse]:
+    body = getattr(response, "body", None)
+    if not isinstance(body, bytes) or response.background is not None:
+        return None
+    return response.status_code, body, list(response.raw_headers)
+
+
+def _copy_response(shared: _SharedResponse) -> Response:
+    status_code, body, raw_headers = shared
+    response = Response(content=body, status_code=status_code)
+    response.raw_headers = list(raw_headers)
+    return response
+
+
+def _normalized_body(body: bytes) -> Hashable:
+    """
+    JSON bodies are re-encoded with sorted keys so key order and whitespace don't produce different keys.
+    """
+    if not body:
+        return b""
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return body
+
+
+# One coalescer per event loop, futures can't be awaited across loops (eg. the TestClient's portal)
+_coalescers: Dict[int, RequestCoalescer] = {}
+
+
+def _get_coalescer() -> RequestCoalescer:
+    loop_id = id(asyncio.get_running_loop())
+    coalescer = _coalescers.get(loop_id)
+    if coalescer is None:
+        coalescer = _coalescers[loop_id] = RequestCoalescer()
+    return coalescer
+
+
+class CoalescingAPIRoute(APIRoute):
+    """
+    APIRoute that coalesces identical concurrent requests, keyed on method, route, path params, query params and
+    the normalized body. Request headers are not part of the key, only use it on routes whose response
+    doesn't depend on who's asking. Set COALESCING_ENABLED=false to turn it off.
+    """
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        route_handler = super().get_route_handler()
+        route_path = self.path
+
+        async def coalescing_route_handler(request: Request) -> Response:
+            if not settings.COALESCING_ENABLED:
+                return await route_handler(request)
+            # The body is cached on the request, so the route handler can read it again
+            body = await request.body()
+            route = request.scope.get("route")
+            route_template = getattr(route, "path", None) or route_path
+            key = (
+                request.method,
+                route_template,
+                tuple(sorted(request.path_params.items())),
+                tuple(sorted(request.query_params.multi_items())),
+                _normalized_body(body),
+            )
+            return await _get_coalescer().run(key, route_template, lambda: route_handler(request))
+
+        return coalescing_route_handler
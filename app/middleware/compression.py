@@ -0,0 +1,244 @@
+# Negotiated gzip/brotli compression for our larger responses (coverage geojson, multi-table engagement json)
+# Written as a plain ASGI middleware (instead of starlette's GZipMiddleware) so we can add brotli, skip
+# already compressed downloads and keep per route stats on how much we actually save.
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Brotli is optional, if it isn't installed we just negotiate gzip
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Bodies bigger than this are compressed in a worker thread so we don't block the event loop
+THREADED_COMPRESSION_SIZE = 256 * 1024
+
+
+class CompressionStats:
+    """
+    Thread safe, per route record of transfer sizes and compression cpu time. Used to tune the levels/threshold.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, route: str, encoding: Optional[str], bytes_in: int, bytes_out: int, cpu_seconds: float):
+        with self._lock:
+            stats = self._routes.setdefault(route, {
+                "responses": 0, "compressed_responses": 0, "bytes_in": 0, "bytes_out": 0,
+                "cpu_seconds": 0.0, "encodings": {},
+            })
+            stats["responses"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            stats["cpu_seconds"] += cpu_seconds
+            if encoding is not None:
+                stats["compressed_responses"] += 1
+                stats["encodings"][encoding] = stats["encodings"].get(encoding, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return a copy of the stats with the compression ratio filled in.
+        """
+        with self._lock:
+            result = {}
+            for route, stats in self._routes.items():
+                stats = dict(stats, encodings=dict(stats["encodings"]))
+                stats["ratio"] = round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else None
+                stats["cpu_seconds"] = round(stats["cpu_seconds"], 6)
+                result[route] = stats
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+compression_stats = CompressionStats()
+
+
+def negotiate_encoding(accept_encoding: str, brotli_enabled: bool = True) -> Optional[str]:
+    """
+    Pick the content encoding to use from an Accept-Encoding header. Prefers brotli over gzip, honours q=0.
+
+    :param accept_encoding: The raw Accept-Encoding header value
+    :param brotli_enabled: Whether brotli can be offered at all
+    :return: 'br', 'gzip' or None
+    """
+    qualities: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip()] = quality
+
+    wildcard = qualities.get("*", 0.0)
+    candidates = (["br"] if brotli_enabled and brotli is not None else []) + ["gzip"]
+    best, best_quality = None, 0.0
+    for coding in candidates:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class _Compressor:
+    """
+    Thin wrapper so gzip and brotli look the same to the responder (compress a chunk, flush, finish).
+    """
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 16 + MAX_WBITS writes the gzip header/trailer
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if finish else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+def _timed_compress(compressor: _Compressor, data: bytes, finish: bool) -> Tuple[bytes, float]:
+    # thread_time is the cpu time of the current thread, so this still works when we run in the threadpool
+    start = time.thread_time()
+    out = compressor.compress(data, finish)
+    return out, time.thread_time() - start
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip depending on the client's Accept-Encoding.
+
+    Responses are left alone when they are smaller than minimum_size, already have a Content-Encoding,
+    or their media type starts with one of excluded_media_types (zips, images, xlsx, event streams...).
+    Streaming responses are compressed chunk by chunk with a sync flush so they keep streaming.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 excluded_media_types: Tuple[str, ...] = (), brotli_enabled: bool = True,
+                 stats: CompressionStats = compression_stats):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.excluded_media_types = tuple(media_type.lower() for media_type in excluded_media_types)
+        self.brotli_enabled = brotli_enabled
+        self.stats = stats
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.brotli_enabled)
+        responder = _CompressionResponder(self, scope, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+    def should_skip(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return True
+        media_type = headers.get("content-type", "").lower()
+        return any(media_type.startswith(excluded) for excluded in self.excluded_media_types)
+
+
+class _CompressionResponder:
+    """
+    Wraps the send callable for one request. Holds the response start message until we've seen
+    the first body chunk and know whether (and how) to compress.
+    """
+    def __init__(self, middleware: CompressionMiddleware, scope: Scope, send: Send, encoding: Optional[str]):
+        self.middleware = middleware
+        self.scope = scope
+        self._send = send
+        self.encoding = encoding
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # FastAPI puts the matched route in the scope, use its template so /jobs/{id} is one bucket
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path", "")
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+        if message_type != "http.response.body":
+            # eg. http.response.pathsend, nothing for us to compress, just make sure the start goes out first
+            if self.start_message is not None:
+                start_message, self.start_message = self.start_message, None
+                self.passthrough = True
+                await self._send(start_message)
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        # First body chunk, decide what to do with the response
+        if self.start_message is not None:
+            start_message, self.start_message = self.start_message, None
+            headers = Headers(raw=start_message["headers"])
+            if (self.encoding is None or start_message["status"] < 200 or start_message["status"] in (204, 304)
+                    or self.middleware.should_skip(headers)
+                    or (not more_body and len(body) < self.middleware.minimum_size)):
+                self.passthrough = True
+                await self._send(start_message)
+            else:
+                self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+                compressed = await self._compress(body, finish=not more_body)
+                mutable_headers = MutableHeaders(raw=start_message["headers"])
+                mutable_headers["Content-Encoding"] = self.encoding
+                mutable_headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del mutable_headers["Content-Length"]
+                else:
+                    mutable_headers["Content-Length"] = str(len(compressed))
+                await self._send(start_message)
+                body = compressed
+
+        elif self.compressor is not None:
+            body = await self._compress(body, finish=not more_body)
+
+        if self.passthrough:
+            self.bytes_in += len(body)
+            self.bytes_out += len(body)
+
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        if not more_body:
+            self.middleware.stats.record(self.route, self.compressor.encoding if self.compressor else None,
+                                         self.bytes_in, self.bytes_out, self.cpu_seconds)
+
+    async def _compress(self, data: bytes, finish: bool) -> bytes:
+        if len(data) >= THREADED_COMPRESSION_SIZE:
+            compressed, cpu_seconds = await anyio.to_thread.run_sync(_timed_compress, self.compressor, data, finish)
+        else:
+            compressed, cpu_seconds = _timed_compress(self.compressor, data, finish)
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        self.cpu_seconds += cpu_seconds
+        return compressed
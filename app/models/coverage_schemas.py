@@ -0,0 +1,26 @@
+from typing import List
+from pydantic import BaseModel, Field
+
+
+class CoveragePoint(BaseModel):
+    """
+    A point to check against the coverage polygons.
+
+    Attributes:
+        lat (float): Latitude in degrees.
+        lon (float): Longitude in degrees.
+    """
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+
+
+class CoverageLookupRequest(BaseModel):
+    """
+    Represents a batch coverage lookup, any mix of points and zips.
+
+    Attributes:
+        points (List[CoveragePoint]): Points to look up.
+        zips (List[str]): Zip codes to look up.
+    """
+    points: List[CoveragePoint] = Field(default_factory=list, max_length=100000)
+    zips: List[str] = Field(default_factory=list, max_length=100000)
@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 from models.custom_types import FullMonthStr
 
@@ -39,4 +40,31 @@ class HevPeriods(BaseModel):
     curr_period_end: FullMonthStr
     curr_period_start: FullMonthStr
     prev_period_end: FullMonthStr
-    prev_period_start: FullMonthStr
\ No newline at end of file
+    prev_period_start: FullMonthStr
+
+
+class EngagementBundleRequest(BaseModel):
+    """
+    Represents a request for several engagement views at once. Each view is optional and takes the same
+    dates as its own endpoint, only the views that are set are computed.
+
+    Attributes:
+        ytd (StartEndEngagement): Dates for the YTD view.
+        mom (StartPrevEndEngagement): Dates for the MoM view.
+        over_time (StartEndEngagement): Dates for the over time view.
+        rank (StartEndEngagement): Dates for the rank view.
+        hev (HevPeriods): Periods for the HEV view.
+        quarterly (StartEndEngagement): Dates for the quarterly/yearly view.
+    """
+    ytd: Optional[StartEndEngagement] = None
+    mom: Optional[StartPrevEndEngagement] = None
+    over_time: Optional[StartEndEngagement] = None
+    rank: Optional[StartEndEngagement] = None
+    hev: Optional[HevPeriods] = None
+    quarterly: Optional[StartEndEngagement] = None
+
+    def requested_views(self) -> List[str]:
+        """
+        Names of the views that were requested, in the order they are computed.
+        """
+        return [view for view in ("ytd", "mom", "over_time", "rank", "hev", "quarterly") if getattr(self, view) is not None]
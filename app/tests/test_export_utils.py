@@ -0,0 +1,68 @@
+# Run from the app directory: python -m pytest tests
+import io
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from utils.export_utils import arrow_schema_from_cursor, arrow_schema_from_dataframe, iter_arrow_export, iter_dataframe_chunks
+
+# (name, type_code) like psycopg2's cursor.description: text, int4, numeric, date
+DESCRIPTION = [("network", 25, None), ("subs", 23, None), ("adjeng", 1700, None), ("launch_date", 1082, None)]
+
+
+def _chunks():
+    # What read_sql gives back when the nullable columns only get values after the first chunk:
+    # an all NULL column comes back as object Nones, an integer column with NULLs as float64
+    yield pd.DataFrame({"network": [None, None], "subs": [1, 2], "adjeng": [None, None],
+                        "launch_date": [None, None]})
+    yield pd.DataFrame({"network": ["SN", None], "subs": [np.nan, 4.0], "adjeng": [0.5, np.nan],
+                        "launch_date": [pd.Timestamp("2024-01-01").date(), None]})
+
+
+def _read(data: bytes, export_format: str) -> pa.Table:
+    if export_format == "parquet":
+        return pq.read_table(io.BytesIO(data))
+    return pa.ipc.open_stream(data).read_all()
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_nullable_columns_filled_after_first_chunk(export_format):
+    schema = arrow_schema_from_cursor(DESCRIPTION)
+    table = _read(b"".join(iter_arrow_export(_chunks(), export_format, schema)), export_format)
+
+    assert table.schema.equals(schema)
+    assert table.column("network").to_pylist() == [None, None, "SN", None]
+    assert table.column("subs").to_pylist() == [1, 2, None, 4]
+    assert table.column("adjeng").to_pylist() == [None, None, 0.5, None]
+    assert table.column("launch_date").to_pylist()[2] == pd.Timestamp("2024-01-01").date()
+
+
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_all_null_first_chunk_without_schema(export_format):
+    frames = [pd.DataFrame({"network": [None], "subs": [1]}), pd.DataFrame({"network": ["SN"], "subs": [np.nan]})]
+    table = _read(b"".join(iter_arrow_export(frames, export_format)), export_format)
+
+    assert table.schema.field("network").type == pa.string()
+    assert table.column("network").to_pylist() == [None, "SN"]
+    assert table.column("subs").to_pylist() == [1, None]
+
+
+def test_dataframe_schema_covers_every_chunk():
+    df = pd.DataFrame({"network": [None, None, "SN"], 202401: [1.0, 2.0, 3.0]})
+    schema = arrow_schema_from_dataframe(df)
+    table = _read(b"".join(iter_arrow_export(iter_dataframe_chunks(df, chunk_rows=2), "arrow", schema)), "arrow")
+
+    assert table.schema.field("network").type == pa.string()
+    assert table.column("network").to_pylist() == [None, None, "SN"]
+    assert table.column("202401").to_pylist() == [1.0, 2.0, 3.0]
+
+
+def test_empty_export_keeps_schema():
+    schema = arrow_schema_from_cursor(DESCRIPTION)
+    table = _read(b"".join(iter_arrow_export(iter([]), "parquet", schema)), "parquet")
+
+    assert table.num_rows == 0
+    assert table.schema.equals(schema)
@@ -0,0 +1,182 @@
+# One version (S3 ETag) of the SN zips coverage layer, parsed once, with everything derived from it
+# (feature bounding boxes, the shared arc topology, simplified versions at several resolutions, topojson encodings)
+# built lazily and kept.
+import math
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from .coverage_topology import CoverageTopology
+
+# (west, south, east, north) in degrees
+BBox = Tuple[float, float, float, float]
+
+# Douglas-Peucker tolerances (degrees) of the simplified resolutions, finest first. 'full' is the original geometry.
+# With resolution_for_zoom, low is used up to zoom 7, medium at zooms 8-9, high at 10-11 and full from 12
+RESOLUTIONS = {
+    "full": 0.0,
+    "high": 0.0005,
+    "medium": 0.002,
+    "low": 0.008,
+}
+
+
+def resolution_for_zoom(zoom: int) -> str:
+    """
+    The coarsest resolution whose tolerance is still under a pixel (256px tiles) at zoom.
+    """
+    pixel_degrees = 360.0 / (256 * 2 ** zoom)
+    for resolution, tolerance in sorted(RESOLUTIONS.items(), key=lambda item: -item[1]):
+        if tolerance <= pixel_degrees:
+            return resolution
+    return "full"
+
+
+def iter_coordinate_arrays(geometry: Optional[Dict[str, Any]]) -> Iterator[np.ndarray]:
+    """
+    Yield the coordinates of a geojson geometry as (n, 2+) arrays, one per point list (ring, line...).
+    """
+    if not geometry:
+        return
+    geometry_type = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    if geometry_type == "Point":
+        yield np.asarray([coordinates], dtype=float)
+    elif geometry_type in ("MultiPoint", "LineString"):
+        yield np.asarray(coordinates, dtype=float)
+    elif geometry_type in ("MultiLineString", "Polygon"):
+        for line in coordinates:
+            yield np.asarray(line, dtype=float)
+    elif geometry_type == "MultiPolygon":
+        for polygon in coordinates:
+            for ring in polygon:
+                yield np.asarray(ring, dtype=float)
+    elif geometry_type == "GeometryCollection":
+        for part in geometry.get("geometries", []):
+            yield from iter_coordinate_arrays(part)
+
+
+def geometry_bbox(geometry: Optional[Dict[str, Any]]) -> BBox:
+    """
+    Bounding box of a geojson geometry, NaNs for an empty geometry (it never intersects anything).
+    """
+    arrays = [array[:, :2] for array in iter_coordinate_arrays(geometry) if len(array)]
+    if not arrays:
+        return (math.nan,) * 4
+    points = np.concatenate(arrays)
+    west, south = points.min(axis=0)
+    east, north = points.max(axis=0)
+    return float(west), float(south), float(east), float(north)
+
+
+class CoverageLayer:
+    """
+    A parsed version of the coverage geojson.
+
+    Attributes:
+        version: The source version (S3 ETag)
+        source: The original geojson bytes
+        features: The parsed features
+        bboxes: (n, 4) array of feature bounding boxes (west, south, east, north)
+    """
+    def __init__(self, geojson_bytes: bytes, version: str):
+        self.version = version
+        self.source = geojson_bytes
+        geojson = orjson.loads(geojson_bytes)
+        # Everything but the features (type, crs, name...) is kept as is in the simplified versions
+        self.collection_members = {key: value for key, value in geojson.items() if key != "features"}
+        self.features: List[Dict[str, Any]] = geojson.get("features", [])
+        self.bboxes = np.array([geometry_bbox(feature.get("geometry")) for feature in self.features], dtype=float).reshape(-1, 4)
+        self._lock = threading.Lock()
+        self._topology: Optional[CoverageTopology] = None
+        self._encoded_features: Dict[str, List[bytes]] = {}
+        self._geojson: Dict[str, bytes] = {"full": geojson_bytes}
+        self._topojson: Dict[Tuple[str, int], bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    @property
+    def bounds(self) -> Optional[BBox]:
+        if not len(self.features):
+            return None
+        return (float(np.nanmin(self.bboxes[:, 0])), float(np.nanmin(self.bboxes[:, 1])),
+                float(np.nanmax(self.bboxes[:, 2])), float(np.nanmax(self.bboxes[:, 3])))
+
+    @property
+    def topology(self) -> CoverageTopology:
+        """ The shared arc topology, built on first use. """
+        with self._lock:
+            if self._topology is None:
+                self._topology = CoverageTopology(self.features)
+                # Douglas-Peucker once down to the finest resolution, the others are masks of it
+                self._topology.compute_importance(min(tolerance for tolerance in RESOLUTIONS.values() if tolerance > 0))
+            return self._topology
+
+    def encoded_features(self, resolution: str = "full") -> List[bytes]:
+        """
+        Every feature encoded to json at the given resolution, built once per resolution.
+        """
+        encoded = self._encoded_features.get(resolution)
+        if encoded is not None:
+            return encoded
+
+        tolerance = RESOLUTIONS[resolution]
+        if tolerance <= 0:
+            encoded = [orjson.dumps(feature) for feature in self.features]
+        else:
+            topology = self.topology
+            arcs = topology.simplified_arcs(tolerance)
+            encoded = [orjson.dumps(dict(feature, geometry=topology.geometry(i, arcs, topology.arcs)))
+                       for i, feature in enumerate(self.features)]
+        self._encoded_features[resolution] = encoded
+        return encoded
+
+    def geojson(self, resolution: str = "full") -> bytes:
+        """
+        The whole FeatureCollection at the given resolution, the full resolution is the original bytes.
+        """
+        geojson = self._geojson.get(resolution)
+        if geojson is None:
+            members = orjson.dumps(self.collection_members)
+            geojson = members[:-1] + (b"," if len(members) > 2 else b"") + b'"features":[' + b",".join(self.encoded_features(resolution)) + b"]}"
+            self._geojson[resolution] = geojson
+        return geojson
+
+    def topojson(self, resolution: str = "full", quantization: int = 100000) -> bytes:
+        """
+        The layer as TopoJSON at the given resolution: shared borders stored once as arcs, coordinates quantized
+        and delta encoded. Built once per resolution/quantization.
+        """
+        key = (resolution, quantization)
+        topojson = self._topojson.get(key)
+        if topojson is None:
+            topology = self.topology
+            arcs = topology.simplified_arcs(RESOLUTIONS[resolution])
+            topojson = orjson.dumps(topology.to_topojson(self.features, arcs, quantization), option=orjson.OPT_SERIALIZE_NUMPY)
+            self._topojson[key] = topojson
+        return topojson
+
+
+_layer: Optional[CoverageLayer] = None
+_layer_lock = threading.Lock()
+
+
+def get_coverage_layer(geojson_bytes: bytes, version: str) -> CoverageLayer:
+    """
+    The parsed layer for this version of the geojson, rebuilt (once) when the version changes.
+
+    :param geojson_bytes: The raw geojson
+    :param version: The geojson's version, eg. its S3 ETag
+    """
+    global _layer
+    layer = _layer
+    if layer is not None and layer.version == version:
+        return layer
+    with _layer_lock:
+        if _layer is None or _layer.version != version:
+            _layer = CoverageLayer(geojson_bytes, version)
+            print(f"Parsed the coverage layer, {len(_layer)} features (version {version})")
+        return _layer
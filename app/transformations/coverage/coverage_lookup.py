@@ -0,0 +1,188 @@
+# Server side coverage lookups: is a point (lat/lon) or a zip in SN coverage.
+# Points go through an STR packed bounding box tree over the coverage polygons (numpy arrays, queried for a whole
+# batch of points at once) and then an exact point-in-polygon check against the few candidate polygons.
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .coverage_layer import CoverageLayer, get_coverage_layer
+
+
+class STRTree:
+    """
+    Static bounding box tree, bulk loaded with Sort-Tile-Recursive packing.
+
+    Items are sorted into vertical strips by bbox center x, then by center y within each strip, and packed
+    node_capacity to a node. Every level above is the consecutive nodes of the level below packed the same way,
+    so the children of node k are simply nodes [k * node_capacity, (k + 1) * node_capacity) of the level below.
+
+    Attributes:
+        items: The item index (row of bboxes) of each leaf slot, in packed order
+        levels: Bounding boxes per level, levels[0] are the items, levels[-1] the root level
+    """
+    def __init__(self, bboxes: np.ndarray, node_capacity: int = 16):
+        self.node_capacity = node_capacity
+        # Items with empty geometries (NaN bboxes) can never match
+        items = np.flatnonzero(~np.isnan(bboxes).any(axis=1))
+        self.items = items[self._str_order(bboxes[items])]
+        self.levels: List[np.ndarray] = [bboxes[self.items]]
+        while len(self.levels[-1]) > node_capacity:
+            boxes = self.levels[-1]
+            starts = np.arange(0, len(boxes), node_capacity)
+            self.levels.append(np.column_stack([
+                np.minimum.reduceat(boxes[:, 0], starts), np.minimum.reduceat(boxes[:, 1], starts),
+                np.maximum.reduceat(boxes[:, 2], starts), np.maximum.reduceat(boxes[:, 3], starts),
+            ]))
+
+    def _str_order(self, bboxes: np.ndarray) -> np.ndarray:
+        if not len(bboxes):
+            return np.arange(0)
+        center_x = (bboxes[:, 0] + bboxes[:, 2]) / 2
+        center_y = (bboxes[:, 1] + bboxes[:, 3]) / 2
+        n_nodes = -(-len(bboxes) // self.node_capacity)
+        n_strips = int(np.ceil(np.sqrt(n_nodes)))
+        strip_size = n_strips * self.node_capacity
+        by_x = np.argsort(center_x, kind="stable")
+        strip = np.empty(len(bboxes), dtype=int)
+        strip[by_x] = np.arange(len(bboxes)) // strip_size
+        return np.lexsort((center_y, strip))
+
+    def query_points(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Every (point, item) pair where the item's bounding box contains the point.
+
+        :param x: Point x coordinates (longitude)
+        :param y: Point y coordinates (latitude)
+        :return: (point indices, item indices), matching arrays
+        """
+        n_points = len(x)
+        top = self.levels[-1]
+        point_index = np.repeat(np.arange(n_points), len(top))
+        node = np.tile(np.arange(len(top)), n_points)
+        for level in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[level]
+            if level < len(self.levels) - 1:
+                # Expand every surviving node of the level above into its children
+                counts = np.minimum(self.node_capacity, len(boxes) - node * self.node_capacity)
+                offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                point_index = np.repeat(point_index, counts)
+                node = np.repeat(node * self.node_capacity, counts) + offsets
+            px, py, box = x[point_index], y[point_index], boxes[node]
+            hit = (box[:, 0] <= px) & (px <= box[:, 2]) & (box[:, 1] <= py) & (py <= box[:, 3])
+            point_index, node = point_index[hit], node[hit]
+        return point_index, self.items[node]
+
+
+def _normalize_zip(value: Any) -> str:
+    zip_code = str(value).strip()
+    # Zips stored as numbers lose their leading zeros
+    return zip_code.zfill(5) if zip_code.isdigit() and len(zip_code) < 5 else zip_code
+
+
+class CoverageLookup:
+    """
+    Point and zip lookups over one version of the coverage layer.
+
+    Polygon edges of all the features are kept in flat numpy arrays (feature f's edges are
+    edge_offsets[f]:edge_offsets[f + 1]), a point is inside a feature when a ray from it crosses an odd number of
+    the feature's edges. Holes and multipolygon parts need no special handling with the even-odd rule.
+    """
+    def __init__(self, layer: CoverageLayer, zip_property: str = "zip"):
+        self.version = layer.version
+        self.tree = STRTree(layer.bboxes)
+
+        edges: List[np.ndarray] = []
+        edge_counts = np.zeros(len(layer), dtype=int)
+        for f, feature in enumerate(layer.features):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                rings = geometry["coordinates"]
+            elif geometry.get("type") == "MultiPolygon":
+                rings = [ring for polygon in geometry["coordinates"] for ring in polygon]
+            else:
+                continue
+            for ring in rings:
+                ring = np.asarray(ring, dtype=float)[:, :2]
+                if len(ring) < 3:
+                    continue
+                # Close the ring if the source didn't
+                if not np.all(ring[0] == ring[-1]):
+                    ring = np.vstack([ring, ring[:1]])
+                edges.append(np.hstack([ring[:-1], ring[1:]]))
+                edge_counts[f] += len(ring) - 1
+        edges_array = np.vstack(edges) if edges else np.empty((0, 4))
+        self.x1, self.y1, self.x2, self.y2 = (edges_array[:, i].copy() for i in range(4))
+        self.edge_offsets = np.concatenate([[0], np.cumsum(edge_counts)])
+
+        # Zip property, matched case insensitively (ZIP, Zip, zip...)
+        self.zips: List[Optional[str]] = []
+        self.zip_features: Dict[str, List[int]] = {}
+        for f, feature in enumerate(layer.features):
+            properties = {key.lower(): value for key, value in (feature.get("properties") or {}).items()}
+            value = properties.get(zip_property.lower())
+            zip_code = _normalize_zip(value) if value is not None else None
+            self.zips.append(zip_code)
+            if zip_code is not None:
+                self.zip_features.setdefault(zip_code, []).append(f)
+
+    def _contains(self, feature: int, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        start, end = self.edge_offsets[feature], self.edge_offsets[feature + 1]
+        x1, y1, x2, y2 = self.x1[start:end], self.y1[start:end], self.x2[start:end], self.y2[start:end]
+        px, py = x[:, None], y[:, None]
+        # Edges that straddle the point's horizontal line, and where they cross it
+        straddles = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        crossings = (straddles & (px < crossing_x)).sum(axis=1)
+        return crossings % 2 == 1
+
+    def lookup_points(self, lats: np.ndarray, lons: np.ndarray) -> List[List[int]]:
+        """
+        For each point, the indices of the coverage features that contain it (usually none or one).
+        """
+        x, y = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+        point_index, feature = self.tree.query_points(x, y)
+        matches: List[List[int]] = [[] for _ in range(len(x))]
+        if not len(point_index):
+            return matches
+
+        # Exact check, one vectorized test per candidate feature against all its candidate points
+        order = np.argsort(feature, kind="stable")
+        point_index, feature = point_index[order], feature[order]
+        group_starts = np.flatnonzero(np.r_[True, feature[1:] != feature[:-1]])
+        for start, end in zip(group_starts, np.r_[group_starts[1:], len(feature)]):
+            points = point_index[start:end]
+            inside = self._contains(int(feature[start]), x[points], y[points])
+            for p in points[inside]:
+                matches[p].append(int(feature[start]))
+        return matches
+
+    def lookup_zips(self, zip_codes: List[Any]) -> List[List[int]]:
+        """
+        For each zip, the indices of the coverage features with that zip.
+        """
+        return [self.zip_features.get(_normalize_zip(zip_code), []) for zip_code in zip_codes]
+
+
+_lookup: Optional[CoverageLookup] = None
+_lookup_lock = threading.Lock()
+
+
+def get_coverage_lookup(geojson_bytes: bytes, version: str, zip_property: str = "zip") -> CoverageLookup:
+    """
+    The lookup index for this version of the geojson, rebuilt (once) when the version changes.
+
+    :param geojson_bytes: The raw geojson
+    :param version: The geojson's version, eg. its S3 ETag
+    :param zip_property: The feature property that holds the zip code
+    """
+    global _lookup
+    lookup = _lookup
+    if lookup is not None and lookup.version == version:
+        return lookup
+    with _lookup_lock:
+        if _lookup is None or _lookup.version != version:
+            _lookup = CoverageLookup(get_coverage_layer(geojson_bytes, version), zip_property)
+            print(f"Built the coverage lookup index, {len(_lookup.tree.items)} features (version {version})")
+        return _lookup
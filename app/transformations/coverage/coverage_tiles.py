@@ -0,0 +1,248 @@
+# Tiles of the coverage map (the SN zips geojson), so the frontend only downloads the polygons in its viewport.
+# The geojson is indexed once per S3 version: every feature is encoded once and its bounding box goes into numpy
+# arrays, a tile is the features whose bounding box intersects the tile's bounds, spliced together from the encoded bytes.
+# Low zoom tiles use the simplified geometries of the layer, the resolution is picked from the zoom.
+# The tiles up to precut_max_zoom are cut in the background when the index is built and written to a storage backend
+# (keyed by the geojson's version), so a restart or another worker serves them without cutting them again.
+# Each version's tiles are under their own prefix, a prefix is deleted once nothing has written to it for a while
+# (every worker has moved on to a newer version by then, they revalidate the geojson every COVERAGE_CACHE_TTL_SECONDS).
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+
+import numpy as np
+
+from utils.storage import ObjectNotFound, ObjectStorage, StorageError
+from .coverage_layer import BBox, CoverageLayer, get_coverage_layer, resolution_for_zoom
+
+MAX_TILE_ZOOM = 22
+
+
+def tile_bounds(z: int, x: int, y: int) -> BBox:
+    """
+    Bounds of a z/x/y (XYZ / slippy map) tile in degrees.
+    """
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tiles_covering(bounds: BBox, z: int) -> Iterator[tuple]:
+    """
+    The z/x/y tiles of zoom z that intersect bounds (west, south, east, north).
+    """
+    n = 2 ** z
+    west, south, east, north = bounds
+
+    def tile_x(lon: float) -> int:
+        return min(max(int((lon + 180.0) / 360.0 * n), 0), n - 1)
+
+    def tile_y(lat: float) -> int:
+        lat = math.radians(min(max(lat, -85.0511), 85.0511))
+        return min(max(int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n), 0), n - 1)
+
+    for x in range(tile_x(west), tile_x(east) + 1):
+        for y in range(tile_y(north), tile_y(south) + 1):
+            yield z, x, y
+
+
+class CoverageTileIndex:
+    """
+    Bounding box index over the features of one version of the coverage geojson, cuts and caches tiles from it.
+
+    Tiles are kept in memory (LRU of tile_cache_size), the ones up to precut_max_zoom are also kept in storage
+    under {version}/{z}/{x}/{y}.geojson. Without a storage every tile is cut on demand.
+    """
+    def __init__(self, layer: CoverageLayer, tile_cache_size: int = 2048, storage: Optional[ObjectStorage] = None,
+                 precut_max_zoom: int = -1):
+        self.layer = layer
+        self.version = layer.version
+        # Bounding boxes of the full resolution geometries, simplified ones never stick out of them by more than the tolerance
+        self.west, self.south, self.east, self.north = (layer.bboxes[:, i].copy() for i in range(4))
+        self.bounds: Optional[BBox] = layer.bounds
+        self.storage = storage
+        self.precut_max_zoom = precut_max_zoom if storage is not None else -1
+        # The version (an ETag) as a key prefix
+        self._storage_prefix = re.sub(r"[^0-9A-Za-z_-]", "", self.version) or "unversioned"
+        self._tile_cache_size = tile_cache_size
+        self._tiles: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.layer)
+
+    def query_bbox(self, bbox: BBox) -> np.ndarray:
+        """
+        Indices of the features whose bounding box intersects bbox (west, south, east, north).
+        """
+        west, south, east, north = bbox
+        # NaN bboxes (empty geometries) compare False, so they drop out
+        mask = (self.west <= east) & (self.east >= west) & (self.south <= north) & (self.north >= south)
+        return np.flatnonzero(mask)
+
+    def feature_collection(self, indices: np.ndarray, resolution: str = "full") -> bytes:
+        """
+        Encoded FeatureCollection of the features at indices, at the given resolution.
+        """
+        encoded_features = self.layer.encoded_features(resolution)
+        return b'{"type":"FeatureCollection","features":[' + b",".join(encoded_features[i] for i in indices) + b"]}"
+
+    def cut_tile(self, z: int, x: int, y: int) -> bytes:
+        """
+        Encoded FeatureCollection of the features that intersect the z/x/y tile, cut from the index.
+        """
+        west, south, east, north = tile_bounds(z, x, y)
+        # The edge tiles stretch to the poles, mercator cuts off at ~85 degrees
+        if y == 0:
+            north = 90.0
+        if y == 2 ** z - 1:
+            south = -90.0
+        return self.feature_collection(self.query_bbox((west, south, east, north)), resolution_for_zoom(z))
+
+    def _tile_key(self, z: int, x: int, y: int) -> str:
+        return f"{self._storage_prefix}/{z}/{x}/{y}.geojson"
+
+    def _stored_tile(self, z: int, x: int, y: int) -> bytes:
+        # From storage, or cut and stored
+        key = self._tile_key(z, x, y)
+        try:
+            return self.storage.get_bytes(key)
+        except ObjectNotFound:
+            pass
+        except (StorageError, OSError) as e:
+            print(f"Reading coverage tile {key} failed: {e}")
+            return self.cut_tile(z, x, y)
+        tile = self.cut_tile(z, x, y)
+        # A tile that can't be stored is still served
+        try:
+            self.storage.put(key, tile, content_type="application/geo+json")
+        except (StorageError, OSError) as e:
+            print(f"Storing coverage tile {key} failed: {e}")
+        return tile
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """
+        Encoded FeatureCollection of the features that intersect the z/x/y tile. Features are whole (not clipped),
+        so a feature that crosses tiles is in each of them. Geometries are simplified to about a pixel at zoom z.
+        """
+        key = (z, x, y)
+        with self._lock:
+            cached = self._tiles.get(key)
+            if cached is not None:
+                self._tiles.move_to_end(key)
+                return cached
+
+        tile = self._stored_tile(z, x, y) if z <= self.precut_max_zoom else self.cut_tile(z, x, y)
+
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self._tile_cache_size:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def precut(self) -> int:
+        """
+        Cut the tiles of zooms 0 to precut_max_zoom that intersect the data and write them to storage (the ones
+        already there are kept). Returns the number of tiles written.
+        """
+        if self.precut_max_zoom < 0 or self.bounds is None:
+            return 0
+        stored = {info.key for info in self.storage.list(self._storage_prefix + "/")}
+        written = 0
+        for zoom in range(self.precut_max_zoom + 1):
+            for z, x, y in tiles_covering(self.bounds, zoom):
+                key = self._tile_key(z, x, y)
+                if key not in stored:
+                    self.storage.put(key, self.cut_tile(z, x, y), content_type="application/geo+json")
+                    written += 1
+        return written
+
+    def delete_stale_versions(self, stale_after_seconds: float) -> int:
+        """
+        Delete the tiles of the other versions whose prefix hasn't been written to in stale_after_seconds.
+        A worker still on an older version writes its tiles as it serves them, so that version isn't stale yet.
+        Returns the number of versions deleted.
+        """
+        by_prefix = {}
+        for info in self.storage.list():
+            prefix = info.key.split("/", 1)[0]
+            if prefix != self._storage_prefix:
+                by_prefix.setdefault(prefix, []).append(info)
+
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=stale_after_seconds)
+        deleted = 0
+        for prefix, objects in by_prefix.items():
+            last_written = max((info.last_modified for info in objects if info.last_modified is not None), default=None)
+            if last_written is not None and last_written > cutoff:
+                continue
+            for info in objects:
+                self.storage.delete(info.key)
+            deleted += 1
+        return deleted
+
+
+_index: Optional[CoverageTileIndex] = None
+_index_lock = threading.Lock()
+
+
+def _delete_stale_tiles(index: CoverageTileIndex, stale_after_seconds: float):
+    try:
+        deleted = index.delete_stale_versions(stale_after_seconds)
+        if deleted:
+            print(f"Deleted the coverage tiles of {deleted} old version(s)")
+    except Exception as e:
+        print(f"Deleting old coverage tiles failed: {e}")
+
+
+def _precut_tiles(index: CoverageTileIndex, stale_after_seconds: float):
+    try:
+        written = index.precut()
+        print(f"Pre-cut the coverage tiles up to zoom {index.precut_max_zoom}, {written} written (version {index.version})")
+    except Exception as e:
+        # Not fatal, the tiles are cut (and stored) as they're requested
+        print(f"Pre-cutting the coverage tiles failed: {e}")
+
+    # Versions replaced a while ago can go now, the one this index replaced once the other workers stop writing it
+    _delete_stale_tiles(index, stale_after_seconds)
+    time.sleep(stale_after_seconds)
+    # A newer index cleans up after itself
+    if _index is index:
+        _delete_stale_tiles(index, stale_after_seconds)
+
+
+def get_coverage_tile_index(geojson_bytes: bytes, version: str, storage: Optional[ObjectStorage] = None,
+                            precut_max_zoom: int = -1, stale_after_seconds: float = 900) -> CoverageTileIndex:
+    """
+    The tile index for this version of the geojson, rebuilt (once) when the version changes.
+    A new index pre-cuts its tiles up to precut_max_zoom into storage in a background thread, the same thread
+    deletes the tiles of older versions once they're stale.
+
+    :param geojson_bytes: The raw geojson
+    :param version: The geojson's version, eg. its S3 ETag
+    :param storage: Where the pre-cut tiles are kept, None to only cut tiles on demand
+    :param precut_max_zoom: Highest zoom that's pre-cut and stored, -1 for none
+    :param stale_after_seconds: How long an older version's tiles are kept after their last write
+    """
+    global _index
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = CoverageTileIndex(get_coverage_layer(geojson_bytes, version), storage=storage,
+                                       precut_max_zoom=precut_max_zoom)
+            print(f"Built the coverage tile index, {len(_index)} features (version {version})")
+            if _index.precut_max_zoom >= 0:
+                threading.Thread(target=_precut_tiles, args=(_index, stale_after_seconds), name="coverage-tile-precut", daemon=True).start()
+        return _index
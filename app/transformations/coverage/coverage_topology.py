@@ -0,0 +1,310 @@
+# Shared border topology of the coverage polygons, and Douglas-Peucker simplification on top of it.
+# Neighbouring zips share their borders point for point. Simplifying each polygon on its own would simplify the
+# same border two different ways and open gaps/overlaps between neighbours, so the rings are cut into arcs at the
+# points where borders meet (junctions), shared arcs are stored once, and it's the arcs that get simplified.
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Polygon geometries are stored as arc references, i for arc i, ~i for arc i reversed (the topojson convention)
+ArcRef = int
+
+
+def _point_ids(points: np.ndarray) -> tuple:
+    """
+    Unique points and, for each input point, the id of its unique point.
+    """
+    unique_points, point_ids = np.unique(points, axis=0, return_inverse=True)
+    return unique_points, point_ids.reshape(-1)
+
+
+def _find_junctions(point_ids: np.ndarray, ring_starts: np.ndarray, ring_lengths: np.ndarray, n_points: int) -> np.ndarray:
+    """
+    A point is a junction when it has different neighbours in different places, ie. where a shared border
+    starts or ends. Returns a boolean mask over the unique point ids.
+    """
+    position = np.arange(len(point_ids))
+    ring_of = np.repeat(np.arange(len(ring_starts)), ring_lengths)
+    start, length = ring_starts[ring_of], ring_lengths[ring_of]
+    # Rings are cyclic (the closing point was dropped), so wrap around within each ring
+    prev_ids = point_ids[start + (position - start - 1) % length]
+    next_ids = point_ids[start + (position - start + 1) % length]
+    low, high = np.minimum(prev_ids, next_ids), np.maximum(prev_ids, next_ids)
+
+    # Distinct (point, neighbour pair) combinations, more than one for a point means it's a junction
+    combos = np.unique(np.stack([point_ids, low, high], axis=1), axis=0)
+    return np.bincount(combos[:, 0], minlength=n_points) > 1
+
+
+def douglas_peucker_importance(points: np.ndarray, min_tolerance: float = 0.0) -> np.ndarray:
+    """
+    For every point of a line, the largest Douglas-Peucker tolerance at which it's still kept.
+    Simplifying to tolerance t is then just points[importance > t]. The end points are always kept.
+
+    Points whose distance is under min_tolerance aren't split any further (they get 0), which keeps the cost
+    proportional to the points kept at the finest level rather than to all the points.
+
+    Closed lines (rings made of a single arc) always keep 2 interior points, so they stay a valid ring.
+    """
+    n = len(points)
+    importance = np.zeros(n)
+    importance[0] = importance[-1] = np.inf
+    if n <= 2:
+        return importance
+
+    closed = bool(np.all(points[0] == points[-1]))
+    if closed and n <= 4:
+        importance[:] = np.inf
+        return importance
+
+    first_split = None
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        a, b, parent = stack.pop()
+        if b - a < 2:
+            continue
+        segment = points[a + 1:b]
+        start, end = points[a], points[b]
+        chord = end - start
+        chord_length = np.hypot(chord[0], chord[1])
+        if chord_length == 0:
+            distances = np.hypot(segment[:, 0] - start[0], segment[:, 1] - start[1])
+        else:
+            distances = np.abs(chord[0] * (segment[:, 1] - start[1]) - chord[1] * (segment[:, 0] - start[0])) / chord_length
+        k = int(np.argmax(distances))
+        if distances[k] <= min_tolerance and not (closed and a == 0 and b == n - 1):
+            continue
+        i = a + 1 + k
+        if first_split is None:
+            first_split = i
+        tolerance = min(float(distances[k]), parent)
+        importance[i] = tolerance
+        stack.append((a, i, tolerance))
+        stack.append((i, b, tolerance))
+
+    if closed:
+        # A ring needs 3 distinct points, keep the farthest point from the start and the next most important one
+        others = importance.copy()
+        others[[0, first_split, n - 1]] = -1
+        second = int(np.argmax(others))
+        if others[second] <= 0:
+            # Nothing else was split, take the farthest point from the first chord
+            start, chord = points[0], points[first_split] - points[0]
+            distances = np.abs(chord[0] * (points[:, 1] - start[1]) - chord[1] * (points[:, 0] - start[0]))
+            distances[[0, first_split, n - 1]] = -1
+            second = int(np.argmax(distances))
+        importance[[first_split, second]] = np.inf
+    return importance
+
+
+class CoverageTopology:
+    """
+    The polygon rings of a list of geojson features cut into shared arcs.
+
+    Attributes:
+        arcs: List of (n, 2) coordinate arrays
+        geometries: Per feature, {"type": "Polygon"/"MultiPolygon", "arcs": [...]} with nested lists of arc refs,
+            or the original geometry for anything that isn't a polygon (points, lines, missing geometries)
+    """
+    def __init__(self, features: List[Dict[str, Any]]):
+        rings: List[np.ndarray] = []
+        # Per feature, the ring indices of each polygon, None for non polygon geometries
+        feature_polygons: List[Optional[List[List[int]]]] = []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                feature_polygons.append(None)
+                continue
+            ring_indices = []
+            for polygon in polygons:
+                polygon_rings = []
+                for ring in polygon:
+                    ring = np.asarray(ring, dtype=float)[:, :2]
+                    # Drop the closing point, rings are handled as cycles
+                    if len(ring) > 1 and np.all(ring[0] == ring[-1]):
+                        ring = ring[:-1]
+                    if len(ring) < 3:
+                        continue
+                    polygon_rings.append(len(rings))
+                    rings.append(ring)
+                if polygon_rings:
+                    ring_indices.append(polygon_rings)
+            feature_polygons.append(ring_indices)
+
+        self.arcs: List[np.ndarray] = []
+        self.geometries: List[Dict[str, Any]] = []
+        self._importance: Optional[List[np.ndarray]] = None
+        self._min_tolerance = 0.0
+        if not rings:
+            self.geometries = [feature.get("geometry") for feature in features]
+            return
+
+        ring_lengths = np.array([len(ring) for ring in rings])
+        ring_starts = np.concatenate([[0], np.cumsum(ring_lengths)[:-1]])
+        unique_points, point_ids = _point_ids(np.concatenate(rings))
+        is_junction = _find_junctions(point_ids, ring_starts, ring_lengths, len(unique_points))
+
+        arc_lookup: Dict[bytes, int] = {}
+        arc_point_ids: List[np.ndarray] = []
+
+        def add_arc(ids: np.ndarray) -> ArcRef:
+            key = ids.tobytes()
+            arc = arc_lookup.get(key)
+            if arc is not None:
+                return arc
+            arc = arc_lookup.get(ids[::-1].tobytes())
+            if arc is not None:
+                return ~arc
+            arc_lookup[key] = len(arc_point_ids)
+            arc_point_ids.append(ids)
+            return len(arc_point_ids) - 1
+
+        ring_arcs: List[List[ArcRef]] = []
+        for start, length in zip(ring_starts, ring_lengths):
+            ids = point_ids[start:start + length]
+            junctions = np.flatnonzero(is_junction[ids])
+            if len(junctions) == 0:
+                # No junctions, the whole ring is one closed arc. Start it at its smallest point id so the same ring
+                # seen from both sides (eg. a hole and the island that fills it) is the same arc
+                ids = np.roll(ids, -int(np.argmin(ids)))
+                ring_arcs.append([add_arc(np.append(ids, ids[0]))])
+                continue
+            ids = np.roll(ids, -int(junctions[0]))
+            cuts = np.append(junctions - junctions[0], length)
+            closed_ids = np.append(ids, ids[0])
+            ring_arcs.append([add_arc(closed_ids[cuts[i]:cuts[i + 1] + 1]) for i in range(len(cuts) - 1)])
+
+        self.arcs = [unique_points[ids] for ids in arc_point_ids]
+        for feature, polygons in zip(features, feature_polygons):
+            if polygons is None:
+                self.geometries.append(feature.get("geometry"))
+            elif feature["geometry"]["type"] == "Polygon":
+                self.geometries.append({"type": "Polygon", "arcs": [ring_arcs[ring] for ring in polygons[0]] if polygons else []})
+            else:
+                self.geometries.append({"type": "MultiPolygon", "arcs": [[ring_arcs[ring] for ring in polygon] for polygon in polygons]})
+
+    def compute_importance(self, min_tolerance: float = 0.0):
+        """
+        Run Douglas-Peucker once over every arc, after this any tolerance >= min_tolerance is a cheap mask.
+        """
+        self._importance = [douglas_peucker_importance(arc, min_tolerance) for arc in self.arcs]
+        self._min_tolerance = min_tolerance
+
+    def simplified_arcs(self, tolerance: float) -> List[np.ndarray]:
+        """
+        The arcs simplified to tolerance (in degrees), 0 for the full resolution arcs.
+        """
+        if tolerance <= 0:
+            return self.arcs
+        if self._importance is None or tolerance < self._min_tolerance:
+            self.compute_importance(tolerance)
+        return [arc[importance > tolerance] for arc, importance in zip(self.arcs, self._importance)]
+
+    @staticmethod
+    def ring_coordinates(arcs: List[np.ndarray], refs: List[ArcRef]) -> np.ndarray:
+        """
+        Stitch a ring back together from its arc references, the result is closed (first point == last point).
+        """
+        parts = []
+        for n, ref in enumerate(refs):
+            arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+            parts.append(arc if n == 0 else arc[1:])
+        return np.concatenate(parts)
+
+    def geometry(self, index: int, arcs: List[np.ndarray], full_arcs: Optional[List[np.ndarray]] = None) -> Optional[Dict[str, Any]]:
+        """
+        The geojson geometry of feature index, built from (simplified) arcs.
+
+        Holes that collapse below a valid ring are dropped, an exterior ring that collapses falls back to
+        full_arcs (it's a tiny polygon, so its full resolution ring is small anyway).
+        """
+        geometry = self.geometries[index]
+        if not geometry or "arcs" not in geometry:
+            return geometry
+        polygons = [geometry["arcs"]] if geometry["type"] == "Polygon" else geometry["arcs"]
+        coordinates = []
+        for polygon in polygons:
+            polygon_coordinates = []
+            for ring_number, refs in enumerate(polygon):
+                ring = self.ring_coordinates(arcs, refs)
+                if len(ring) < 4:
+                    if ring_number > 0 or full_arcs is None:
+                        continue
+                    ring = self.ring_coordinates(full_arcs, refs)
+                polygon_coordinates.append(ring.tolist())
+            if polygon_coordinates:
+                coordinates.append(polygon_coordinates)
+        if geometry["type"] == "Polygon":
+            return {"type": "Polygon", "coordinates": coordinates[0] if coordinates else []}
+        return {"type": "MultiPolygon", "coordinates": coordinates}
+
+    def to_topojson(self, features: List[Dict[str, Any]], arcs: List[np.ndarray], quantization: int = 100000,
+                    object_name: str = "coverage") -> Dict[str, Any]:
+        """
+        The features as a TopoJSON topology: the (simplified) shared arcs quantized to a quantization x quantization
+        grid over the data's bounds and delta encoded, and the geometries as arc references.
+
+        Points and MultiPoints are quantized (not delta encoded), any other non polygon geometry is written as a
+        null geometry (the coverage layer is all polygons).
+
+        :param features: The features the topology was built from
+        :param arcs: The arcs to write, eg. from simplified_arcs()
+        :param quantization: Number of distinct x and y values
+        :param object_name: Name of the GeometryCollection in "objects"
+        """
+        point_geometries = [geometry for geometry in self.geometries
+                            if geometry and geometry.get("type") in ("Point", "MultiPoint")]
+        all_points = [arc for arc in arcs if len(arc)]
+        all_points += [np.atleast_2d(np.asarray(geometry["coordinates"], dtype=float))[:, :2]
+                       for geometry in point_geometries if geometry["coordinates"]]
+        if all_points:
+            points = np.concatenate(all_points)
+            x0, y0 = points.min(axis=0)
+            x1, y1 = points.max(axis=0)
+        else:
+            x0 = y0 = 0.0
+            x1 = y1 = 1.0
+        kx = (x1 - x0) / (quantization - 1) or 1.0
+        ky = (y1 - y0) / (quantization - 1) or 1.0
+
+        def quantize(coordinates: np.ndarray) -> np.ndarray:
+            return np.column_stack([np.round((coordinates[:, 0] - x0) / kx), np.round((coordinates[:, 1] - y0) / ky)]).astype(np.int64)
+
+        encoded_arcs = []
+        for arc in arcs:
+            quantized = quantize(arc)
+            deltas = np.diff(quantized, axis=0)
+            # Points that land on the same grid cell as the previous one are dropped, an arc keeps at least its 2 ends
+            moved = np.any(deltas != 0, axis=1)
+            if not moved.any():
+                moved[-1] = True
+            encoded_arcs.append(np.vstack([quantized[:1], deltas[moved]]))
+
+        geometries = []
+        for feature, geometry in zip(features, self.geometries):
+            geometry_type = geometry.get("type") if geometry else None
+            if geometry_type in ("Polygon", "MultiPolygon") and "arcs" in geometry:
+                encoded = {"type": geometry_type, "arcs": geometry["arcs"]}
+            elif geometry_type == "Point" and geometry["coordinates"]:
+                encoded = {"type": "Point", "coordinates": quantize(np.asarray([geometry["coordinates"]], dtype=float))[0]}
+            elif geometry_type == "MultiPoint" and geometry["coordinates"]:
+                encoded = {"type": "MultiPoint", "coordinates": quantize(np.asarray(geometry["coordinates"], dtype=float))}
+            else:
+                encoded = {"type": None}
+            if "id" in feature:
+                encoded["id"] = feature["id"]
+            if feature.get("properties"):
+                encoded["properties"] = feature["properties"]
+            geometries.append(encoded)
+
+        return {
+            "type": "Topology",
+            "bbox": [float(x0), float(y0), float(x1), float(y1)],
+            "transform": {"scale": [kx, ky], "translate": [float(x0), float(y0)]},
+            "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+            "arcs": encoded_arcs,
+        }
@@ -0,0 +1,154 @@
+# Engagement bundle, computes several engagement views for one request off a single engagement query (and a single periodicity query).
+# The report page used to fire one request per view, each one re-querying mostly the same months.
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from crud import engagement_crud as eng_crud
+from models.engagement_schemas import EngagementBundleRequest
+
+from . import engagement_utils as eng_utils
+from . import engagement_views as eng_views
+
+
+def _month(month_str: str) -> date:
+    """ Parse a "MMMM YYYY" string to the first of the month. """
+    return datetime.strptime(month_str, "%B %Y").date()
+
+
+def _fiscal_month(month_date: date) -> int:
+    """ First of the month -> YYYYMM integer, the periodicity table's fiscalmonth. """
+    return month_date.year * 100 + month_date.month
+
+
+def _engagement_ranges(bundle: EngagementBundleRequest) -> List[Tuple[date, date]]:
+    """
+    The month ranges of engagement data each requested view needs.
+    """
+    ranges = []
+    for view in ("ytd", "mom", "over_time", "rank", "quarterly"):
+        dates = getattr(bundle, view)
+        if dates is not None:
+            ranges.append((_month(dates.start_month), _month(dates.end_month)))
+    if bundle.hev is not None:
+        ranges.append((_month(bundle.hev.prev_period_start), _month(bundle.hev.prev_period_end)))
+        # Matches the hev endpoint, the current period only uses its start month
+        curr_start = _month(bundle.hev.curr_period_start)
+        ranges.append((curr_start, curr_start))
+    return ranges
+
+
+def _periodicity_months(bundle: EngagementBundleRequest) -> List[int]:
+    """
+    The fiscal months of periodicity data the requested views need (only ytd and hev use periodicity).
+    """
+    months = []
+    if bundle.ytd is not None:
+        months += [_fiscal_month(_month(bundle.ytd.start_month)), _fiscal_month(_month(bundle.ytd.end_month))]
+    if bundle.hev is not None:
+        months += [_fiscal_month(_month(bundle.hev.prev_period_end)), _fiscal_month(_month(bundle.hev.curr_period_start))]
+    return months
+
+
+def run_engagement_views(db: Session, bundle: EngagementBundleRequest,
+                         on_view_done: Optional[Callable[[str, float], None]] = None) -> Tuple[Dict[str, eng_views.ViewResult], Dict[str, float]]:
+    """
+    Compute every view requested in the bundle.
+
+    The engagement data is queried once over the range covering all the views (with the FALSE tier only if ytd needs it)
+    and each view gets its own filtered copy. Periodicity is queried once over the months ytd and hev need.
+
+    :param db: Database session
+    :param bundle: The requested views and their dates
+    :param on_view_done: Optional callback, called with the view name and its seconds as each view finishes
+    :return: (views, timings), the (tables, metadata) of each view keyed by view name, and the fetch/per view timings in seconds
+    """
+    timings: Dict[str, float] = {}
+    ranges = _engagement_ranges(bundle)
+    covering_start = min(start for start, _ in ranges)
+    covering_end = max(end for _, end in ranges)
+
+    start_time = time.perf_counter()
+    all_engagement_df = eng_crud.get_engagement_data(db=db, start_month=covering_start.strftime("%Y-%m"),
+                                                     end_month=covering_end.strftime("%Y-%m"),
+                                                     networks=None, include_false_tier=bundle.ytd is not None)
+    timings["fetch_engagement"] = time.perf_counter() - start_time
+    # Every view but ytd excludes the FALSE tier
+    engagement_df = all_engagement_df[all_engagement_df['tiername'] != 'FALSE']
+
+    periodicity_months = _periodicity_months(bundle)
+    all_periodicity_df = None
+    if periodicity_months:
+        start_time = time.perf_counter()
+        all_periodicity_df = eng_crud.get_periodicity_data(db=db, multiple_months=True,
+                                                           start_month=min(periodicity_months), end_month=max(periodicity_months))
+        timings["fetch_periodicity"] = time.perf_counter() - start_time
+
+    def periodicity_between(start_month: int, end_month: int) -> pd.DataFrame:
+        return all_periodicity_df[all_periodicity_df['fiscalmonth'].between(start_month, end_month)].copy()
+
+    views: Dict[str, eng_views.ViewResult] = {}
+    for view in bundle.requested_views():
+        dates = getattr(bundle, view)
+        start_time = time.perf_counter()
+
+        if view == "ytd":
+            start_date, end_date = _month(dates.start_month), _month(dates.end_month)
+            view_tables, view_metadata = eng_views.build_ytd_view(
+                eng_utils.filter_month_range(all_engagement_df, start_date, end_date),
+                periodicity_between(_fiscal_month(start_date), _fiscal_month(end_date)), dates)
+
+        elif view == "mom":
+            view_tables, view_metadata = eng_views.build_mom_view(
+                eng_utils.filter_month_range(engagement_df, _month(dates.start_month), _month(dates.end_month)), dates)
+
+        elif view == "over_time":
+            view_tables, view_metadata = eng_views.build_over_time_view(
+                eng_utils.filter_month_range(engagement_df, _month(dates.start_month), _month(dates.end_month)))
+
+        elif view == "rank":
+            end_date = _month(dates.end_month)
+            view_tables, view_metadata = eng_views.build_rank_view(
+                eng_utils.filter_month_range(engagement_df, end_date, end_date),
+                eng_utils.filter_month_range(engagement_df, _month(dates.start_month), end_date), dates)
+
+        elif view == "hev":
+            prev_end_month = _fiscal_month(_month(dates.prev_period_end))
+            curr_start = _month(dates.curr_period_start)
+            view_tables, view_metadata = eng_views.build_hev_view(
+                eng_utils.filter_month_range(engagement_df, _month(dates.prev_period_start), _month(dates.prev_period_end)),
+                periodicity_between(prev_end_month, prev_end_month),
+                eng_utils.filter_month_range(engagement_df, curr_start, curr_start),
+                periodicity_between(_fiscal_month(curr_start), _fiscal_month(curr_start)), dates)
+
+        else:
+            view_tables, view_metadata = eng_views.build_quarterly_view(
+                eng_utils.filter_month_range(engagement_df, _month(dates.start_month), _month(dates.end_month)))
+
+        timings[view] = time.perf_counter() - start_time
+        views[view] = (view_tables, view_metadata)
+        if on_view_done is not None:
+            on_view_done(view, timings[view])
+
+    return views, timings
+
+
+def run_engagement_bundle(db: Session, bundle: EngagementBundleRequest) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]:
+    """
+    Compute every view requested in the bundle, see run_engagement_views.
+
+    :param db: Database session
+    :param bundle: The requested views and their dates
+    :return: (tables, metadata), tables of all the views keyed by table name, metadata with each view's metadata and the timings
+    """
+    views, timings = run_engagement_views(db, bundle)
+    tables: Dict[str, pd.DataFrame] = {}
+    for view_tables, _ in views.values():
+        tables.update(view_tables)
+
+    timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+    print(f"Engagement bundle ({', '.join(bundle.requested_views())}) timings: {timings}")
+    return tables, {"views": {view: view_metadata for view, (_, view_metadata) in views.items()}, "timings": timings}
@@ -73,6 +73,23 @@ def add_sorting_column(df:pd.DataFrame, sort_index_row:str = 'state', index_leve
         
     return df
 
+def filter_month_range(df:pd.DataFrame, start_date:datetime.date, end_date:datetime.date) -> pd.DataFrame:
+    """
+    Utility function to filter a dataframe with 'year' and 'month' columns down to the months between two dates (inclusive).
+    Used to cut a single wide query down to the range each view needs.
+
+    Parameters:
+    df (pd.DataFrame): The dataframe to filter, should contain a 'month' and 'year' column.
+    start_date (datetime.date): The first month to keep.
+    end_date (datetime.date): The last month to keep.
+
+    Returns:
+    pd.DataFrame: A copy of the rows between the two months.
+    """
+    year_month = df['year'] * 100 + df['month']
+    mask = (year_month >= start_date.year * 100 + start_date.month) & (year_month <= end_date.year * 100 + end_date.month)
+    return df[mask].copy()
+
 def map_quarter(row:pd.Series):
     """
     Utility function to map a given row to a quarter based of the month and year 
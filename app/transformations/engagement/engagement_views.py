@@ -0,0 +1,315 @@
+# The engagement "views", one per engagement endpoint. Each view takes the already queried dataframes and the request dates
+# and returns the tables the frontend displays, plus the metadata for the response.
+# These used to live inline in the endpoints, they're pulled out here so the bundle endpoint (and anything else) can run
+# several views off one shared query.
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+import pandas as pd
+
+from models.engagement_schemas import StartEndEngagement, StartPrevEndEngagement, HevPeriods
+
+from . import engagement_utils as eng_utils
+from . import ytd_engagement as ytd_transforms
+from . import mom_engagement as mom_transforms
+from . import over_time_engagement as over_time_transforms
+from . import rank_engagement as rank_transforms
+from . import special_rank_engagement as ovt_rank_transforms
+from . import hev_engagement as hev_transforms
+from . import quarterly_engagement as quarter_transforms
+from . import yearly_engagement as yearly_transforms
+from . import periodicity_engagement as periodicity_transforms
+
+# Tables returned by each view, keyed by table name
+ViewResult = Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]
+
+
+def build_ytd_view(engagement_df: pd.DataFrame, periodicity_df: pd.DataFrame, date_range: StartEndEngagement) -> ViewResult:
+    """
+    YTD tables (SN, Cable, Big 4).
+
+    :param engagement_df: Engagement data from start_month to end_month, INCLUDING the FALSE tier
+    :param periodicity_df: Periodicity data for every fiscal month from start_month to end_month
+    :param date_range: start_month is the beginning of the calendar year, end_month is the current month
+    """
+    engagement_df['fiscalmonth'] = engagement_df['year'].astype(str) + engagement_df['month'].astype(str).str.zfill(2)
+    engagement_df['fiscalmonth'] = engagement_df['fiscalmonth'].astype(int)
+    merged_df = pd.merge(engagement_df, periodicity_df,
+                     on=['fiscalmonth', 'network', 'specnewsmarket'],
+                     how='inner')
+
+    print(merged_df.head())
+    merged_df['hev'] = (merged_df['periodicity']/100) * merged_df['adjeng']
+
+    # Get the current month and foy date
+    curr_month_date = datetime.strptime(date_range.end_month, "%B %Y").date()
+    foy_date = datetime.strptime(date_range.start_month, "%B %Y").date()
+
+    # Filter by network group
+    df_ytd_sn = merged_df[merged_df['stn_grp'] == 'SN']
+    df_ytd_cable = merged_df[merged_df['stn_grp'] == 'Cable News']
+    df_ytd_big4 = merged_df[merged_df['stn_grp'] == 'Big 4']
+
+    # TODO: Parallelize these transformations
+    state_ytd_sn = ytd_transforms.pivot_ytd_engagement(df_ytd_sn, 'state', curr_month_date, foy_date)
+    market_ytd_sn = ytd_transforms.pivot_ytd_engagement(df_ytd_sn, 'clean_prg_name_all', curr_month_date, foy_date)
+    ytd_combined_sn = ytd_transforms.concatenate_ytd_state_market(state_ytd_sn, market_ytd_sn)
+
+    state_ytd_cable = ytd_transforms.pivot_ytd_engagement(df_ytd_cable, 'state', curr_month_date, foy_date)
+    market_ytd_cable = ytd_transforms.pivot_ytd_engagement(df_ytd_cable, 'clean_prg_name_all', curr_month_date, foy_date)
+    ytd_combined_cable = ytd_transforms.concatenate_ytd_state_market(state_ytd_cable, market_ytd_cable)
+
+    state_ytd_big4 = ytd_transforms.pivot_ytd_engagement(df_ytd_big4, 'state', curr_month_date, foy_date)
+    market_ytd_big4 = ytd_transforms.pivot_ytd_engagement(df_ytd_big4, 'clean_prg_name_all', curr_month_date, foy_date)
+    ytd_combined_big4 = ytd_transforms.concatenate_ytd_state_market(state_ytd_big4, market_ytd_big4)
+
+    print(ytd_combined_sn.head())
+    return ({"ytd_sn": ytd_combined_sn, "ytd_cable": ytd_combined_cable, "ytd_big4": ytd_combined_big4},
+            {'data_columns': ytd_combined_sn.columns.to_list()})
+
+
+def build_mom_view(engagement_df: pd.DataFrame, start_prev_end: StartPrevEndEngagement) -> ViewResult:
+    """
+    Month over month table.
+
+    :param engagement_df: Engagement data from start_month to end_month, without the FALSE tier
+    :param start_prev_end: start_month is 1 year before the current month, end_month is the current month
+    """
+    start_month_date = datetime.strptime(start_prev_end.start_month, "%B %Y")
+    end_month_date = datetime.strptime(start_prev_end.end_month, "%B %Y")
+    previous_month_date = datetime.strptime(start_prev_end.previous_month, "%B %Y")
+
+    # Filters and Transformations
+    prev_12_months_df = engagement_df[((engagement_df['year'] > start_month_date.year) |
+                            ((engagement_df['year'] == start_month_date.year) & (engagement_df['month'] >= start_month_date.month))) &
+                            ((engagement_df['year'] < previous_month_date.year) |
+                            ((engagement_df['year'] == previous_month_date.year) & (engagement_df['month'] <= previous_month_date.month)))]
+
+    # Previous Month DF
+    prev_month_df = engagement_df[(engagement_df['year'] == previous_month_date.year) & (engagement_df['month'] == previous_month_date.month)]
+
+    # Current Month DF
+    current_month_df = engagement_df[(engagement_df['year'] == end_month_date.year) & (engagement_df['month'] == end_month_date.month)]
+
+    # Now we want to pivot and concat each of the dataframes
+    mom_state_prev_12 = mom_transforms.pivot_MoM_state(prev_12_months_df)
+    mom_market_prev_12 = mom_transforms.pivot_MoM_market(prev_12_months_df)
+    mom_combined_prev_12 = mom_transforms.concat_MoM_state_market(mom_state_prev_12, mom_market_prev_12)
+
+    mom_state_prev = mom_transforms.pivot_MoM_state(prev_month_df)
+    mom_market_prev = mom_transforms.pivot_MoM_market(prev_month_df)
+    mom_combined_prev = mom_transforms.concat_MoM_state_market(mom_state_prev, mom_market_prev)
+
+    mom_state_current = mom_transforms.pivot_MoM_state(current_month_df)
+    mom_market_current = mom_transforms.pivot_MoM_market(current_month_df)
+    mom_combined_current = mom_transforms.concat_MoM_state_market(mom_state_current, mom_market_current)
+
+    # Finally we want to join the dataframes and rename the columns
+    mom_combined_final = mom_transforms.join_rename_MoM_columns(mom_combined_current, mom_combined_prev, mom_combined_prev_12,
+                                                 start_prev_end.end_month, start_prev_end.previous_month, start_prev_end.start_month).round(3).reset_index()
+
+    return {"mom_data": mom_combined_final}, {'mom_data_columns': mom_combined_final.columns.to_list()}
+
+
+def build_over_time_view(engagement_df: pd.DataFrame) -> ViewResult:
+    """
+    Over time tables (SN, Cable, Big 4).
+
+    :param engagement_df: Engagement data for the window (usually 2 years before the current month), without the FALSE tier
+    """
+    # Filter by stn_grp
+    df_overtime_sn = engagement_df[engagement_df['stn_grp'] == 'SN']
+    df_overtime_cable = engagement_df[engagement_df['stn_grp'] == 'Cable News']
+    df_overtime_big4 = engagement_df[engagement_df['stn_grp'] == 'Big 4']
+
+    # The data for each, for now I'm returning the full dataframes with both state and market level data
+    overtime_state_sn = over_time_transforms.pivot_overtime_state(df_overtime_sn)
+    overtime_market_sn = over_time_transforms.pivot_overtime_market(df_overtime_sn)
+    overtime_combined_sn = over_time_transforms.concat_overtime_state_market(overtime_state_sn, overtime_market_sn).round(3).reset_index()
+
+    overtime_state_cable = over_time_transforms.pivot_overtime_state(df_overtime_cable)
+    overtime_market_cable = over_time_transforms.pivot_overtime_market(df_overtime_cable)
+    overtime_combined_cable = over_time_transforms.concat_overtime_state_market(overtime_state_cable, overtime_market_cable).round(3).reset_index()
+
+    overtime_state_big4 = over_time_transforms.pivot_overtime_state(df_overtime_big4)
+    overtime_market_big4 = over_time_transforms.pivot_overtime_market(df_overtime_big4)
+    overtime_combined_big4 = over_time_transforms.concat_overtime_state_market(overtime_state_big4, overtime_market_big4).round(3).reset_index()
+
+    return ({"overtime_sn_data": overtime_combined_sn,
+             "overtime_cable_data": overtime_combined_cable,
+             "overtime_big4_data": overtime_combined_big4},
+            {'data_columns': overtime_combined_sn.columns.to_list()})
+
+
+def build_rank_view(curr_engagement_df: pd.DataFrame, engagement_df: pd.DataFrame, date_range: StartEndEngagement) -> ViewResult:
+    """
+    Rank tables, the current period rank and the pivoted rank over time (tab 2 in the rank feature).
+
+    :param curr_engagement_df: Engagement data for the current month (end_month) only, without the FALSE tier
+    :param engagement_df: Engagement data from start_month to end_month, without the FALSE tier
+    :param date_range: start_month is 7 months before the current month, end_month is the current month
+    """
+    curr_month_date = datetime.strptime(date_range.end_month, "%B %Y")
+    start_month_date = datetime.strptime(date_range.start_month, "%B %Y")
+
+    ### DATAFRAME 1 -> Current period rank with competitors ##############
+    state_df = rank_transforms.pivot_rank_state(curr_engagement_df)
+    market_df = rank_transforms.pivot_rank_market(curr_engagement_df)
+    combined_df = rank_transforms.concat_rank_state_market(state_df, market_df).round(3).reset_index()
+
+    ### DATAFRAME 2 -> Pivoted rank over time for tab 2 in the rank feature ##########
+    result_df = ovt_rank_transforms.calculate_rank_overtime(engagement_df, start_month_date, curr_month_date)
+
+    return {"rank_current_period": combined_df, "rank_over_time": result_df}, {'Testing': 'Testing'}
+
+
+def build_hev_view(prev_engagement_df: pd.DataFrame, prev_periodicity_df: pd.DataFrame,
+                   curr_engagement_df: pd.DataFrame, curr_periodicity_df: pd.DataFrame, hev_periods: HevPeriods) -> ViewResult:
+    """
+    HEV table, current vs previous period.
+
+    :param prev_engagement_df: Engagement data for the previous period, without the FALSE tier
+    :param prev_periodicity_df: Periodicity for the fiscal month at the end of the previous period
+    :param curr_engagement_df: Engagement data for the current period, without the FALSE tier
+    :param curr_periodicity_df: Periodicity for the fiscal month at the start of the current period
+    :param hev_periods: The two periods
+    """
+    ################### PREVIOUS PERIOD ###################
+    # For previous periodicity, we want to include all networks
+    prev_periodicity_df['network'] = prev_periodicity_df['network'].replace('FOX NEWS', 'FOX NEWS CHANNEL')
+    prev_periodicity_df = prev_periodicity_df.drop(columns=['fiscalmonth' ])
+
+    # We join the two dataframes on the specnewsmarket column, create the HEV_PREV column
+    df_prev = pd.merge(prev_engagement_df, prev_periodicity_df, on=['specnewsmarket','network'], how='left')
+    df_prev['HEV'] = (df_prev['periodicity']/100) * df_prev['adjeng']
+
+    # Apply Transformations
+    pt_hev_prev_market = hev_transforms.pivot_HEV_market(df_prev)
+    pt_hev_prev_state = hev_transforms.pivot_HEV_state(df_prev)
+    pt_hev_prev = hev_transforms.concat_HEV_state_market(pt_hev_prev_state, pt_hev_prev_market)
+
+    ################### CURRENT PERIOD #########################
+    # Clean up the dataframes
+    # For the current periodicity, we only want to include SPECNEWS
+    curr_periodicity_df['network'] = curr_periodicity_df['network'].replace('FOX NEWS', 'FOX NEWS CHANNEL')
+    curr_periodicity_df = curr_periodicity_df.loc[curr_periodicity_df['network'] == 'SPECNEWS']
+    curr_periodicity_df = curr_periodicity_df.drop(columns=['fiscalmonth', 'network'])
+
+    # We join the two dataframes on the specnewsmarket column, create the HEV_CURR column,
+    df_curr = pd.merge(curr_engagement_df, curr_periodicity_df, on='specnewsmarket', how='left')
+    df_curr['HEV'] = (df_curr['periodicity']/100) * df_curr['adjeng']
+
+    # Apply Transformations
+    pt_hev_curr_market = hev_transforms.pivot_HEV_market(df_curr)
+    pt_hev_curr_state = hev_transforms.pivot_HEV_state(df_curr)
+    pt_hev_curr = hev_transforms.concat_HEV_state_market(pt_hev_curr_state, pt_hev_curr_market)
+
+    #################### COMBINE PERIODS ######################
+    # Calculate the change in HEV between periods
+    pt_hev_change = pt_hev_curr[['Big 4', 'Cable News', 'SN']] - pt_hev_prev[['Big 4', 'Cable News', 'SN']]
+
+    # Combine the dataframes and use the dates to create column names
+    hev_combined_final = hev_transforms.join_re_order_HEV_columns(pt_hev_curr, pt_hev_prev, pt_hev_change,
+                                                   hev_periods.curr_period_start, hev_periods.curr_period_end,
+                                                   hev_periods.prev_period_start, hev_periods.prev_period_end).round(3).reset_index()
+
+    return {'hev_data': hev_combined_final}, {'columns': hev_combined_final.columns.to_list()}
+
+
+def build_quarterly_view(engagement_df: pd.DataFrame) -> ViewResult:
+    """
+    Yearly and quarterly tables, by market and network totals.
+
+    :param engagement_df: Engagement data for the date range, without the FALSE tier
+    """
+    df_year = engagement_df.copy()
+
+    # Filter the data
+    df_yearly_sn = df_year[df_year['stn_grp'] == 'SN']
+    df_yearly_cable = df_year[df_year['stn_grp'] == 'Cable News']
+    df_yearly_big4 = df_year[df_year['stn_grp'] == 'Big 4']
+
+    # Pivot the data
+    yearly_state_sn = yearly_transforms.pivot_yearly_state(df_yearly_sn)
+    yearly_market_sn = yearly_transforms.pivot_yearly_market(df_yearly_sn)
+    yearly_combined_sn = yearly_transforms.concat_yearly_state_market(yearly_state_sn, yearly_market_sn).round(3).reset_index()
+
+    yearly_state_cable = yearly_transforms.pivot_yearly_state(df_yearly_cable)
+    yearly_market_cable = yearly_transforms.pivot_yearly_market(df_yearly_cable)
+    yearly_combined_cable = yearly_transforms.concat_yearly_state_market(yearly_state_cable, yearly_market_cable).round(3).reset_index()
+
+    yearly_state_big4 = yearly_transforms.pivot_yearly_state(df_yearly_big4)
+    yearly_market_big4 = yearly_transforms.pivot_yearly_market(df_yearly_big4)
+    yearly_combined_big4 = yearly_transforms.concat_yearly_state_market(yearly_state_big4, yearly_market_big4).round(3).reset_index()
+
+    yearly_network_totals = yearly_transforms.concat_network_totals(yearly_combined_sn, yearly_combined_big4,yearly_combined_cable).round(3).reset_index(drop=True)
+
+    # Add the quarter column,, make a copy for good practice
+    engagement_df['quarter'] = engagement_df.apply(eng_utils.map_quarter, axis=1)
+    df_quarter = engagement_df.copy()
+
+    # Filter out each network group
+    df_quarter_sn = df_quarter[df_quarter['stn_grp'] == 'SN']
+    df_quarter_cable = df_quarter[df_quarter['stn_grp'] == 'Cable News']
+    df_quarter_big4 = df_quarter[df_quarter['stn_grp'] == 'Big 4']
+
+    print(df_quarter_sn.head())
+    # Pivot the data TODO: refactor this to be asyncronous/parallelized
+    # We pivot by both state and market level and then we conatenate the two
+    quarter_state_sn = quarter_transforms.pivot_quarter_state(df_quarter_sn)
+    quarter_market_sn = quarter_transforms.pivot_quarter_market(df_quarter_sn)
+    quarter_combined_sn = quarter_transforms.concat_quarter_state_market(quarter_state_sn, quarter_market_sn).round(3).reset_index()
+
+    quarter_state_cable = quarter_transforms.pivot_quarter_state(df_quarter_cable)
+    quarter_market_cable = quarter_transforms.pivot_quarter_market(df_quarter_cable)
+    quarter_combined_cable = quarter_transforms.concat_quarter_state_market(quarter_state_cable, quarter_market_cable).round(3).reset_index()
+
+    quarter_state_big4 = quarter_transforms.pivot_quarter_state(df_quarter_big4)
+    quarter_market_big4 = quarter_transforms.pivot_quarter_market(df_quarter_big4)
+    quarter_combined_big4 = quarter_transforms.concat_quarter_state_market(quarter_state_big4, quarter_market_big4).round(3).reset_index()
+
+    # Combine the totals for each network
+    quarter_network_totals = quarter_transforms.concat_network_totals(quarter_combined_sn, quarter_combined_big4,quarter_combined_cable).round(3).reset_index(drop=True)
+
+    tables = {
+        # Yearly Dataframes
+        "yearly_sn": yearly_combined_sn,
+        "yearly_cable": yearly_combined_cable,
+        "yearly_big4": yearly_combined_big4,
+        "yearly_network_totals": yearly_network_totals,
+        # Quarterly Dataframes
+        "quarter_sn": quarter_combined_sn,
+        "quarter_cable": quarter_combined_cable,
+        "quarter_big4": quarter_combined_big4,
+        "quarter_network_totals": quarter_network_totals
+    }
+    # Grab the columns for the metadata? Unsure if this is really neccesary but is good practice to return metade
+    metadata = {
+        "by_market_table_columns_quarterly": quarter_combined_sn.columns.to_list(),
+        "network_totals_columns_quarterly": quarter_network_totals.columns.to_list(),
+        "by_market_table_columns_yearly": yearly_combined_sn.columns.to_list(),
+        "network_totals_columns_yearly": yearly_network_totals.columns.to_list()
+    }
+    return tables, metadata
+
+
+def build_periodicity_history_view(periodicity_df: pd.DataFrame) -> ViewResult:
+    """
+    Periodicity history tables (SN, Big 4, Cable).
+
+    :param periodicity_df: Periodicity history (with region/state/market) for the date range
+    """
+    periodicity_df['fiscalmonth'] = periodicity_df['fiscalmonth'].astype(float)
+    # Apply transformations
+    periodicity_df_sn = periodicity_df[periodicity_df['network'] == 'SPECNEWS']
+    periodicity_df_sn = periodicity_transforms.pivot_concat_periodicity_history(periodicity_df_sn).reset_index().round(3)
+    print(periodicity_df_sn.head())
+    periodicity_df_big4 = periodicity_df[periodicity_df['network'].isin(['ABC', 'FOX', 'NBC', 'CBS'])]
+    periodicity_df_big4 = periodicity_transforms.pivot_concat_periodicity_history(periodicity_df_big4).reset_index().round(3)
+
+    periodicity_df_cable = periodicity_df[periodicity_df['network'].isin(['CNN', 'MSNBC','FOX NEWS'])]
+    periodicity_df_cable = periodicity_transforms.pivot_concat_periodicity_history(periodicity_df_cable).reset_index().round(3)
+
+    return ({"periodicity_history_sn": periodicity_df_sn, "periodicity_history_big4": periodicity_df_big4,
+             "periodicity_history_cable": periodicity_df_cable},
+            {'periodicity_columns': periodicity_df_sn.columns.to_list()})
@@ -0,0 +1,198 @@
+# Warm-up of the default engagement views.
+# The first user after a deploy (or after new data is loaded) used to pay the full query and pivot cost for the
+# default dashboard ranges. Those ranges are predictable from the latest month of data, so a background thread
+# computes them on startup, and again whenever the data version changes, and keeps them in an in process cache.
+import threading
+import time
+from contextlib import AbstractContextManager
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from crud import engagement_crud as eng_crud
+from models.engagement_schemas import EngagementBundleRequest, StartEndEngagement, StartPrevEndEngagement, HevPeriods
+
+from .engagement_bundle import run_engagement_views
+from .engagement_views import ViewResult
+
+
+class EngagementViewCache:
+    """
+    Thread safe cache of computed views, keyed on view name + the request dates. Holds the views of one data version,
+    it's cleared when the version changes. With ttl_seconds the views also stop being served that long after they
+    were cached (in case a load doesn't change the data version), the warm-up then computes them again.
+    """
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._views: Dict[Hashable, ViewResult] = {}
+        self.data_version: Optional[str] = None
+        self.ttl_seconds = ttl_seconds
+        self._reset_at = time.monotonic()
+
+    @staticmethod
+    def _key(view: str, request: BaseModel) -> Hashable:
+        return view, tuple(sorted(request.model_dump().items()))
+
+    def expired(self) -> bool:
+        """ True once the cached views are older than ttl_seconds. """
+        return self.ttl_seconds is not None and time.monotonic() - self._reset_at > self.ttl_seconds
+
+    def get(self, view: str, request: BaseModel) -> Optional[ViewResult]:
+        with self._lock:
+            if self.expired():
+                return None
+            return self._views.get(self._key(view, request))
+
+    def put(self, view: str, request: BaseModel, result: ViewResult):
+        with self._lock:
+            self._views[self._key(view, request)] = result
+
+    def reset(self, data_version: Optional[str]):
+        """
+        Drop every cached view and start caching for data_version.
+        """
+        with self._lock:
+            self._views.clear()
+            self.data_version = data_version
+            self._reset_at = time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._views)
+
+
+engagement_view_cache = EngagementViewCache()
+
+
+def _add_months(month_date: date, months: int) -> date:
+    month_index = month_date.year * 12 + month_date.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _month_str(month_date: date) -> str:
+    return month_date.strftime("%B %Y")
+
+
+def default_engagement_bundle(latest_month: date, rank_months_back: int = 7, over_time_months_back: int = 24) -> EngagementBundleRequest:
+    """
+    The date ranges the dashboard opens with, derived from the latest month of data.
+
+    - ytd: January of the latest year to the latest month
+    - mom: 1 year back, the prior month and the latest month
+    - over_time: over_time_months_back months back to the latest month
+    - rank: rank_months_back months back to the latest month
+    - hev: the latest month against the same month a year ago
+    """
+    latest = date(latest_month.year, latest_month.month, 1)
+    year_ago = _add_months(latest, -12)
+    return EngagementBundleRequest(
+        ytd=StartEndEngagement(start_month=_month_str(date(latest.year, 1, 1)), end_month=_month_str(latest)),
+        mom=StartPrevEndEngagement(start_month=_month_str(year_ago), previous_month=_month_str(_add_months(latest, -1)),
+                                   end_month=_month_str(latest)),
+        over_time=StartEndEngagement(start_month=_month_str(_add_months(latest, -over_time_months_back)), end_month=_month_str(latest)),
+        rank=StartEndEngagement(start_month=_month_str(_add_months(latest, -rank_months_back)), end_month=_month_str(latest)),
+        hev=HevPeriods(curr_period_start=_month_str(latest), curr_period_end=_month_str(latest),
+                       prev_period_start=_month_str(year_ago), prev_period_end=_month_str(year_ago)),
+    )
+
+
+class EngagementWarmup:
+    """
+    Background warm-up of the default views. Polls the data version every poll_seconds and re-warms the cache when it changes.
+    The status (progress, per view timings, errors) is kept for the warmup status endpoint.
+    """
+    def __init__(self, cache: EngagementViewCache = engagement_view_cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {
+            "state": "idle", "data_version": None, "latest_month": None, "views_total": 0, "views_done": 0,
+            "views": {}, "timings": {}, "started_at": None, "finished_at": None, "last_checked_at": None, "error": None,
+        }
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status, views=dict(self._status["views"]), timings=dict(self._status["timings"]))
+        status["cached_views"] = len(self.cache)
+        return status
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+
+    def warm(self, db: Session, data_version: str, rank_months_back: int = 7, over_time_months_back: int = 24):
+        """
+        Compute the default views off one shared fetch and cache them for data_version.
+        """
+        latest_month = eng_crud.get_engagement_data_range(db)["most_current_month"]
+        bundle = default_engagement_bundle(latest_month, rank_months_back, over_time_months_back)
+        requested_views = bundle.requested_views()
+        self._update(state="running", data_version=data_version, latest_month=latest_month.strftime("%Y-%m"),
+                     views_total=len(requested_views), views_done=0, error=None, timings={},
+                     views={view: "pending" for view in requested_views},
+                     started_at=datetime.now().isoformat(timespec="seconds"), finished_at=None)
+        start_time = time.perf_counter()
+
+        def on_view_done(view: str, seconds: float):
+            with self._lock:
+                self._status["views"][view] = "done"
+                self._status["views_done"] += 1
+                self._status["timings"][view] = round(seconds, 4)
+
+        views, timings = run_engagement_views(db, bundle, on_view_done=on_view_done)
+
+        # Swap in the new views all at once so requests never see a half warmed version
+        self.cache.reset(data_version)
+        for view, result in views.items():
+            self.cache.put(view, getattr(bundle, view), result)
+
+        self._update(state="done", timings={name: round(seconds, 4) for name, seconds in timings.items()},
+                     finished_at=datetime.now().isoformat(timespec="seconds"))
+        print(f"Engagement warm-up of {len(views)} views for data version {data_version} took {time.perf_counter() - start_time:.4f} seconds.")
+
+    def check(self, session_factory: Callable[[], AbstractContextManager], **warm_kwargs):
+        """
+        Warm the cache if the data version changed since the last warm-up, or the cached views are past their ttl.
+        """
+        with session_factory() as db:
+            data_version = eng_crud.get_engagement_data_version(db)
+            self._update(last_checked_at=datetime.now().isoformat(timespec="seconds"))
+            if data_version != self.cache.data_version or self.cache.expired():
+                # Stale views are dropped straight away, requests compute as normal until the warm-up finishes
+                self.cache.reset(None)
+                self.warm(db, data_version, **warm_kwargs)
+
+    def start(self, session_factory: Callable[[], AbstractContextManager], poll_seconds: int = 300,
+              view_ttl_seconds: Optional[float] = None, **warm_kwargs):
+        """
+        Start the background thread, warms straight away and then polls the data version.
+
+        :param session_factory: Returns a context manager that yields a database session
+        :param poll_seconds: Seconds between data version checks
+        :param view_ttl_seconds: Max age of the cached views (the cache's ttl_seconds), None to keep them until the version changes
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.cache.ttl_seconds = view_ttl_seconds
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.check(session_factory, **warm_kwargs)
+                except Exception as e:
+                    print(f"Engagement warm-up failed: {e}")
+                    self._update(state="failed", error=str(e), finished_at=datetime.now().isoformat(timespec="seconds"))
+                self._stop.wait(poll_seconds)
+
+        self._thread = threading.Thread(target=run, name="engagement-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+engagement_warmup = EngagementWarmup()
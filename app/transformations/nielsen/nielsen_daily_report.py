@@ -1,72 +1,175 @@
 import io
+import multiprocessing
+import os
 from . import nielsen_daily_report_funcs as report_utils
 
+def _as_source(content):
+    # Bytes of an excel file, or an already read sheet which the cleaning functions take as is
+    return io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+
+def build_benchmark_cache(report_config, benchmark_storage, benchmark_15min_info, benchmark_daypart_info):
+    """
+    Clean the benchmark files and cache the result (see benchmark_cache), called when new benchmarks are uploaded
+    so the first report doesn't have to.
+    """
+    report_utils.load_cleaned_benchmarks(benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                                         **report_config.cleaning_mappings)
+
+def _no_progress(stage, **details):
+    pass
+
+def _clean_daily_files(daily_15min_content, daily_daypart_content, cleaning_mappings):
+    # One day's files cleaned, run on the pool when there are several days
+    daily_15min_df = report_utils.clean_15min_data(_as_source(daily_15min_content),
+                                                   cleaning_mappings['station_network_mapping'],
+                                                   cleaning_mappings['fifteen_min_order_mapping'],
+                                                   cleaning_mappings['dma_name_mapping'])
+    daily_daypart_df = report_utils.clean_daypart_data(_as_source(daily_daypart_content),
+                                                       cleaning_mappings['station_network_mapping'],
+                                                       cleaning_mappings['daypart_order_mapping'],
+                                                       cleaning_mappings['dma_name_mapping'])
+    dateofdata = str(daily_15min_df['Dates'].unique()[0])
+    return dateofdata, daily_15min_df, daily_daypart_df
+
+def _load_benchmarks(db, dateofdata, benchmark_source, benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                     cleaning_mappings):
+    benchmarks = None
+    if benchmark_source == 'history':
+        benchmarks = report_utils.load_history_benchmarks(db, dateofdata, cleaning_mappings['daypart_order_mapping'])
+    if benchmarks is None:
+        if benchmark_15min_info is None or benchmark_daypart_info is None:
+            raise ValueError(f'No benchmark for {dateofdata}: not enough stored daily data and no benchmark files uploaded')
+        # The uploaded benchmarks only change monthly, they're cleaned once and cached
+        benchmarks = report_utils.load_cleaned_benchmarks(benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                                                          **cleaning_mappings)
+    return benchmarks
+
 def generate_nielsen_daily_report(db, user_email, 
-                                benchmark_15min_content, benchmark_daypart_content,
-                                daily_15min_content, daily_daypart_content):
+                                benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                                daily_15min_content, daily_daypart_content, upload_to_db=False,
+                                benchmark_source='upload', progress=None, workspace=None, report_config=None):
     """
     Generate a Nielsen daily report.
+    The benchmarks are the latest benchmark files in benchmark_storage, their cleaned frames are cached there.
+    With benchmark_source 'history' they're computed from the stored daily data of the previous month instead
+    (the benchmark files, if given, are the fallback when not enough of the month is stored).
+    The daily file arguments are the excel files' bytes, or the sheets already read (read_nielsen_sheet), eg. from the upload store.
+    With upload_to_db the cleaned daily data is saved to the daily Nielsen tables.
+    report_config is the mappings and report details (NielsenConfigSnapshot.get), read from db when not given.
     """
-    print('Reading mappings from database->',end = ' ')
-    # Read the 6 data mappings from the config file, can async these later
-    dma_name_mapping = report_utils.get_dma_name_mapping_dict(db)
-    dma_penetration_mapping = report_utils.get_dma_penetration_mapping_dict(db)   
-    fifteen_min_order_mapping = report_utils.get_fifteen_min_order_mapping_dict(db)
-    daypart_order_mapping = report_utils.get_daypart_order_mapping_dict(db)
-    spectrum_station_names_mapping = report_utils.get_spectrum_station_names_dict(db)
-    station_network_mapping = report_utils.get_station_network_mapping_dict(db)
-    print('Done.')
+    return generate_nielsen_daily_reports(db, user_email, benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                                          [(daily_15min_content, daily_daypart_content)], upload_to_db=upload_to_db,
+                                          benchmark_source=benchmark_source, progress=progress, workspace=workspace,
+                                          report_config=report_config)
 
-    print('Reading report details from database ->',end = ' ')
-    # Read the report details from the database
-    # Have to get the subject_line_ids from the database first
-    subject_line_ids = report_utils.get_subject_line_ids(db)
-    # We can async these later calls later:
-    subject_lines = report_utils.get_subject_lines(db)
-    report_notes = report_utils.get_report_notes(db, subject_line_ids)
-    report_recipients = report_utils.get_report_recipients(db, subject_line_ids)
-    report_dma_lists = report_utils.get_report_dma_lists(db, subject_line_ids)
-    print('Done.')
+def generate_nielsen_daily_reports(db, user_email,
+                                   benchmark_storage, benchmark_15min_info, benchmark_daypart_info,
+                                   daily_files, upload_to_db=False,
+                                   benchmark_source='upload', progress=None, workspace=None, report_config=None):
+    """
+    Generate the Nielsen daily reports of several dates at once (eg. regenerating the days after a holiday),
+    see generate_nielsen_daily_report.
+    The mappings, report details (report_config) and benchmarks are read once, the days are cleaned in parallel and the charts and
+    tables of every day and DMA are rendered on one pool.
 
-    # Clean the data
-    print('Reading in and cleaning data ->',end = ' ')
-    benchmark_15min_df = report_utils.clean_15min_data(io.BytesIO(benchmark_15min_content), 
-                                                            station_network_mapping, fifteen_min_order_mapping, dma_name_mapping)
-    daily_15min_df = report_utils.clean_15min_data(io.BytesIO(daily_15min_content), 
-                                                            station_network_mapping, fifteen_min_order_mapping, dma_name_mapping)
-
-    benchmark_daypart_df = report_utils.clean_daypart_data(io.BytesIO(benchmark_daypart_content), 
-                                                            station_network_mapping, daypart_order_mapping,  dma_name_mapping)
-    daily_daypart_df = report_utils.clean_daypart_data(io.BytesIO(daily_daypart_content), 
-                                                            station_network_mapping, daypart_order_mapping, dma_name_mapping)
-    print('Done.')
-    # Add logic here to save this data to our database, can call another service
-    #TODO: ADD LOGIC TO SAVE NIELSEN DATA TO DAILY NIELSEN DATABASE
+    :param daily_files: (daily_15min_content, daily_daypart_content) per date
+    :return: The eml file paths of every date, in date order
+    """
+    progress = progress or _no_progress
 
-    # Now we can generate the report, first we create a directory to store the images
-    print('Preparing to generate images, grabbing daily date, creating image directory, retrieving unique DMAs ->',end = ' ')
-    dateofdata = str(daily_15min_df['Dates'].unique()[0])
-    img_dump_path = report_utils.create_image_directory(user_email) 
+    progress('config')
+    print('Reading report config ->',end = ' ')
+    # The mappings and report details (subject lines, notes, recipients, dma lists), in memory unless they changed
+    if report_config is None:
+        report_config = report_utils.load_report_config(db)
+    cleaning_mappings = report_config.cleaning_mappings
+    report_dma_lists = report_config.report_dma_lists
     uniquedmas = {x for i in report_dma_lists for x in i}
-    print('Done.')
+    print(f'Done. (config v{report_config.version})')
 
-    # Create the html and image objects for each DMA
-    print('Generating image objects ->',end = ' ')
+    # One pool for the whole run, it cleans the days and renders every day's images
+    pool = multiprocessing.Pool()
+    try:
+        # Clean the data
+        progress('cleaning', total=len(daily_files))
+        print('Reading in and cleaning data ->',end = ' ')
+        clean_args = [(daily_15min_content, daily_daypart_content, cleaning_mappings)
+                      for daily_15min_content, daily_daypart_content in daily_files]
+        if len(clean_args) == 1:
+            cleaned_days = [_clean_daily_files(*clean_args[0])]
+        else:
+            cleaned_days = pool.starmap(_clean_daily_files, clean_args)
+        cleaned_days.sort(key=lambda day: report_utils.parse_data_date(day[0]))
+        dates = [dateofdata for dateofdata, _, _ in cleaned_days]
+        if len(set(dates)) != len(dates):
+            raise ValueError(f'Each date can only be given once, got {dates}')
+        print('Done.')
+
+        # Save the cleaned daily data to the daily Nielsen tables (replaces the date if it was saved before)
+        if upload_to_db:
+            progress('saving')
+            for dateofdata, daily_15min_df, daily_daypart_df in cleaned_days:
+                print(f'Saving daily data for {dateofdata} to database ->',end = ' ')
+                try:
+                    saved_rows = report_utils.save_daily_nielsen_data(db, dateofdata, daily_15min_df, daily_daypart_df)
+                    print(f'Done. {saved_rows}')
+                except Exception as e:
+                    # The report still goes out, the date can be saved again later
+                    print(f'WARNING!! Saving the daily data for {dateofdata} failed: {e}')
+
+        # The benchmarks, computed from the stored daily data or from the uploaded benchmark files.
+        # Days of the same month share their benchmark (the previous month's), each is loaded once
+        progress('benchmarks')
+        print('Loading benchmarks ->',end = ' ')
+        benchmarks_by_key = {}
+        benchmarks_by_date = {}
+        for dateofdata in dates:
+            key = report_utils.benchmark_month(report_utils.parse_data_date(dateofdata)) if benchmark_source == 'history' else None
+            if key not in benchmarks_by_key:
+                benchmarks_by_key[key] = _load_benchmarks(db, dateofdata, benchmark_source, benchmark_storage,
+                                                          benchmark_15min_info, benchmark_daypart_info, cleaning_mappings)
+            benchmarks_by_date[dateofdata] = benchmarks_by_key[key]
+        print('Done.')
+
+        # Now we can generate the reports, first we create a directory to store the images (a folder per date,
+        # the image names are per DMA)
+        print('Preparing to generate images, creating image directories ->',end = ' ')
+        img_dump_path = report_utils.create_image_directory(user_email, workspace) 
+        dma_tasks_by_date = {}
+        for dateofdata, daily_15min_df, daily_daypart_df in cleaned_days:
+            date_img_path = os.path.join(img_dump_path, dateofdata.replace('/', '-')) + '/'
+            os.makedirs(date_img_path, exist_ok=True)
+            benchmark_15min_df, benchmark_daypart_df = benchmarks_by_date[dateofdata]
+            dma_tasks_by_date[dateofdata] = report_utils.dma_tasks(uniquedmas, date_img_path,
+                                                                   benchmark_15min_df, benchmark_daypart_df,
+                                                                   daily_15min_df, daily_daypart_df,
+                                                                   report_config.spectrum_station_names_mapping,
+                                                                   report_config.dma_penetration_mapping)
+        print('Done.')
+
+        # Create the html and image objects for each date and DMA
+        progress('images', total=len(uniquedmas) * len(dates))
+        print('Generating image objects ->',end = ' ')
+        rendered = report_utils.render_dma_html(pool, dma_tasks_by_date, progress=progress)
+        print('Done.')
+    finally:
+        pool.close()
+        pool.join()
 
-    dma_html_dict, chart_path_dict, table_path_dict = report_utils.create_dma_html(uniquedmas, img_dump_path, 
-                                                                                   benchmark_15min_df, benchmark_daypart_df,
-                                                                                   daily_15min_df, daily_daypart_df,
-                                                                          spectrum_station_names_mapping, dma_penetration_mapping)
-    print('Done.')
     print('Creating eml directory ->',end = ' ')
-    eml_dump_path = report_utils.create_eml_directory(user_email)
+    eml_dump_path = report_utils.create_eml_directory(user_email, workspace)
     print('Done.')
 
+    progress('emails')
     print('Creating Emails ->',end = ' ')
-    eml_file_paths = report_utils.create_nielsen_daily_emails(report_dma_lists, user_email, dateofdata,
-                                             subject_lines, report_notes, report_recipients,
-                                             dma_html_dict, chart_path_dict, table_path_dict,
-                                             eml_dump_path)
+    eml_file_paths = []
+    for dateofdata in dates:
+        dma_html_dict, chart_path_dict, table_path_dict = rendered[dateofdata]
+        eml_file_paths += report_utils.create_nielsen_daily_emails(report_dma_lists, user_email, dateofdata,
+                                                 report_config.subject_lines, report_config.report_notes,
+                                                 report_config.report_recipients,
+                                                 dma_html_dict, chart_path_dict, table_path_dict,
+                                                 eml_dump_path)
     print('Done.')
 
-    return eml_file_paths
\ No newline at end of file
+    return eml_file_paths
@@ -6,15 +6,24 @@ from .get_mappings import get_daypart_order_mapping_dict, get_spectrum_station_n
 
 from .get_report_details import get_subject_line_ids, get_subject_lines, get_report_notes, get_report_recipients, get_report_dma_lists
 
+# The whole report configuration in memory
+from .report_config import NielsenConfigSnapshot, NielsenReportConfig, load_report_config
+
 # Data cleaning 
 from .clean_15min_data import clean_15min_data
 from .clean_daypart_data import clean_daypart_data
+from .data_cleaning_utils import read_nielsen_sheet
+from .benchmark_cache import load_cleaned_benchmarks
+
+# Saving the cleaned daily data
+from .save_daily_data import save_daily_nielsen_data, parse_data_date
+from .history_benchmark import load_history_benchmarks, benchmark_month
 
 # Path utils
-from .path_utils import create_image_directory, create_eml_directory
+from .path_utils import create_image_directory, create_eml_directory, remove_report_directories
 
 # Creating the image objects and dma strings
-from .create_dma import create_dma_html
+from .create_dma import create_dma_html, dma_tasks, render_dma_html
 
 # Creating the eml files
 from .create_eml_files import create_nielsen_daily_emails
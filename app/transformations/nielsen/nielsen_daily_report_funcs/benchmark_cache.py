@@ -0,0 +1,99 @@
+# Cleaned benchmark frames, built once per benchmark file instead of on every report.
+# Benchmarks change about once a month, but every report used to read both benchmark workbooks and clean them again.
+# The cleaned frames (15min with its moving averages already computed, dayparts pivoted) are stored next to the
+# benchmark files, keyed on the benchmark file's ETag and a fingerprint of the mappings used to clean it, so a new
+# benchmark file or a mapping change builds a new entry and the old one is never read again.
+import hashlib
+import io
+import re
+from typing import Tuple
+
+import orjson
+import pandas as pd
+
+from utils.storage import ObjectInfo, ObjectNotFound, ObjectStorage
+from utils.upload_store import dump_frame, load_frame
+
+from .clean_15min_data import clean_15min_data
+from .clean_daypart_data import clean_daypart_data
+
+BENCHMARK_CACHE_PREFIX = "parsed/"
+
+# Moving average of the charts, see create_chart
+MOVING_AVERAGE_WINDOW = 5
+MOVING_AVERAGE_MIN_PERIODS = 2
+
+
+def mappings_fingerprint(*mappings: dict) -> str:
+    """
+    Short hash of the mapping dicts, changes when any mapping changes.
+    """
+    encoded = orjson.dumps(list(mappings), option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def add_benchmark_moving_averages(benchmark_15min_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add the Movingavg column the charts plot: per DMA and viewing source, the centered rolling mean of RTG over the
+    quarter hours in chart order. create_chart uses it as is when the benchmark has it.
+    """
+    df = benchmark_15min_df.copy()
+    in_order = df.sort_values('Order')
+    # Assigned back by index, the rows keep their order
+    df['Movingavg'] = (in_order.groupby(['DMA', 'Viewing Source'], sort=False)['RTG']
+                               .transform(lambda rtg: rtg.rolling(MOVING_AVERAGE_WINDOW, center=True,
+                                                                  min_periods=MOVING_AVERAGE_MIN_PERIODS).mean()))
+    return df
+
+
+def _cache_key(kind: str, benchmark: ObjectInfo, fingerprint: str) -> str:
+    version = re.sub(r"[^0-9A-Za-z-]", "", benchmark.etag)
+    return f"{BENCHMARK_CACHE_PREFIX}{kind}-{version}-{fingerprint}"
+
+
+def _load_or_build(storage: ObjectStorage, kind: str, benchmark: ObjectInfo, fingerprint: str, build) -> pd.DataFrame:
+    key = _cache_key(kind, benchmark, fingerprint)
+    for frame_format in ("parquet", "pickle"):
+        try:
+            return load_frame(storage.get_bytes(f"{key}.{frame_format}"), frame_format)
+        except ObjectNotFound:
+            continue
+
+    print(f'Building cleaned {kind} benchmark from {benchmark.key} ->', end=' ')
+    df = build(storage.get(benchmark.key).read())
+    frame_bytes, frame_format = dump_frame(df)
+    try:
+        # Drop the entries of older benchmark files / mappings
+        for info in storage.list(f"{BENCHMARK_CACHE_PREFIX}{kind}-"):
+            storage.delete(info.key)
+        storage.put(f"{key}.{frame_format}", frame_bytes)
+    except Exception as e:
+        print(f"Caching the cleaned {kind} benchmark failed: {e}")
+    print('Done.')
+    return df
+
+
+def load_cleaned_benchmarks(storage: ObjectStorage, benchmark_15min: ObjectInfo, benchmark_daypart: ObjectInfo,
+                            station_network_mapping: dict, fifteen_min_order_mapping: dict,
+                            daypart_order_mapping: dict, dma_name_mapping: dict) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    The cleaned 15min (with Movingavg) and daypart benchmark frames, from the cache or cleaned and cached.
+
+    :param storage: The benchmark storage, the cache lives under parsed/ in it
+    :param benchmark_15min: The 15min benchmark file (latest_benchmark)
+    :param benchmark_daypart: The daypart benchmark file
+    :return: (benchmark_15min_df, benchmark_daypart_df)
+    """
+    fingerprint_15min = mappings_fingerprint(station_network_mapping, fifteen_min_order_mapping, dma_name_mapping)
+    fingerprint_daypart = mappings_fingerprint(station_network_mapping, daypart_order_mapping, dma_name_mapping)
+
+    def build_15min(content: bytes) -> pd.DataFrame:
+        df = clean_15min_data(io.BytesIO(content), station_network_mapping, fifteen_min_order_mapping, dma_name_mapping)
+        return add_benchmark_moving_averages(df)
+
+    def build_daypart(content: bytes) -> pd.DataFrame:
+        return clean_daypart_data(io.BytesIO(content), station_network_mapping, daypart_order_mapping, dma_name_mapping)
+
+    benchmark_15min_df = _load_or_build(storage, "15min", benchmark_15min, fingerprint_15min, build_15min)
+    benchmark_daypart_df = _load_or_build(storage, "dayparts", benchmark_daypart, fingerprint_daypart, build_daypart)
+    return benchmark_15min_df, benchmark_daypart_df
@@ -1,21 +1,19 @@
 # For cleaning the 15min and dayparts data
 # This function used to include functionality for concatenating the buffalo file as well, but that has since been removed
 
-import warnings
 import pandas as pd
-from .data_cleaning_utils import map_geography
+from .data_cleaning_utils import map_geography, map_values, read_nielsen_sheet, strip_all_whitespace, strip_strings
 
 def clean_15min_data(file, stationReferenceDict:dict, chartorderdict:dict, geography_mapping:dict) -> pd.DataFrame:
     """
     Cleans and maps the 15minfile. Used in both the benchmark and daily files.
+    file is the excel file or its sheet as read by read_nielsen_sheet.
     Returns a dataframe.
     """
 
-    # Attempt to read in file. 
+    # Attempt to read in file (or take the already read sheet, eg. from the upload cache)
     try:
-        with warnings.catch_warnings(): # Supress openpyxl default style warning
-            warnings.simplefilter("ignore")
-            min15df = pd.read_excel(file,sheet_name='Live+Same Day, TV Households',header = 8,skipfooter=8).ffill()
+        min15df = read_nielsen_sheet(file)
     except Exception as e:
         print(e)
         print('There was an issue loading the spectrum 15minute file, this file is critical for the report to generate.')
@@ -28,7 +26,7 @@ def clean_15min_data(file, stationReferenceDict:dict, chartorderdict:dict, geogr
     min15df['RTG % (X.X)'] = min15df['RTG % (X.X)'].replace(' ', 0)
 
     # Strip White space
-    min15df = min15df.map(lambda x: x.strip() if isinstance(x, str) else x)
+    min15df = strip_strings(min15df)
 
     # TEMPORRARY UNTIL SOURCE IS FIXED - Remove s1df and s1mk from all markets, re add them back where they're regions are
     dallasdf = min15df[(min15df['Viewing Source']== 'S1DF') & (min15df['Geography / Metrics']=='Dallas-Ft. Worth')]
@@ -41,16 +39,16 @@ def clean_15min_data(file, stationReferenceDict:dict, chartorderdict:dict, geogr
     min15df = min15df[~min15df['Geography / Metrics'].isin(dropped_dmas)] 
 
     # Add station column
-    min15df['Station'] = min15df['Viewing Source'].apply(lambda x: stationReferenceDict[x])
+    min15df['Station'] = map_values(min15df['Viewing Source'], stationReferenceDict)
 
     # Add DMA specific column 
-    min15df['DMA'] = min15df['Geography / Metrics'].apply(lambda x: map_geography(x, geography_mapping))
+    min15df['DMA'] = map_geography(min15df['Geography / Metrics'], geography_mapping)
 
     # New logic here, for the time column, we strip out any whitespace at all from the time column
-    min15df['Time'] = min15df['Time'].astype(str).str.replace(r'\s+', '', regex=True)
+    min15df['Time'] = strip_all_whitespace(min15df['Time'])
 
     # Add order column
-    min15df['Order'] = min15df['Time'].apply(lambda x: chartorderdict[x])
+    min15df['Order'] = map_values(min15df['Time'], chartorderdict)
 
     # Drop unneccesary columns, rename RTG column
     min15df = min15df.drop(['Affil.','Custom Range','Daypart','Demo','Geography / Metrics','index','Indicator','Indicator ','Metrics'], axis = 1, errors='ignore').rename(columns={'RTG % (X.X)':'RTG'})
@@ -1,27 +1,50 @@
-import warnings
 import pandas as pd
 import numpy as np
 
-from .data_cleaning_utils import  map_order, map_geography, rename_full_day
+from .data_cleaning_utils import  map_order, map_geography, map_values, rename_full_day, read_nielsen_sheet, strip_strings
+
+# Station column order of the daypart report, stations not in it come after (in the order the DMAs bring them)
+REPORT_STATION_COLUMNS = ['Spec News','ABC', 'CNN','Fox News','MSNBC','CBS','CW','FOX','KAZD','NBC']
+
+def pivot_dayparts(daypartsdf: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per (DMA, daypart) with a column per station (RTG summed), in one pivot.
+    DMAs in the order they appear in the file, dayparts sorted within a DMA, a station the DMA doesn't have is NaN.
+    """
+    dmas = daypartsdf['DMA'].unique()
+    pivot = daypartsdf.pivot_table(index=['DMA','Time'], columns='Station', values='RTG', aggfunc='sum')
+    pivot = pivot.reindex(dmas, level='DMA')
+
+    # Column order: the report's stations, then the others as each DMA (stations sorted) first has them
+    stations = daypartsdf[['DMA','Station']].drop_duplicates()
+    stations = stations.assign(dma_rank=stations['DMA'].map({dma: rank for rank, dma in enumerate(dmas)}))
+    other_stations = [station for station in stations.sort_values(['dma_rank','Station'])['Station'].unique()
+                      if station not in REPORT_STATION_COLUMNS]
+    missing_stations = [station for station in REPORT_STATION_COLUMNS if station not in pivot.columns]
+    pivot = pivot.reindex(columns=REPORT_STATION_COLUMNS + other_stations)
+    # Report stations no DMA has stay empty object columns, as they always were
+    pivot[missing_stations] = pivot[missing_stations].astype(object)
+    pivot.columns.name = None
+
+    reportdf = pivot.reset_index(level='DMA').rename_axis('Daypart').reset_index()
+    return reportdf[['Daypart'] + REPORT_STATION_COLUMNS + ['DMA'] + other_stations]
 
 def clean_daypart_data(path, stationReferenceDict, order_mapping_dict, geography_mapping_dict):
-    # Read in file
+    # Read in file (or take the already read sheet, eg. from the upload cache)
     try:
-        with warnings.catch_warnings(): # Supress openpyxl default style warning
-            warnings.simplefilter("ignore")
-            daypartsdf = pd.read_excel(path,sheet_name='Live+Same Day, TV Households',header = 8,skipfooter=8).ffill()
+        daypartsdf = read_nielsen_sheet(path)
     except Exception as e:
         print(e)
         print('There was an issue locating the spectrum dayparts file, this file is critical for the report to generate. ')
         
     # Check for NA values: 
     if ' ' in daypartsdf['RTG % (X.X)'].unique() or daypartsdf['RTG % (X.X)'].isnull().values.any():
-        print(f'WARNING!! WARNING!!! Missing RTG found in Dayparts File! \nPath:\n{path}') 
+        print(f'WARNING!! WARNING!!! Missing RTG found in Dayparts File! \nPath:\n{path if not isinstance(path, pd.DataFrame) else "(cached upload)"}') 
     daypartsdf['RTG % (X.X)'] = daypartsdf['RTG % (X.X)'].fillna(0)
     daypartsdf['RTG % (X.X)'] = daypartsdf['RTG % (X.X)'].replace(' ', 0)
 
     # Strip white space
-    daypartsdf = daypartsdf.map(lambda x: x.strip() if isinstance(x, str) else x)
+    daypartsdf = strip_strings(daypartsdf)
 
     # TEMPORRARY UNTIL SOURCE IS FIXED - Remove s1df and s1mk from all markets, re add them back where they're regions are
     dallasdf = daypartsdf[(daypartsdf['Viewing Source'] == 'S1DF ') & (
@@ -37,27 +60,16 @@ def clean_daypart_data(path, stationReferenceDict, order_mapping_dict, geography
     daypartsdf = daypartsdf[~daypartsdf['Geography / Metrics'].isin(dropped_dmas)] 
 
     # Map to station to network, and geography to dma
-    daypartsdf['Station'] = daypartsdf['Viewing Source'].apply(lambda x: stationReferenceDict[x])
-    daypartsdf['DMA'] = daypartsdf['Geography / Metrics'].apply(lambda x: map_geography(x, geography_mapping_dict))
+    daypartsdf['Station'] = map_values(daypartsdf['Viewing Source'], stationReferenceDict)
+    daypartsdf['DMA'] = map_geography(daypartsdf['Geography / Metrics'], geography_mapping_dict)
 
     # Clean up time column (rename full day), and drop unneccesary columns
-    daypartsdf['Time'] = daypartsdf['Time'].apply(lambda x: rename_full_day(x))
+    daypartsdf['Time'] = rename_full_day(daypartsdf['Time'])
     daypartsdf = daypartsdf.drop(['Affil.','Custom Range','Daypart','Demo','Geography / Metrics', 'Indicator ','Indicator','Metrics'], axis = 1,errors='ignore').rename(columns={'RTG % (X.X)':'RTG'})
 
-    # Reorder columns
-    reportdf = pd.DataFrame(data=None, columns=['Spec News','ABC', 'CNN','Fox News','MSNBC','CBS','CW','FOX','KAZD','NBC','DMA'])
-
-    # Pivot table for each dma, each station
-    for i in daypartsdf['DMA'].unique():
-        dmaonly = daypartsdf[daypartsdf['DMA']== i]
-        dmaonly = dmaonly.pivot_table(index='Time',columns='Station',values='RTG', aggfunc = 'sum')
-        dmaonly['DMA'] = i
-        with warnings.catch_warnings(): # Supress a warning!
-            warnings.simplefilter(action='ignore', category=FutureWarning) # Supress a warning
-            reportdf = pd.concat([reportdf,dmaonly],join = 'outer')
-    reportdf = reportdf.reset_index().rename(columns={'index':'Daypart'})
+    reportdf = pivot_dayparts(daypartsdf)
 
     # map order
-    reportdf['Order'] = reportdf['Daypart'].apply(lambda x: map_order(x, order_mapping_dict))
+    reportdf['Order'] = map_order(reportdf['Daypart'], order_mapping_dict)
 
     return reportdf
\ No newline at end of file
@@ -6,6 +6,10 @@ import calendar
 
 # Functions for creating charts, scroll down to see dallas 
 
+# The benchmark moving average is precomputed per viewing source, it can be used as is when the data is one source
+def has_moving_average(avgdata):
+    return 'Movingavg' in avgdata.columns and avgdata['Viewing Source'].nunique() <= 1
+
 # Version 6
 # Function for configuring chart:
 def create_chart(dailydata, avgdata, snNamesDict):
@@ -21,7 +25,9 @@ def create_chart(dailydata, avgdata, snNamesDict):
 
     # aAply the moving avg column as a method of data smoothing, this is what we will chart
     dailydataspec['Movingavg'] = dailydataspec['RTG'].rolling(5,center=True,min_periods=2).mean()
-    avgdataspec['Movingavg'] = avgdataspec['RTG'].rolling(5,center=True,min_periods=2).mean()
+    # The cached benchmark already has it (per viewing source), see benchmark_cache
+    if not has_moving_average(avgdataspec):
+        avgdataspec['Movingavg'] = avgdataspec['RTG'].rolling(5,center=True,min_periods=2).mean()
 
     # Edit the x axis to be only the last 7 characters, the time
     avgdataspec['Timeinterval'] = avgdataspec['Time'].apply(lambda x: x[-7:])
@@ -121,7 +127,8 @@ def create_chart_dallas(dailydata, avgdata, snNamesDict):
     dailydataspec['Movingavg_s1df'] = dailydataspec['RTG'].rolling(5,center=True,min_periods=2).mean()
     dailydataspec['Movingavg_kazd'] = dailydataspec['kazd_rtg'].rolling(5,center=True,min_periods=2).mean()
     dailydataspec['Movingavg_combined'] = dailydataspec['combined_total'].rolling(5,center=True,min_periods=2).mean()
-    avgdataspec['Movingavg'] = avgdataspec['RTG'].rolling(5,center=True,min_periods=2).mean()
+    if not has_moving_average(avgdataspec):
+        avgdataspec['Movingavg'] = avgdataspec['RTG'].rolling(5,center=True,min_periods=2).mean()
 
     # Edit the x axis to be only the last 7 characters, the time
     dailydataspec['Timeinterval'] = dailydataspec['Time'].apply(lambda x: x[-7:])
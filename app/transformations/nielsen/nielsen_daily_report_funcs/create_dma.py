@@ -1,7 +1,6 @@
 from .create_tables import create_table
 from .create_charts import create_chart, create_chart_dallas
 import multiprocessing
-from functools import partial
 
 
 from email.utils import make_msgid
@@ -65,39 +64,62 @@ def process_single_dma(dma, image_folder, benchmark_15min, benchmark_dayparts, d
     print('Done.')
     return dma, dmahtml, {tablepath: table_cid}, {chartpath: chart_cid}
 
-def create_dma_html(unique_dmas, image_folder, benchmark_15min, benchmark_dayparts, daily_data_15min, daily_data_dayparts, sn_names_dict, penetration_dict):
-    # Initialize the pool with the number of available CPU cores
-    pool = multiprocessing.Pool()
-
-    # Create a partial function with all arguments except 'dma'
-    process_dma_partial = partial(process_single_dma, 
-                                  image_folder=image_folder,
-                                  benchmark_15min=benchmark_15min,
-                                  benchmark_dayparts=benchmark_dayparts,
-                                  daily_data_15min=daily_data_15min,
-                                  daily_data_dayparts=daily_data_dayparts,
-                                  sn_names_dict=sn_names_dict,
-                                  penetration_dict=penetration_dict)
-
-    try:
-        results = pool.map(process_dma_partial, unique_dmas)
-    except Exception as e:
-        raise
-
-    # Close the pool and wait for all processes to finish
-    pool.close()
-    pool.join()
-
-    # Combine results
-    dmas_html_dict = {}
-    chart_path_dict = {}
-    table_path_dict = {}
-    for dma, dmahtml, table_dict, chart_dict in results:
+def _frames_by_dma(df):
+    # The rows of each DMA, a DMA missing from the frame gets its empty frame
+    by_dma = dict(tuple(df.groupby('DMA', sort=False)))
+    return lambda dma: by_dma.get(dma, df.iloc[0:0])
+
+def dma_tasks(unique_dmas, image_folder, benchmark_15min, benchmark_dayparts, daily_data_15min, daily_data_dayparts, sn_names_dict, penetration_dict):
+    """
+    The process_single_dma arguments of each DMA. Each task only carries its DMA's rows, the pool pickles every
+    task it sends to a worker and the whole frames made that the slow part for big reports.
+    """
+    frames = [_frames_by_dma(df) for df in (benchmark_15min, benchmark_dayparts, daily_data_15min, daily_data_dayparts)]
+    return [(dma, image_folder, *(dma_frame(dma) for dma_frame in frames), sn_names_dict, penetration_dict)
+            for dma in unique_dmas]
+
+def _process_dma_task(task):
+    day, args = task
+    return day, process_single_dma(*args)
+
+def render_dma_html(pool, tasks_by_day, progress=None):
+    """
+    Render the charts and tables of several report days on one pool, every (day, DMA) is one task.
+
+    :param pool: A multiprocessing pool, shared with the rest of the report generation
+    :param tasks_by_day: {day: dma_tasks(...)}
+    :param progress: progress(stage, **details) is called as each DMA finishes (report generation jobs), optional
+    :return: {day: (dmas_html_dict, chart_path_dict, table_path_dict)}
+    """
+    tasks = [(day, args) for day, day_tasks in tasks_by_day.items() for args in day_tasks]
+    results = {day: ({}, {}, {}) for day in tasks_by_day}
+
+    # DMAs are reported as they finish, the order of the results doesn't matter
+    for done, (day, (dma, dmahtml, table_dict, chart_dict)) in enumerate(pool.imap_unordered(_process_dma_task, tasks), 1):
+        dmas_html_dict, chart_path_dict, table_path_dict = results[day]
         dmas_html_dict[dma] = dmahtml
         table_path_dict.update(table_dict)
         chart_path_dict.update(chart_dict)
+        if progress is not None:
+            progress('dma', day=day, dma=dma, done=done, total=len(tasks))
 
-    return dmas_html_dict, chart_path_dict, table_path_dict
+    return results
+
+def create_dma_html(unique_dmas, image_folder, benchmark_15min, benchmark_dayparts, daily_data_15min, daily_data_dayparts, sn_names_dict, penetration_dict,
+                    progress=None):
+    # One report day on its own pool, see render_dma_html
+    # Initialize the pool with the number of available CPU cores
+    pool = multiprocessing.Pool()
+    try:
+        tasks = dma_tasks(unique_dmas, image_folder, benchmark_15min, benchmark_dayparts, daily_data_15min, daily_data_dayparts,
+                          sn_names_dict, penetration_dict)
+        results = render_dma_html(pool, {None: tasks}, progress=progress)
+    finally:
+        # Close the pool and wait for all processes to finish
+        pool.close()
+        pool.join()
+
+    return results[None]
 
 # if __name__ == '__main__':
 #        unique_dmas = {'Cleveland/Akron', 'Orlando/Daytona Beach/Melbourne', 'Los Angeles', 'New York', 'Charlotte', 'Tampa/Saint Petersburg', 'Dallas/Ft. Worth'}
@@ -1,23 +1,86 @@
 # These functions are used in data cleaning and mapping. 
+import re
+import warnings
+import numpy as np
+import pandas as pd
+
+NIELSEN_SHEET_NAME = 'Live+Same Day, TV Households'
+_REQUIRED = object()
+_WHITESPACE = re.compile(r'\s+')
+
+# Reading the nielsen excel files, this is the slow part of cleaning (the rest is mapping)
+def read_nielsen_sheet(file) -> pd.DataFrame:
+    """
+    Read the data sheet of a Nielsen 15min or dayparts file (path, file object or an already read DataFrame,
+    which is copied), forward filled.
+    """
+    if isinstance(file, pd.DataFrame):
+        return file.copy()
+    with warnings.catch_warnings(): # Supress openpyxl default style warning
+        warnings.simplefilter("ignore")
+        return pd.read_excel(file, sheet_name=NIELSEN_SHEET_NAME, header = 8, skipfooter=8).ffill()
+
+# Mapping functions used in cleaning, they work on whole columns.
+# The text columns have few distinct values (a few hundred geographies/times at most) repeated over every row,
+# so functions are applied once per distinct value and the results spread back over the rows.
+def map_distinct(values: pd.Series, func) -> pd.Series:
+    """
+    Same result as values.map(func), calling func once per distinct value when the column is all strings
+    (other columns, where 1 and 1.0 would count as one value, are mapped element by element).
+    """
+    if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+        return values.map(func)
+    codes, uniques = pd.factorize(values)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(value) for value in uniques]
+    result = np.empty(len(values), dtype=object)
+    found = codes != -1
+    result[found] = mapped[codes[found]]
+    # Missing values (NaN/None) as they are, not as one factorized NaN
+    result[~found] = [func(value) for value in values.to_numpy()[~found]]
+    # Same dtype inference as map (eg. int orders come back int64)
+    return pd.Series(result, index=values.index, name=values.name).infer_objects()
+
+def map_values(values: pd.Series, mapping: dict, default=_REQUIRED) -> pd.Series:
+    """
+    values.apply(lambda x: mapping[x]), or mapping.get(x, default) when a default is given.
+    Raises KeyError on a value missing from mapping when there's no default, like the lookup does.
+    """
+    if default is _REQUIRED:
+        return map_distinct(values, mapping.__getitem__)
+    return map_distinct(values, lambda value: mapping.get(value, default))
+
+def _strip(value):
+    return value.strip() if isinstance(value, str) else value
+
+def strip_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    df.map(lambda x: x.strip() if isinstance(x, str) else x), done per column with map_distinct.
+    """
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        # DataFrame.map infers the result's dtype too, eg. an object column of numbers (the RTG once ' ' is replaced)
+        # becomes float, that's all that happens to columns without strings
+        if pd.api.types.infer_dtype(df[column], skipna=True) in ('integer', 'floating', 'mixed-integer-float'):
+            df[column] = df[column].infer_objects()
+        else:
+            df[column] = map_distinct(df[column], _strip)
+    return df
+
+def strip_all_whitespace(values: pd.Series) -> pd.Series:
+    """
+    values.astype(str).str.replace(r'\s+', '', regex=True)
+    """
+    return map_distinct(values.astype(str), lambda value: _WHITESPACE.sub('', value))
 
-# Functions to be used in Cleaning/Reference Lambda Functions
 # Map order, includes exception for case when time not in order dictionary
-def map_order(time, daypartsorderDict):
-    if time in daypartsorderDict:
-        return daypartsorderDict[time]
-    else:
-        return 99
+def map_order(times: pd.Series, daypartsorderDict: dict) -> pd.Series:
+    return map_values(times, daypartsorderDict, default=99)
 
 # Get DMA from Nielsen Geography 
-def map_geography(geography, geomappingDict):
-    if geography in geomappingDict:
-        return geomappingDict[geography]
-    else:
-        return 'DMA not recognized'
+def map_geography(geographies: pd.Series, geomappingDict: dict) -> pd.Series:
+    return map_values(geographies, geomappingDict, default='DMA not recognized')
 
 # Rename to full day 
-def rename_full_day(time):
-    if time in ['03:00 am - 02:00 am','03:00 am - 03:00 am']:
-        return 'Full Day'
-    else: 
-        return time
\ No newline at end of file
+def rename_full_day(times: pd.Series) -> pd.Series:
+    return times.where(~times.isin(['03:00 am - 02:00 am','03:00 am - 03:00 am']), 'Full Day')
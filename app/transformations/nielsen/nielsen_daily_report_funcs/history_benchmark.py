@@ -0,0 +1,57 @@
+# Benchmarks computed from the stored daily data (see save_daily_data) instead of the uploaded benchmark workbooks.
+# Like the uploaded ones, the benchmark of a report is the average of the previous calendar month. The daily tables keep
+# running sums per month and slot, updated as each day is saved, so this is a read of one month's sums.
+from datetime import date, timedelta
+import pandas as pd
+
+from crud import nielsen_crud
+
+from .benchmark_cache import add_benchmark_moving_averages
+from .clean_daypart_data import pivot_dayparts
+from .data_cleaning_utils import map_order
+from .save_daily_data import parse_data_date
+
+# Fewer days than this stored for the month and the uploaded benchmark is used
+MIN_BENCHMARK_DAYS = 20
+
+
+def benchmark_month(data_date: date) -> date:
+    """
+    First day of the month before data_date's, the month the benchmark averages.
+    """
+    return (data_date.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+def load_history_benchmarks(db, dateofdata: str, daypart_order_mapping: dict):
+    """
+    The 15min and daypart benchmark frames for a report date, shaped like the cleaned uploaded benchmarks
+    (load_cleaned_benchmarks), from the stored daily data. None if not enough days of the month are stored.
+
+    :param dateofdata: Date of the daily data (eg. 10/01/2024)
+    :return: (benchmark_15min_df, benchmark_daypart_df) or None
+    """
+    month = benchmark_month(parse_data_date(dateofdata))
+    dates = nielsen_crud.get_nielsen_daily_dates(db, month)
+    if len(dates) < MIN_BENCHMARK_DAYS:
+        print(f'Only {len(dates)} days of {month:%m/%Y} stored, not enough for a benchmark ->', end=' ')
+        return None
+    # Same format as the Dates of the uploaded benchmarks, the charts read the month and year from it
+    date_range = f'{dates[0]:%m/%d/%Y} - {dates[-1]:%m/%d/%Y}'
+
+    sums_15min = nielsen_crud.get_nielsen_benchmark(db, 'ratings_15min', month)
+    benchmark_15min_df = pd.DataFrame({'Time': sums_15min['time_interval'],
+                                       'Viewing Source': sums_15min['viewing_source'],
+                                       'Dates': date_range,
+                                       'RTG': sums_15min['rtg'],
+                                       'Station': sums_15min['station'],
+                                       'DMA': sums_15min['dma'],
+                                       'Order': sums_15min['chart_order']})
+    benchmark_15min_df = add_benchmark_moving_averages(benchmark_15min_df)
+
+    sums_daypart = nielsen_crud.get_nielsen_benchmark(db, 'ratings_dayparts', month)
+    benchmark_daypart_df = pivot_dayparts(pd.DataFrame({'DMA': sums_daypart['dma'],
+                                                        'Time': sums_daypart['daypart'],
+                                                        'Station': sums_daypart['station'],
+                                                        'RTG': sums_daypart['rtg']}))
+    benchmark_daypart_df['Order'] = map_order(benchmark_daypart_df['Daypart'], daypart_order_mapping)
+
+    return benchmark_15min_df, benchmark_daypart_df
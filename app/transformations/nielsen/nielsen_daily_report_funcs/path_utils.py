@@ -3,12 +3,13 @@ import base64
 import os
 import shutil
 
-def create_image_directory(user_email:str): 
+def create_image_directory(user_email:str, workspace:str = None):
     """
     Creates a directory for the user's image objects (charts and tables)
+    A workspace (eg. a job id) gets its own directory, so concurrent reports of one user don't wipe each other's files
     """
     # Create folder where image objects (charts and tables) will be stored
-    dir_name = create_safe_identifier_from_email(user_email)
+    dir_name = create_safe_identifier_from_email(user_email) + (f'_{workspace}' if workspace else '')
 
     # Wipe the directory clean
     full_path = os.path.join('resources/nielsen/imageDump/', dir_name)
@@ -32,12 +33,12 @@ def create_image_directory(user_email:str):
     return full_path + '/'
 
 
-def create_eml_directory(user_email:str):
+def create_eml_directory(user_email:str, workspace:str = None):
     """
-    Creates a directory for the user's eml files
+    Creates a directory for the user's eml files (per workspace, see create_image_directory)
     """
     # Create folder where eml files will be stored
-    dir_name = create_safe_identifier_from_email(user_email)
+    dir_name = create_safe_identifier_from_email(user_email) + (f'_{workspace}' if workspace else '')
 
     # Wipe the directory clean
     full_path = os.path.join('resources/nielsen/emlDump/', dir_name)
@@ -62,6 +63,15 @@ def create_eml_directory(user_email:str):
     
 
 
+def remove_report_directories(user_email:str, workspace:str = None):
+    """
+    Deletes the image and eml directories of a user (workspace), eg. once a report job has expired
+    """
+    dir_name = create_safe_identifier_from_email(user_email) + (f'_{workspace}' if workspace else '')
+    for base_path in ('resources/nielsen/imageDump/', 'resources/nielsen/emlDump/'):
+        shutil.rmtree(os.path.join(base_path, dir_name), ignore_errors=True)
+
+
 def create_safe_identifier_from_email(email, length=10):
     """
     Converts a user's email to a safe identifier used for the image dump directory. 
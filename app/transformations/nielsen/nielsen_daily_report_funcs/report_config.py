@@ -0,0 +1,110 @@
+# The report configuration (mappings, subject lines, notes, recipients, DMA lists) kept in memory between reports.
+# Every report used to read each mapping and each subject line's tables separately, the config only changes through
+# the update_* Nielsen config endpoints. Those invalidate the snapshot after they write, the ttl bounds how stale
+# another worker process's snapshot can get.
+import threading
+import time
+from typing import Optional
+
+from crud import nielsen_crud
+
+
+class NielsenReportConfig:
+    """
+    One read of the report configuration, shared by the reports using it (don't modify it).
+
+    Attributes:
+        version: Counts the snapshot's loads, a new config has a higher version
+        report_notes, report_recipients, report_dma_lists: One entry per subject line, in subject_line_ids order
+    """
+    def __init__(self, version: int, station_network_mapping: dict, spectrum_station_names_mapping: dict,
+                 daypart_order_mapping: dict, fifteen_min_order_mapping: dict, dma_name_mapping: dict,
+                 dma_penetration_mapping: dict, subject_line_ids: list, subject_lines: list, report_notes: list,
+                 report_recipients: list, report_dma_lists: list):
+        self.version = version
+        self.station_network_mapping = station_network_mapping
+        self.spectrum_station_names_mapping = spectrum_station_names_mapping
+        self.daypart_order_mapping = daypart_order_mapping
+        self.fifteen_min_order_mapping = fifteen_min_order_mapping
+        self.dma_name_mapping = dma_name_mapping
+        self.dma_penetration_mapping = dma_penetration_mapping
+        self.subject_line_ids = subject_line_ids
+        self.subject_lines = subject_lines
+        self.report_notes = report_notes
+        self.report_recipients = report_recipients
+        self.report_dma_lists = report_dma_lists
+
+    @property
+    def cleaning_mappings(self) -> dict:
+        """ The 4 mappings the cleaning functions take, as keyword arguments. """
+        return dict(station_network_mapping=self.station_network_mapping,
+                    fifteen_min_order_mapping=self.fifteen_min_order_mapping,
+                    daypart_order_mapping=self.daypart_order_mapping,
+                    dma_name_mapping=self.dma_name_mapping)
+
+
+class NielsenConfigSnapshot:
+    """
+    Thread safe in memory copy of the report configuration.
+
+    get() returns the current config, loading it (nielsen_crud.get_nielsen_report_config) when there's none yet,
+    it was invalidated or it's older than ttl_seconds. Only one thread loads at a time, the others wait for it.
+    """
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._config: Optional[NielsenReportConfig] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        self.stats = {"hits": 0, "loads": 0, "invalidations": 0}
+
+    def _current(self) -> Optional[NielsenReportConfig]:
+        config = self._config
+        if config is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return config
+        return None
+
+    def get(self, db) -> NielsenReportConfig:
+        """
+        The report configuration, from memory when it's current.
+
+        :param db: Session used if the config has to be loaded
+        """
+        config = self._current()
+        if config is not None:
+            self.stats["hits"] += 1
+            return config
+
+        with self._lock:
+            # Another thread may have loaded it while we waited for the lock
+            config = self._current()
+            if config is not None:
+                self.stats["hits"] += 1
+                return config
+
+            started = time.monotonic()
+            report_config = nielsen_crud.get_nielsen_report_config(db)
+            self._version += 1
+            config = NielsenReportConfig(self._version, **report_config)
+            self._config = config
+            self._loaded_at = time.monotonic()
+            self.stats["loads"] += 1
+            print(f"Loaded Nielsen report config v{config.version} ({len(config.subject_lines)} subject lines) "
+                  f"in {time.monotonic() - started:.2f}s")
+            return config
+
+    def invalidate(self):
+        """
+        Drop the config, the next get() reads it again. Call after writing any of the config tables.
+        """
+        # Takes the lock, a load in progress (which may have read the old config) finishes first and is dropped too
+        with self._lock:
+            self._config = None
+            self.stats["invalidations"] += 1
+
+
+def load_report_config(db) -> NielsenReportConfig:
+    """
+    Read the report configuration without a snapshot (version 0).
+    """
+    return NielsenReportConfig(0, **nielsen_crud.get_nielsen_report_config(db))
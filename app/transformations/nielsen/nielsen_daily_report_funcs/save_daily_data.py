@@ -0,0 +1,51 @@
+# Saving the cleaned daily data to the daily Nielsen tables (nielsen_daily schema), one load per data date
+from datetime import datetime, date
+import pandas as pd
+
+from crud import nielsen_crud
+
+
+def parse_data_date(dateofdata: str) -> date:
+    """
+    The date of a daily file, from its Dates value (eg. 10/01/2024).
+    """
+    return datetime.strptime(dateofdata, '%m/%d/%Y').date()
+
+def daily_15min_rows(daily_15min_df: pd.DataFrame, data_date: date) -> pd.DataFrame:
+    """
+    The cleaned 15min frame as ratings_15min rows.
+    """
+    return pd.DataFrame({'data_date': data_date,
+                         'dma': daily_15min_df['DMA'],
+                         'station': daily_15min_df['Station'],
+                         'viewing_source': daily_15min_df['Viewing Source'],
+                         'time_interval': daily_15min_df['Time'],
+                         'chart_order': daily_15min_df['Order'],
+                         'rtg': daily_15min_df['RTG']})
+
+def daily_daypart_rows(daily_daypart_df: pd.DataFrame, data_date: date) -> pd.DataFrame:
+    """
+    The daypart report frame (a column per station) as ratings_dayparts rows, one per DMA, daypart and station.
+    Stations a DMA doesn't have (NaN) have no row.
+    """
+    stations = [column for column in daily_daypart_df.columns if column not in ('Daypart', 'DMA', 'Order')]
+    rows = daily_daypart_df.melt(id_vars=['DMA', 'Daypart', 'Order'], value_vars=stations,
+                                 var_name='station', value_name='rtg').dropna(subset=['rtg'])
+    return pd.DataFrame({'data_date': data_date,
+                         'dma': rows['DMA'],
+                         'daypart': rows['Daypart'],
+                         'daypart_order': rows['Order'],
+                         'station': rows['station'],
+                         'rtg': pd.to_numeric(rows['rtg'])})
+
+def save_daily_nielsen_data(db, dateofdata: str, daily_15min_df: pd.DataFrame, daily_daypart_df: pd.DataFrame) -> dict:
+    """
+    Save the cleaned daily frames of one date, replacing whatever was saved for that date before.
+    Both tables are loaded in one transaction, if the save fails neither has changed.
+    Returns the number of rows loaded per table.
+    """
+    data_date = parse_data_date(dateofdata)
+    return nielsen_crud.save_nielsen_daily_data(db, data_date, {
+        'ratings_15min': daily_15min_rows(daily_15min_df, data_date),
+        'ratings_dayparts': daily_daypart_rows(daily_daypart_df, data_date),
+    })
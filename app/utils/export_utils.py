@@ -0,0 +1,251 @@
+# Bulk exports of engagement data (raw rows or computed tables) as Parquet, Arrow IPC or an Excel workbook.
+# Everything is written one row group / record batch / row at a time and streamed out as it's written,
+# so an export of several years is never held in memory as a whole.
+import io
+import tempfile
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+from fastapi.responses import StreamingResponse
+
+# Export format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Rows per parquet row group / arrow record batch
+EXPORT_ROW_GROUP_ROWS = 50000
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# The workbook is built in memory up to this size, then spills to a temp file
+XLSX_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+XLSX_READ_CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write only file object that keeps what's been written until it's drained. Tracks its own position,
+    the parquet writer records row group offsets from tell() so it can't be reset when we drain.
+    """
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def iter_dataframe_chunks(df: pd.DataFrame, chunk_rows: int = EXPORT_ROW_GROUP_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Split an already computed DataFrame into row chunks for export.
+    """
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# Postgres type oid -> Arrow type, for the column types the exported queries return
+_PG_ARROW_TYPES = {
+    16: pa.bool_(),                       # bool
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),  # int8, int2, int4
+    700: pa.float64(), 701: pa.float64(),  # float4, float8
+    1700: pa.float64(),                   # numeric, read_sql coerces Decimals to float
+    25: pa.string(), 1042: pa.string(), 1043: pa.string(),  # text, bpchar, varchar
+    1082: pa.date32(),                    # date
+    1114: pa.timestamp("us"),             # timestamp
+    1184: pa.timestamp("us", tz="UTC"),   # timestamptz
+}
+
+
+def arrow_schema_from_cursor(description) -> pa.Schema:
+    """
+    Build the export schema from a query's column types (a DB-API cursor.description).
+    Types not in _PG_ARROW_TYPES are exported as strings.
+
+    :param description: Sequence of (name, type_code, ...) column descriptions
+    :return: Arrow schema, every field nullable
+    """
+    return pa.schema([(column[0], _PG_ARROW_TYPES.get(column[1], pa.string())) for column in description])
+
+
+def arrow_schema_from_dataframe(df: pd.DataFrame) -> pa.Schema:
+    """
+    Build the export schema of a DataFrame that's exported in chunks, with the types inferred from all of its rows.
+    """
+    if any(not isinstance(column, str) for column in df.columns):
+        df = df.rename(columns=str)
+    return pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+
+
+def _widen_schema(schema: pa.Schema) -> pa.Schema:
+    # Used when no schema is given. A column with only NULLs in the first chunk is inferred as null,
+    # that can't hold what later chunks have in it, so it's exported as a string column
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema])
+
+
+def _to_arrow(df: pd.DataFrame, schema: Optional[pa.Schema]) -> pa.Table:
+    # Arrow wants string column names, the periodicity tables use integer fiscal months
+    if any(not isinstance(column, str) for column in df.columns):
+        df = df.rename(columns=str)
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def iter_arrow_export(frames: Iterable[pd.DataFrame], export_format: str,
+                      schema: Optional[pa.Schema] = None) -> Iterator[bytes]:
+    """
+    Write DataFrame chunks to Parquet or an Arrow IPC stream and yield the bytes as each chunk is written.
+
+    Every chunk is converted to the schema, so a column's type doesn't depend on which rows ended up in the
+    first chunk. Arrow integer columns are nullable, an integer column that read_sql turned into float64
+    because a chunk has NULLs in it is written back as integers and nulls.
+    Without a schema it's taken from the first chunk, with its all NULL columns widened to strings.
+    Each chunk becomes one parquet row group / one arrow record batch.
+
+    :param frames: Iterable of DataFrames with the same columns
+    :param export_format: 'parquet' or 'arrow'
+    :param schema: Schema of the exported file (arrow_schema_from_cursor / arrow_schema_from_dataframe)
+    :return: Iterator of file bytes
+    """
+    sink = _ChunkSink()
+    writer = None
+    try:
+        for df in frames:
+            table = _to_arrow(df, schema)
+            if schema is None:
+                schema = _widen_schema(table.schema)
+                table = table.cast(schema)
+            if writer is None:
+                if export_format == "parquet":
+                    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+                else:
+                    writer = pa.ipc.new_stream(sink, schema)
+            if export_format == "parquet":
+                writer.write_table(table, row_group_size=max(len(table), 1))
+            else:
+                writer.write_table(table)
+            yield sink.drain()
+
+        if writer is None:
+            # Nothing matched, still send back a valid (empty) file
+            schema = schema if schema is not None else pa.schema([])
+            writer = pq.ParquetWriter(sink, schema) if export_format == "parquet" else pa.ipc.new_stream(sink, schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+
+def arrow_export_response(frames: Iterable[pd.DataFrame], export_format: str, filename: str,
+                          schema: Optional[pa.Schema] = None) -> StreamingResponse:
+    """
+    Stream DataFrame chunks to the client as a Parquet or Arrow IPC download.
+
+    :param frames: Iterable of DataFrames with the same columns, consumed lazily as the response is sent
+    :param export_format: 'parquet' or 'arrow'
+    :param filename: Download file name, without the extension
+    :param schema: Schema of the exported file, see iter_arrow_export
+    :return: StreamingResponse
+    """
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingResponse(iter_arrow_export(frames, export_format, schema), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'})
+
+
+def write_engagement_workbook(tables: Dict[str, pd.DataFrame], file: BinaryIO) -> None:
+    """
+    Write each table to its own sheet of an xlsx workbook.
+
+    Uses XlsxWriter's constant_memory mode, rows are flushed to the sheet's temp file as they're written
+    so memory doesn't grow with the number of rows/months. Rows are written in sorting_column order
+    (the same order the dashboard shows), the sorting_column itself is kept but hidden.
+
+    :param tables: Dictionary of sheet name -> DataFrame
+    :param file: Writable, seekable binary file the workbook is written to
+    """
+    workbook = xlsxwriter.Workbook(file, {"constant_memory": True})
+    header_format = workbook.add_format({"bold": True, "bottom": 1})
+    float_format = workbook.add_format({"num_format": "#,##0.000"})
+    int_format = workbook.add_format({"num_format": "#,##0"})
+
+    for name, df in tables.items():
+        if "sorting_column" in df.columns:
+            df = df.sort_values(by="sorting_column", kind="stable")
+        # Sheet names are limited to 31 characters
+        worksheet = workbook.add_worksheet(str(name)[:31])
+
+        column_formats = []
+        for col_num, column in enumerate(df.columns):
+            dtype = df.iloc[:, col_num].dtype
+            if pd.api.types.is_integer_dtype(dtype):
+                column_format = int_format
+            elif pd.api.types.is_float_dtype(dtype):
+                column_format = float_format
+            else:
+                column_format = None
+            column_formats.append(column_format)
+            hidden = {"hidden": True} if column == "sorting_column" else None
+            worksheet.set_column(col_num, col_num, max(12, min(len(str(column)) + 2, 40)), None, hidden)
+            worksheet.write_string(0, col_num, str(column), header_format)
+        worksheet.freeze_panes(1, 1)
+
+        # constant_memory requires each row to be written in order, one at a time
+        for row_num, row in enumerate(df.itertuples(index=False, name=None), start=1):
+            for col_num, value in enumerate(row):
+                if isinstance(value, np.generic):
+                    value = value.item()
+                # Missing values are left as blank cells
+                if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and not np.isfinite(value)):
+                    continue
+                if isinstance(value, str):
+                    worksheet.write_string(row_num, col_num, value)
+                elif isinstance(value, (int, float)):
+                    worksheet.write_number(row_num, col_num, value, column_formats[col_num] or float_format)
+                else:
+                    worksheet.write_string(row_num, col_num, str(value))
+
+    workbook.close()
+
+
+def _iter_file(file: BinaryIO) -> Iterator[bytes]:
+    try:
+        file.seek(0)
+        while chunk := file.read(XLSX_READ_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def excel_export_response(tables: Dict[str, pd.DataFrame], filename: str) -> StreamingResponse:
+    """
+    Build an xlsx workbook (one sheet per table) in a spooled temp file and stream it back as a download.
+
+    :param tables: Dictionary of sheet name -> DataFrame
+    :param filename: Download file name, without the extension
+    :return: StreamingResponse
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_MAX_SIZE)
+    try:
+        write_engagement_workbook(tables, file)
+    except Exception:
+        file.close()
+        raise
+    return StreamingResponse(_iter_file(file), media_type=XLSX_MEDIA_TYPE,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.xlsx"'})
@@ -0,0 +1,190 @@
+# Background jobs for the long running requests (Nielsen report generation).
+# Submitting a job returns its id straight away, a bounded pool of worker threads runs the jobs. A job reports
+# progress as events (stage started, DMA done...) which the client polls or follows as server-sent events, and
+# the finished job holds its result (eg. the path of the zipped emls) until it expires.
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import orjson
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class JobQueueFull(Exception):
+    """ Raised by submit when max_pending jobs are already waiting. """
+
+
+class Job:
+    """
+    A submitted job: status, the progress events so far and the result once it's done.
+
+    Attributes:
+        stage: The last stage the job reported
+        result: What the job function returned (JOB_SUCCEEDED)
+        error: The exception message (JOB_FAILED)
+        on_expire: Called with the job when it's purged, eg. to delete its files
+    """
+    def __init__(self, kind: str, on_expire: Optional[Callable[["Job"], None]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = JOB_QUEUED
+        self.stage: Optional[str] = None
+        self.events: List[dict] = []
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.on_expire = on_expire
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> dict:
+        return {"job_id": self.id, "kind": self.kind, "status": self.status, "stage": self.stage,
+                "error": self.error, "created_at": self.created_at, "started_at": self.started_at,
+                "finished_at": self.finished_at, "last_event": self.events[-1] if self.events else None}
+
+
+class JobProgress:
+    """
+    Passed to the job function as its first argument, progress(stage, **details) records an event.
+    """
+    def __init__(self, queue: "JobQueue", job: Job):
+        self._queue = queue
+        self._job = job
+        self.job_id = job.id
+
+    def __call__(self, stage: str, **details):
+        self._queue._emit(self._job, "progress", stage=stage, **details)
+
+
+class JobQueue:
+    """
+    Runs submitted functions on max_workers threads, at most max_pending jobs wait for a worker.
+    Finished jobs are kept for ttl_seconds. Thread safe.
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 10, ttl_seconds: int = 6 * 3600):
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        # Notified on every event, the event streams wait on it
+        self._changed = threading.Condition()
+
+    def submit(self, kind: str, func: Callable[..., Any], *args, on_expire: Optional[Callable[[Job], None]] = None,
+               **kwargs) -> Job:
+        """
+        Queue func(progress, *args, **kwargs), returns the Job.
+
+        :raises JobQueueFull: If max_pending jobs are already queued
+        """
+        self.purge_expired()
+        job = Job(kind, on_expire=on_expire)
+        with self._changed:
+            if sum(queued.status == JOB_QUEUED for queued in self._jobs.values()) >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} jobs are already waiting, try again later")
+            self._jobs[job.id] = job
+            self._emit_locked(job, "status", status=JOB_QUEUED)
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job: Job, func: Callable[..., Any], args: tuple, kwargs: dict):
+        with self._changed:
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+            self._emit_locked(job, "status", status=JOB_RUNNING)
+        try:
+            result = func(JobProgress(self, job), *args, **kwargs)
+        except Exception as e:
+            print(f"Job {job.kind} {job.id} failed: {e}")
+            with self._changed:
+                job.status = JOB_FAILED
+                job.error = str(e)
+                job.finished_at = time.time()
+                self._emit_locked(job, "status", status=JOB_FAILED, error=job.error)
+            return
+        with self._changed:
+            job.status = JOB_SUCCEEDED
+            job.result = result
+            job.finished_at = time.time()
+            self._emit_locked(job, "status", status=JOB_SUCCEEDED)
+
+    def _emit(self, job: Job, event: str, **data):
+        with self._changed:
+            self._emit_locked(job, event, **data)
+
+    def _emit_locked(self, job: Job, event: str, **data):
+        if event == "progress":
+            job.stage = data.get("stage")
+        job.events.append({"id": len(job.events) + 1, "event": event, "time": time.time(), **data})
+        self._changed.notify_all()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._changed:
+            return self._jobs.get(job_id)
+
+    def wait_events(self, job_id: str, after: int = 0, timeout: float = 15) -> List[dict]:
+        """
+        The job's events with an id above after, waiting up to timeout seconds for one if there are none yet.
+        Returns [] on timeout (or if the job is unknown).
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return []
+                if len(job.events) > after:
+                    return job.events[after:]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or job.finished:
+                    return []
+                self._changed.wait(remaining)
+
+    async def iter_sse(self, job_id: str, after: int = 0, heartbeat_seconds: float = 15):
+        """
+        The job's events as server-sent events (text/event-stream), from the event after `after` until the job
+        finishes. A comment line is sent every heartbeat_seconds without events so proxies keep the connection open.
+        """
+        while True:
+            events = await asyncio.to_thread(self.wait_events, job_id, after, heartbeat_seconds)
+            if not events:
+                job = self.get(job_id)
+                if job is None or (job.finished and len(job.events) <= after):
+                    return
+                yield b": keep-alive\n\n"
+                continue
+            for event in events:
+                after = event["id"]
+                yield b"id: %d\nevent: %s\ndata: %s\n\n" % (event["id"], event["event"].encode(), orjson.dumps(event))
+
+    def purge_expired(self) -> int:
+        """
+        Forget the jobs that finished more than ttl_seconds ago (calling their on_expire), returns how many.
+        """
+        now = time.time()
+        with self._changed:
+            expired = [job for job in self._jobs.values()
+                       if job.finished and now - job.finished_at > self.ttl_seconds]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            if job.on_expire is not None:
+                try:
+                    job.on_expire(job)
+                except Exception as e:
+                    print(f"Cleaning up job {job.id} failed: {e}")
+        return len(expired)
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
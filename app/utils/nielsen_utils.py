@@ -1,42 +1,141 @@
 # Utils for Nielsen Endpoint 
-import pandas as pd
 import os 
-import glob
 from fastapi import HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
+import io
+import warnings
 import zipfile
 import tempfile
+from collections import deque
+from itertools import islice
+from openpyxl import load_workbook
+
+from utils.storage import ObjectInfo, ObjectStorage, latest_object
+from utils.upload_store import UploadStore, upload_id_for
+from transformations.nielsen.nielsen_daily_report_funcs import read_nielsen_sheet
 
 ## VERIFICATION FUNCTIONS for Verification of Daily Nielsen Files
-def verify_columns(df: pd.DataFrame, expected_columns: list):
+NIELSEN_SHEET_NAME = 'Live+Same Day, TV Households'
+NIELSEN_COLUMNS = ['Affil.', 'Daypart', 'Custom Range', 'Time', 'Viewing Source', 'Demo',
+                   'Dates', 'Geography / Metrics', 'RTG % (X.X)', 'Indicator ']
+# 15min files have ~76 distinct Time values, dayparts less than 10
+FIFTEEN_MIN_TIME_COUNT = 70
+
+
+class NielsenSheetScan:
+    """
+    What verification needs from a Nielsen sheet, without loading it.
+
+    Attributes:
+        columns: The header row
+        dates: Distinct values of the Dates column in order of appearance (forward filled, like the report reads them)
+        times: Distinct values of the Time column (forward filled)
+        complete: False if the scan stopped early, then dates/times hold only what was needed to answer
+    """
+    def __init__(self, columns: list):
+        self.columns = columns
+        self.dates: list = []
+        self.times: set = set()
+        self.complete = False
+
+
+def scan_nielsen_sheet(file, max_dates: int = 2, max_times: int = FIFTEEN_MIN_TIME_COUNT + 1,
+                       header_row: int = 8, footer_rows: int = 8) -> NielsenSheetScan:
+    """
+    Stream the Nielsen sheet in openpyxl read only mode: read the header row, then only the Dates and Time columns.
+    Reading stops once max_dates distinct dates and max_times distinct times have been seen, nothing after that can
+    change the verification's answer.
+
+    Reads the same rows as pd.read_excel(header=header_row, skipfooter=footer_rows).ffill(): trailing empty rows
+    are ignored and the last footer_rows rows are dropped (they're only counted once footer_rows more rows follow them).
+
+    :param file: Path or binary file object of the xlsx
+    :raises ValueError: If the sheet or the header row is missing
+    """
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        if NIELSEN_SHEET_NAME not in workbook.sheetnames:
+            raise ValueError(f"Worksheet named '{NIELSEN_SHEET_NAME}' not found")
+        sheet = workbook[NIELSEN_SHEET_NAME]
+        # Some writers store a wrong sheet dimension, read from A1 like pandas does
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+
+        header = next(islice(rows, header_row, None), None)
+        if header is None:
+            raise ValueError("The sheet has no header row")
+        header = list(header)
+        while header and header[-1] is None:
+            header.pop()
+        columns = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(header)]
+        scan = NielsenSheetScan(columns)
+        if 'Dates' not in columns or 'Time' not in columns:
+            scan.complete = True
+            return scan
+        dates_index, time_index = columns.index('Dates'), columns.index('Time')
+
+        seen_dates = set()
+        last_date = last_time = None
+        pending = deque()
+        empty_rows = 0
+        for row in rows:
+            if all(value is None for value in row):
+                # Only counts if more data follows (pandas drops trailing empty rows)
+                empty_rows += 1
+                continue
+            pending.extend([(None, None)] * empty_rows)
+            empty_rows = 0
+            pending.append((row[dates_index] if dates_index < len(row) else None,
+                            row[time_index] if time_index < len(row) else None))
+            if len(pending) <= footer_rows:
+                continue
+
+            date, time = pending.popleft()
+            # Forward fill, a leading empty value stays empty (NaN) like with ffill
+            date = last_date = date if date is not None else last_date
+            time = last_time = time if time is not None else last_time
+            if date not in seen_dates:
+                seen_dates.add(date)
+                scan.dates.append(date)
+            if len(scan.times) < max_times:
+                scan.times.add(time)
+            if len(scan.dates) >= max_dates and len(scan.times) >= max_times:
+                return scan
+        scan.complete = True
+        return scan
+    finally:
+        workbook.close()
+
+
+def verify_columns(columns: list, expected_columns: list = NIELSEN_COLUMNS):
     """
     Get the Nielsen columns based on the dataframe columns.
     """
     # Check if the dataframe has the correct columns
-    if not df.columns.tolist() == expected_columns:
+    if not columns == expected_columns:
         return False
     return True
 
-def verify_date_range(df: pd.DataFrame) -> bool | list:
+def verify_date_range(scan: NielsenSheetScan) -> bool | list:
     """
     Verify the date range is valid.
     """
     # Check if the dataframe has the correct columns
-    if len(df['Dates'].unique().tolist()) > 1:
+    if len(scan.dates) > 1:
         return False
     return True
 
-def verify_no_dash_in_date(df: pd.DataFrame) -> bool:
+def verify_no_dash_in_date(scan: NielsenSheetScan) -> bool:
     """
     Verify the date range is valid.
     """
     # Check if the dataframe has the correct columns
-    if "-" in df['Dates'].unique().tolist()[0]:
+    if "-" in scan.dates[0]:
         return False
     return True
 
 
-def identify_nielsen_file(df: pd.DataFrame) -> str:
+def identify_nielsen_file(scan: NielsenSheetScan) -> str:
     """
     Identify the Nielsen file type based on the values in the Time column.
     """
@@ -44,59 +143,69 @@ def identify_nielsen_file(df: pd.DataFrame) -> str:
     # 15min files should 76 unique values in this column 
     # Dayparts should have less than 10, we could do this more deterministically but this is good enough
     # In case the format of this column changes I think this should stil work
-    if len(df['Time'].unique().tolist()) > 70:
+    if len(scan.times) > FIFTEEN_MIN_TIME_COUNT:
         return "15min"
     else: 
         return "Dayparts"
     
+def report_benchmark_files(storage: ObjectStorage, benchmark_source: str = "upload"):
+    """
+    The (15min, dayparts) benchmark files a report uses. With the "history" benchmark source they're only the
+    fallback, so they may be None.
+
+    Raises:
+    HTTPException: 400 on an unknown benchmark source, 404 if the "upload" benchmark files are missing
+    """
+    if benchmark_source not in ("upload", "history"):
+        raise HTTPException(status_code=400, detail=f"Unknown benchmarkSource {benchmark_source}, expected upload or history")
+    if benchmark_source == "history":
+        return (latest_object(storage, prefix="Benchmark-15min", suffix=".xlsx"),
+                latest_object(storage, prefix="Benchmark-Dayparts", suffix=".xlsx"))
+    return latest_benchmark("Benchmark-15min", storage), latest_benchmark("Benchmark-Dayparts", storage)
+
 ## Serving the latest benchmark file
-def serve_latest_benchmark(prefix: str):
-    base_path = "resources/nielsen/dailyBenchmark"
-    pattern = os.path.join(base_path, f"{prefix}*.xlsx")
-    matching_files = glob.glob(pattern)
-    
-    if not matching_files:
+def latest_benchmark(prefix: str, storage: ObjectStorage) -> ObjectInfo:
+    """
+    The most recent benchmark file whose name starts with prefix, eg. "Benchmark-15min".
+    """
+    latest_file = latest_object(storage, prefix=prefix, suffix=".xlsx")
+    if latest_file is None:
         raise HTTPException(status_code=404, detail=f"No {prefix} benchmark file found")
-    
-    # Sort files by modification time, most recent first
-    latest_file = max(matching_files, key=os.path.getmtime)
-    filename = os.path.basename(latest_file)
+    return latest_file
+
+def serve_latest_benchmark(prefix: str, storage: ObjectStorage):
+    latest_file = latest_benchmark(prefix, storage)
+    filename = os.path.basename(latest_file.key)
 
-    return FileResponse(
-        path=latest_file,
-        filename=filename)
+    # Streamed from storage, the file is never held in memory
+    return StreamingResponse(
+        storage.stream(latest_file.key),
+        media_type=latest_file.content_type or "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Content-Length": str(latest_file.size)})
 
 ## Serving the latest benchmark file *NAME*
-def serve_latest_benchmark_name(prefix: str):
-    base_path = "resources/nielsen/dailyBenchmark"
-    pattern = os.path.join(base_path, f"{prefix}*.xlsx")
-    matching_files = glob.glob(pattern)
-    
-    if not matching_files:
-        raise HTTPException(status_code=404, detail=f"No {prefix} benchmark file found")
-    
-    # Sort files by modification time, most recent first
-    latest_file = max(matching_files, key=os.path.getmtime)
-    filename = os.path.basename(latest_file)
+def serve_latest_benchmark_name(prefix: str, storage: ObjectStorage):
+    latest_file = latest_benchmark(prefix, storage)
+    filename = os.path.basename(latest_file.key)
 
     return {"filename": filename}
 
 
-def verify_benchmark_date_range(df: pd.DataFrame) -> bool | list:
+def verify_benchmark_date_range(scan: NielsenSheetScan) -> bool | list:
     """
     Verify the date range is valid.
     """
     # Check if the dataframe has the correct columns
-    if len(df['Dates'].unique()[0].split("-")) <= 1:
+    if len(scan.dates[0].split("-")) <= 1:
         return False
     return True
 
-def format_date_range(df:pd.DataFrame) -> str:
+def format_date_range(scan: NielsenSheetScan) -> str:
     """
     Get the most current date and the oldest date from the benchmark file.
     """
     # Get the most current date and the oldest date from the benchmark file.
-    date_range = df['Dates'].unique().tolist()
+    date_range = scan.dates
     date_range_str = date_range[0]
     # Replace '/' with '_' in the date range string
     date_range_str = date_range_str.replace('/', '_')
@@ -105,34 +214,202 @@ def format_date_range(df:pd.DataFrame) -> str:
 
 ### Filtering function for determining if daypart or 15min daily file before passing to main report function
 
-def process_and_sort_daily_files(file0: UploadFile, file1: UploadFile):
+def process_and_sort_daily_files(store: UploadStore, uploads: list):
     """
-    Process and sort the 2 uploaded daily files into dayparts and 15-minute content.
+    Load and sort the 2 daily uploads into dayparts and 15-minute sheets.
+    Each upload is an (upload_id, filename, content) triple (read_daily_uploads), the id or the file can be None:
+    the parsed sheet comes from the upload store when it has it, otherwise the file is read.
     
     Args:
-    file0 (UploadFile): First uploaded file
-    file1 (UploadFile): Second uploaded file
+    store (UploadStore): Store of the parsed uploads
+    uploads (list): The 2 (upload_id, filename, content) triples
     
     Returns:
-    tuple: (daily_dayparts_content, daily_15min_content)
+    tuple: (daily_dayparts_df, daily_15min_df)
     
     Raises:
     HTTPException: If both required file types are not present
     """
-    daily_dayparts_content = None
-    daily_15min_content = None
+    daily_dayparts_df = None
+    daily_15min_df = None
 
-    for file in [file0, file1]:
-        content = file.file.read()
-        if "Dayparts" in file.filename:
-            daily_dayparts_content = content
+    for upload_id, filename, content in uploads:
+        if upload_id is None and content is None:
+            continue
+        df, file_type, _ = _load_daily_upload(store, upload_id, filename, content)
+        if file_type == "Dayparts":
+            daily_dayparts_df = df
         else:
-            daily_15min_content = content
+            daily_15min_df = df
 
-    if daily_dayparts_content is None or daily_15min_content is None:
+    if daily_dayparts_df is None or daily_15min_df is None:
         raise HTTPException(status_code=400, detail="Missing either dayparts or 15-minute file")
 
-    return daily_dayparts_content, daily_15min_content
+    return daily_dayparts_df, daily_15min_df
+
+def _load_daily_upload(store: UploadStore, upload_id: str | None, filename: str | None, content: bytes | None):
+    # The sheet of a daily upload with its type and date
+    df, metadata = load_nielsen_upload(store, upload_id, content)
+    # Verified uploads know their type and date, otherwise they're read from the sheet
+    if metadata.get("file_type") and metadata.get("date"):
+        return df, metadata["file_type"], str(metadata["date"])
+    file_type, date = identify_nielsen_sheet(df)
+    return df, file_type, date
+
+def identify_nielsen_sheet(df) -> tuple:
+    """
+    The type (like identify_nielsen_file) and date of an already read daily sheet, as (file_type, date).
+    """
+    file_type = "15min" if df['Time'].dropna().nunique() > FIFTEEN_MIN_TIME_COUNT else "Dayparts"
+    return file_type, str(df['Dates'].dropna().iloc[0])
+
+def _sheet_metadata(store: UploadStore, upload_id: str, df) -> dict:
+    # Type and date of a cached sheet that was stored without them, recorded for the next lookup
+    try:
+        file_type, date = identify_nielsen_sheet(df)
+    except (KeyError, IndexError):
+        return {}
+    metadata = {"file_type": file_type, "date": date}
+    store.update_metadata(upload_id, metadata)
+    return metadata
+
+def _identify_daily_upload(store: UploadStore, upload_id: str | None, filename: str | None, content: bytes | None):
+    # The type and date of a daily upload without loading its sheet: verified uploads have them in their metadata,
+    # other files are scanned (header, Dates and Time columns only)
+    for candidate_id in filter(None, [upload_id, upload_id_for(content) if content is not None else None]):
+        metadata = store.get_metadata(candidate_id)
+        if metadata is None:
+            continue
+        if not (metadata.get("file_type") and metadata.get("date")):
+            # Cached from the raw file before it was verified, the sheet is there so it isn't expired
+            cached = store.get(candidate_id)
+            metadata = _sheet_metadata(store, candidate_id, cached[0]) if cached is not None else {}
+        if metadata.get("file_type") and metadata.get("date"):
+            return metadata["file_type"], str(metadata["date"])
+    if content is None:
+        raise HTTPException(status_code=410, detail=f"Upload {upload_id} has expired, please upload the file again")
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            scan = scan_nielsen_sheet(io.BytesIO(content))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read {filename}: {e}")
+    if not scan.dates:
+        raise HTTPException(status_code=400, detail=f"{filename} has no dates")
+    return identify_nielsen_file(scan), str(scan.dates[0])
+
+def pair_daily_uploads(store: UploadStore, uploads: list):
+    """
+    Pair each date's 15-minute and dayparts uploads (report jobs). Done when the job is requested so a bad set of
+    files is rejected then, the sheets themselves are only loaded by the job (load_daily_pairs).
+
+    Args:
+    store (UploadStore): Store of the parsed uploads
+    uploads (list): (upload_id, filename, content) triples (read_daily_uploads), 2 per date in any order
+
+    Returns:
+    list: (15-minute upload, dayparts upload) triple pairs, one per date
+
+    Raises:
+    HTTPException: 400 if there are no files or a date is missing one of its files or has a file twice,
+    410 if an upload id has expired and its file wasn't sent
+    """
+    uploads_by_date = {}
+    for upload_id, filename, content in uploads:
+        if upload_id is None and content is None:
+            continue
+        file_type, date = _identify_daily_upload(store, upload_id, filename, content)
+        date_uploads = uploads_by_date.setdefault(date, {})
+        if file_type in date_uploads:
+            raise HTTPException(status_code=400, detail=f"Got two {file_type} files for {date}")
+        date_uploads[file_type] = (upload_id, filename, content)
+
+    if not uploads_by_date:
+        raise HTTPException(status_code=400, detail="No daily files given")
+    incomplete = [date for date, date_uploads in uploads_by_date.items() if len(date_uploads) < 2]
+    if incomplete:
+        raise HTTPException(status_code=400, detail=f"Missing either dayparts or 15-minute file for {', '.join(incomplete)}")
+
+    return [(date_uploads["15min"], date_uploads["Dayparts"]) for date_uploads in uploads_by_date.values()]
+
+def load_daily_pairs(store: UploadStore, pairs: list):
+    """
+    Load the sheets of the pairs pair_daily_uploads returned.
+
+    Returns:
+    list: (daily_15min_df, daily_dayparts_df) per date
+
+    Raises:
+    ValueError: If an upload id expired after the job was queued
+    """
+    daily_files = []
+    for pair in pairs:
+        frames = []
+        for upload_id, _, content in pair:
+            loaded = _read_nielsen_upload(store, upload_id, content)
+            if loaded is None:
+                raise ValueError(f"Upload {upload_id} has expired, please upload the file again")
+            frames.append(loaded[0])
+        daily_files.append(tuple(frames))
+    return daily_files
+
+def read_daily_uploads(uploads: list) -> list:
+    """
+    The (upload_id, UploadFile) pairs of a request as (upload_id, filename, content) triples, the files are only
+    readable during the request.
+    """
+    return [(upload_id, file.filename if file is not None else None, file.file.read() if file is not None else None)
+            for upload_id, file in uploads]
+
+## Upload sessions, parsed daily files kept between verification and report generation
+def cache_nielsen_upload(store: UploadStore, upload_id: str, content: bytes, metadata: dict):
+    """
+    Parse a verified upload and keep the sheet for report generation. Run as a background task after verification.
+    """
+    cached_metadata = store.get_metadata(upload_id)
+    if cached_metadata is not None and cached_metadata.get("file_type"):
+        return
+    # Already parsed (the file was sent for a report first), only the verification's metadata is missing
+    if cached_metadata is not None and store.update_metadata(upload_id, metadata):
+        return
+    try:
+        store.put(upload_id, read_nielsen_sheet(io.BytesIO(content)), metadata)
+        store.purge_expired()
+    except Exception as e:
+        # Not fatal, report generation reads the file again
+        print(f"Caching upload {upload_id} failed: {e}")
+
+def load_nielsen_upload(store: UploadStore, upload_id: str | None = None, content: bytes | None = None):
+    """
+    The parsed sheet of a daily upload and its metadata (file_type, date...), from the upload store when it has it
+    (by upload id, or by the hash of content), otherwise read from content and stored for next time.
+
+    Raises:
+    HTTPException: If the upload id has expired and the file wasn't sent again
+    """
+    loaded = _read_nielsen_upload(store, upload_id, content)
+    if loaded is None:
+        raise HTTPException(status_code=410, detail=f"Upload {upload_id} has expired, please upload the file again")
+    return loaded
+
+def _read_nielsen_upload(store: UploadStore, upload_id: str | None, content: bytes | None):
+    # load_nielsen_upload, None when the upload id has expired and there's no content to read
+    for candidate_id in filter(None, [upload_id, upload_id_for(content) if content is not None else None]):
+        cached = store.get(candidate_id)
+        if cached is not None:
+            return cached
+    if content is None:
+        return None
+    df = read_nielsen_sheet(io.BytesIO(content))
+    try:
+        metadata = dict(zip(("file_type", "date"), identify_nielsen_sheet(df)))
+    except (KeyError, IndexError):
+        metadata = {}
+    try:
+        store.put(upload_id_for(content), df, metadata)
+    except Exception as e:
+        print(f"Caching upload failed: {e}")
+    return df, metadata
 
 # Function to zip the eml files
 def zip_eml_files(eml_file_paths: list):
@@ -0,0 +1,88 @@
+# In process cache of stored objects (the coverage map geojson), revalidated against storage with the object's ETag.
+# Within the ttl the cached bytes are served as is, after it we send a conditional GET (If-None-Match)
+# which costs a round trip but no download unless the object actually changed.
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from utils.storage import ObjectNotModified, ObjectStorage, StorageError
+
+
+class CachedObject:
+    """ Raw bytes of a stored object and when we last checked they're current. """
+    def __init__(self, body: bytes, etag: str, last_modified: Optional[str], fetched_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.validated_at = fetched_at
+
+
+class ObjectCache:
+    """
+    Thread safe cache of object bytes keyed by (storage, key).
+
+    get() returns the cached bytes while they're younger than ttl_seconds, otherwise revalidates them with a
+    conditional GET. Only one thread revalidates a given object at a time, the others wait for it.
+    If storage can't be reached and we have a copy, the stale copy is served.
+    """
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = ttl_seconds
+        self._objects: Dict[Tuple[str, str], CachedObject] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self.stats = {"hits": 0, "revalidated": 0, "downloads": 0, "stale_served": 0}
+
+    def _lock(self, cache_key: Tuple[str, str]) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(cache_key, threading.Lock())
+
+    def get(self, storage: ObjectStorage, key: str) -> CachedObject:
+        """
+        Get the object's bytes, from the cache when they're still current.
+
+        :param storage: Storage backend the object lives in
+        :param key: Object key
+        :return: CachedObject
+        """
+        location = storage.location
+        cache_key = (location, key)
+        cached = self._objects.get(cache_key)
+        if cached is not None and time.monotonic() - cached.validated_at < self.ttl_seconds:
+            self.stats["hits"] += 1
+            return cached
+
+        with self._lock(cache_key):
+            # Another thread may have revalidated while we waited for the lock
+            cached = self._objects.get(cache_key)
+            if cached is not None and time.monotonic() - cached.validated_at < self.ttl_seconds:
+                self.stats["hits"] += 1
+                return cached
+
+            try:
+                stored = storage.get(key, if_none_match=cached.etag if cached is not None else None)
+                body = stored.read()
+            except ObjectNotModified:
+                cached.validated_at = time.monotonic()
+                self.stats["revalidated"] += 1
+                return cached
+            except (StorageError, ClientError, BotoCoreError, OSError) as e:
+                if cached is not None:
+                    print(f"Revalidating {location}{key} failed, serving the cached copy: {e}")
+                    self.stats["stale_served"] += 1
+                    return cached
+                raise
+
+            last_modified = stored.info.last_modified
+            cached = CachedObject(body=body, etag=stored.info.etag,
+                                  last_modified=last_modified.isoformat() if last_modified is not None else None,
+                                  fetched_at=time.monotonic())
+            self._objects[cache_key] = cached
+            self.stats["downloads"] += 1
+            print(f"Downloaded {location}{key} ({len(cached.body)} bytes, etag {cached.etag})")
+            return cached
+
+    def clear(self):
+        self._objects.clear()
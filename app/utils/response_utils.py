@@ -0,0 +1,125 @@
+# Fast JSON responses for our large, DataFrame backed payloads (mostly the engagement tables)
+# FastAPI would otherwise validate every row through the pydantic response model and then encode it again with the stdlib json encoder.
+import time
+import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import Response, StreamingResponse
+
+# OPT_SERIALIZE_NUMPY lets us hand numpy scalars/arrays straight to the encoder,
+# OPT_NON_STR_KEYS is needed for the periodicity tables, their columns are fiscal month integers.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Rows encoded per chunk in streaming mode, peak memory for the json is bounded by this instead of the payload size
+STREAM_CHUNK_ROWS = 500
+
+
+def _orjson_default(obj: Any) -> Any:
+    """
+    Fallback encoder for the few types orjson does not handle natively (pandas missing values, timestamps, decimals).
+    NaN and inf floats never get here, orjson writes them as null, same as the pydantic response models do.
+    """
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode content to JSON bytes with the same options as the fast responses.
+    """
+    return orjson.dumps(content, default=_orjson_default, option=ORJSON_OPTIONS)
+
+
+def dataframe_to_records(df: pd.DataFrame) -> List[Dict[Any, Any]]:
+    """
+    Convert a DataFrame to a list of row dictionaries (the same shape as df.to_dict(orient="records")).
+
+    Skips pandas' per value boxing to python types, the values stay numpy scalars and are encoded by orjson directly.
+    """
+    columns = df.columns.tolist()
+    values = [df.iloc[:, i].to_numpy() for i in range(len(columns))]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered with orjson. Numpy aware, NaN/inf are written as null.
+
+    Returning this directly from an endpoint skips the response_model validation, the response_model is still
+    declared on the route so the openapi docs stay the same. The encode time is sent back in a Server-Timing header.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        start_time = time.perf_counter()
+        body = dumps(content)
+        self.serialize_seconds = time.perf_counter() - start_time
+        return body
+
+    def init_headers(self, headers=None) -> None:
+        super().init_headers(headers)
+        serialize_seconds = getattr(self, "serialize_seconds", None)
+        if serialize_seconds is not None:
+            self.raw_headers.append((b"server-timing", f"serialize;dur={serialize_seconds * 1000:.2f}".encode("latin-1")))
+
+
+def iter_engagement_json(message: str, tables: Dict[str, pd.DataFrame], metadata: Optional[Dict[str, Any]] = None,
+                         success: bool = True, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Generator that writes the engagement response envelope piece by piece, each table is encoded chunk_rows rows at a time.
+
+    The output is byte for byte the same json as engagement_response, it's just never held in memory all at once.
+    """
+    yield b'{"success":' + dumps(success) + b',"message":' + dumps(message) + b',"data":{'
+    for table_num, (name, df) in enumerate(tables.items()):
+        yield (b',' if table_num else b'') + dumps(name) + b':['
+        for start in range(0, len(df), chunk_rows):
+            # Encode the chunk as a list and strip the brackets, cheaper than joining each row
+            rows = dumps(dataframe_to_records(df.iloc[start:start + chunk_rows]))[1:-1]
+            yield (b',' if start else b'') + rows
+        yield b']'
+    yield b'},"metadata":' + dumps(metadata) + b'}'
+
+
+def raw_json_envelope(message: str, raw_data: bytes, metadata: Optional[Dict[str, Any]] = None, success: bool = True) -> bytes:
+    """
+    Build the standard response envelope (success, message, data, metadata) around data that's already encoded json,
+    eg. a geojson file straight from S3. The data bytes are spliced in as is, never parsed.
+    """
+    return (b'{"success":' + dumps(success) + b',"message":' + dumps(message) + b',"data":' + raw_data.strip()
+            + b',"metadata":' + dumps(metadata) + b'}')
+
+
+def engagement_response(message: str, tables: Dict[str, pd.DataFrame], metadata: Optional[Dict[str, Any]] = None,
+                        success: bool = True, stream: bool = False) -> Response:
+    """
+    Build the engagement response envelope (success, message, data, metadata) straight from the computed DataFrames.
+
+    :param message: The response message
+    :param tables: Dictionary of table name -> DataFrame, each DataFrame becomes a list of row dictionaries
+    :param metadata: Optional metadata dictionary (column lists etc.)
+    :param success: Whether the request was successful
+    :param stream: Stream the json row chunk by row chunk instead of rendering it up front (for multi-year ranges)
+    :return: FastJSONResponse, or a StreamingResponse when stream is True
+    """
+    if stream:
+        return StreamingResponse(iter_engagement_json(message, tables, metadata, success), media_type="application/json")
+
+    start_time = time.perf_counter()
+    data = {name: dataframe_to_records(df) for name, df in tables.items()}
+    response = FastJSONResponse({"success": success, "message": message, "data": data, "metadata": metadata})
+    print(f"Encoded {len(tables)} tables ({len(response.body)} bytes) in {time.perf_counter() - start_time:.4f} seconds.")
+    return response
@@ -0,0 +1,315 @@
+# Object storage with interchangeable backends.
+# The coverage map data lives in S3 and the Nielsen benchmark files on the server's disk (with a plan to move them to S3),
+# both now go through the same interface, so where a set of files lives is configuration, and everything can run
+# against a local directory (development, benchmarks, tests).
+import mimetypes
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+class StorageError(Exception):
+    """ Base class of the storage errors. """
+
+
+class ObjectNotFound(StorageError):
+    """ The key doesn't exist. """
+
+
+class ObjectNotModified(StorageError):
+    """ A conditional get (if_none_match) matched, the caller's copy is current. """
+
+
+class ObjectInfo:
+    """ Metadata of a stored object. """
+    def __init__(self, key: str, size: int, etag: str, last_modified: Optional[datetime], content_type: Optional[str] = None):
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+
+    def __repr__(self) -> str:
+        return f"ObjectInfo(key={self.key!r}, size={self.size}, etag={self.etag!r})"
+
+
+class StoredObject:
+    """ An object's metadata and its body, the body is a file like object that should be closed (or used as a context manager). """
+    def __init__(self, info: ObjectInfo, body: BinaryIO):
+        self.info = info
+        self.body = body
+
+    def read(self) -> bytes:
+        with self:
+            return self.body.read()
+
+    def iter_chunks(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        with self:
+            while True:
+                chunk = self.body.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def __enter__(self) -> "StoredObject":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.body.close()
+
+
+class ObjectStorage(ABC):
+    """
+    Interface of the storage backends. Keys are '/' separated paths, relative to the backend's bucket/prefix or root directory.
+    """
+    name = "storage"
+
+    @property
+    @abstractmethod
+    def location(self) -> str:
+        """ Where the objects live, keys are appended to it (used in cache keys and logs). """
+
+    @abstractmethod
+    def get(self, key: str, if_none_match: Optional[str] = None) -> StoredObject:
+        """
+        Open an object for reading.
+
+        :param key: Object key
+        :param if_none_match: ETag of a copy the caller already has, raises ObjectNotModified if it's still current
+        :raises ObjectNotFound, ObjectNotModified
+        """
+
+    def get_bytes(self, key: str) -> bytes:
+        return self.get(key).read()
+
+    def stream(self, key: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """
+        Read an object in chunks, without holding it all in memory. The object is opened straight away, so a missing
+        key raises here and not halfway through a response.
+        """
+        return self.get(key).iter_chunks(chunk_size)
+
+    @abstractmethod
+    def head(self, key: str) -> ObjectInfo:
+        """
+        :raises ObjectNotFound
+        """
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.head(key)
+            return True
+        except ObjectNotFound:
+            return False
+
+    @abstractmethod
+    def put(self, key: str, data: Union[bytes, BinaryIO], content_type: Optional[str] = None) -> ObjectInfo:
+        """
+        Write an object, replacing any existing one. data is bytes or a readable file object (streamed, eg. an UploadFile's file).
+        """
+
+    @abstractmethod
+    def delete(self, key: str):
+        """
+        Delete an object, deleting a missing key is not an error.
+        """
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> List[ObjectInfo]:
+        """
+        Every object whose key starts with prefix, sorted by key.
+        """
+
+
+class LocalStorage(ObjectStorage):
+    """
+    Objects are files under a root directory. The ETag is built from the file's size and modification time
+    (like nginx's), so it changes whenever the file is rewritten without hashing the file.
+    """
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    @property
+    def location(self) -> str:
+        return self.root + "/"
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *key.split("/")))
+        if os.path.commonpath([path, self.root]) != self.root or path == self.root:
+            raise StorageError(f"Invalid key {key!r}")
+        return path
+
+    def _info(self, key: str, path: str) -> ObjectInfo:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(key)
+        return ObjectInfo(key=key, size=stat.st_size, etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                          last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                          content_type=mimetypes.guess_type(key)[0])
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> StoredObject:
+        path = self._path(key)
+        info = self._info(key, path)
+        if if_none_match is not None and if_none_match == info.etag:
+            raise ObjectNotModified(key)
+        try:
+            return StoredObject(info, open(path, "rb"))
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def head(self, key: str) -> ObjectInfo:
+        return self._info(key, self._path(key))
+
+    def put(self, key: str, data: Union[bytes, BinaryIO], content_type: Optional[str] = None) -> ObjectInfo:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename, readers never see a half written object.
+        # The temporary file is unique per write, concurrent puts of a key (threads or processes) each replace it whole
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise StorageError(f"Writing {key!r} failed: {e}") from e
+        return self._info(key, path)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str = "") -> List[ObjectInfo]:
+        objects = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix) and ".tmp-" not in filename:
+                    try:
+                        objects.append(self._info(key, path))
+                    except ObjectNotFound:
+                        continue
+        return sorted(objects, key=lambda info: info.key)
+
+
+class S3Storage(ObjectStorage):
+    """
+    Objects in an S3 bucket, optionally under a key prefix.
+    """
+    name = "s3"
+
+    def __init__(self, s3_client: boto3.client, bucket: str, prefix: str = ""):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    @property
+    def location(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    @staticmethod
+    def _error_code(error: ClientError) -> Optional[str]:
+        return error.response.get("Error", {}).get("Code")
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> StoredObject:
+        request = {"Bucket": self.bucket, "Key": self._key(key)}
+        if if_none_match is not None:
+            request["IfNoneMatch"] = if_none_match
+        try:
+            s3_object = self.s3_client.get_object(**request)
+        except ClientError as e:
+            code = self._error_code(e)
+            if code in ("304", "NotModified"):
+                raise ObjectNotModified(key)
+            if code in ("404", "NoSuchKey"):
+                raise ObjectNotFound(key)
+            raise
+        info = ObjectInfo(key=key, size=s3_object.get("ContentLength", 0), etag=s3_object["ETag"],
+                          last_modified=s3_object.get("LastModified"), content_type=s3_object.get("ContentType"))
+        return StoredObject(info, s3_object["Body"])
+
+    def head(self, key: str) -> ObjectInfo:
+        try:
+            s3_object = self.s3_client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._error_code(e) in ("404", "NoSuchKey", "NotFound"):
+                raise ObjectNotFound(key)
+            raise
+        return ObjectInfo(key=key, size=s3_object.get("ContentLength", 0), etag=s3_object["ETag"],
+                          last_modified=s3_object.get("LastModified"), content_type=s3_object.get("ContentType"))
+
+    def put(self, key: str, data: Union[bytes, BinaryIO], content_type: Optional[str] = None) -> ObjectInfo:
+        extra_args = {"ContentType": content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"}
+        if isinstance(data, (bytes, bytearray)):
+            self.s3_client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data, **extra_args)
+        else:
+            # Multipart upload for large files, the file is read in chunks
+            self.s3_client.upload_fileobj(data, self.bucket, self._key(key), ExtraArgs=extra_args)
+        return self.head(key)
+
+    def delete(self, key: str):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str = "") -> List[ObjectInfo]:
+        objects = []
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for s3_object in page.get("Contents", []):
+                objects.append(ObjectInfo(key=s3_object["Key"][len(self.prefix):], size=s3_object["Size"],
+                                          etag=s3_object["ETag"], last_modified=s3_object.get("LastModified")))
+        return sorted(objects, key=lambda info: info.key)
+
+
+def latest_object(storage: ObjectStorage, prefix: str = "", suffix: str = "") -> Optional[ObjectInfo]:
+    """
+    The most recently modified object whose key starts with prefix and ends with suffix, None if there are none.
+    """
+    matching = [info for info in storage.list(prefix) if info.key.endswith(suffix)]
+    if not matching:
+        return None
+    return max(matching, key=lambda info: info.last_modified or datetime.min.replace(tzinfo=timezone.utc))
+
+
+def create_storage(backend: str, bucket: Optional[str] = None, prefix: str = "", local_path: Optional[str] = None,
+                   s3_client: Optional[boto3.client] = None) -> ObjectStorage:
+    """
+    Create a storage backend.
+
+    :param backend: "s3" or "local"
+    :param bucket: S3 bucket (s3)
+    :param prefix: Key prefix inside the bucket (s3)
+    :param local_path: Root directory (local)
+    :param s3_client: boto3 S3 client (s3)
+    """
+    if backend == "s3":
+        if s3_client is None or not bucket:
+            raise ValueError("The s3 storage backend needs an s3 client and a bucket")
+        return S3Storage(s3_client, bucket, prefix)
+    if backend == "local":
+        if not local_path:
+            raise ValueError("The local storage backend needs a local path")
+        return LocalStorage(local_path)
+    raise ValueError(f"Unknown storage backend {backend!r}, expected 's3' or 'local'")
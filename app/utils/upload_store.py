@@ -0,0 +1,138 @@
+# Upload sessions for the Nielsen daily files.
+# The frontend uploads each daily file twice, once to verify it and once to generate the report, and reading the
+# workbook is the slow part of both. Verification now parses the sheet once and keeps it here (parquet, keyed by the
+# sha256 of the file's bytes) and returns that hash as the upload id. Report generation takes the ids, or hashes the
+# bytes it's sent, and only reads the workbook again when the entry has expired.
+import hashlib
+import io
+import re
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from utils.storage import ObjectNotFound, ObjectStorage, StorageError
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def dump_frame(df: pd.DataFrame) -> Tuple[bytes, str]:
+    """
+    Serialize a DataFrame as parquet, or pickle when pyarrow can't convert it (object columns mixing types,
+    which the raw Nielsen sheets can have). Returns (bytes, format). Only used for frames we read back ourselves.
+    """
+    buffer = io.BytesIO()
+    try:
+        df.to_parquet(buffer, engine="pyarrow", index=True)
+        return buffer.getvalue(), "parquet"
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        buffer = io.BytesIO()
+        df.to_pickle(buffer)
+        return buffer.getvalue(), "pickle"
+
+
+def load_frame(content: bytes, frame_format: str) -> pd.DataFrame:
+    """ Read back a frame written by dump_frame. """
+    if frame_format == "parquet":
+        return pd.read_parquet(io.BytesIO(content), engine="pyarrow")
+    return pd.read_pickle(io.BytesIO(content))
+
+
+def upload_id_for(content: bytes) -> str:
+    """ The upload id of a file, the sha256 of its bytes. """
+    return hashlib.sha256(content).hexdigest()
+
+
+class UploadStore:
+    """
+    Parsed uploads (DataFrames + a little metadata) kept in storage for ttl_seconds, frames are stored with dump_frame.
+    """
+    def __init__(self, storage: ObjectStorage, ttl_seconds: int = 6 * 3600):
+        self.storage = storage
+        self.ttl_seconds = ttl_seconds
+
+    def _expired(self, last_modified: Optional[datetime]) -> bool:
+        if last_modified is None:
+            return False
+        return (datetime.now(timezone.utc) - last_modified).total_seconds() > self.ttl_seconds
+
+    def put(self, upload_id: str, df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Store a parsed upload. The metadata (file type, date...) is returned with the frame by get().
+        """
+        frame_bytes, frame_format = dump_frame(df)
+        # Frame first, the metadata marks the entry as complete
+        self.storage.put(f"{upload_id}.{frame_format}", frame_bytes)
+        self.storage.put(f"{upload_id}.json", orjson.dumps({"format": frame_format, "metadata": metadata or {},
+                                                            "stored_at": time.time()}))
+
+    def get(self, upload_id: str) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+        """
+        The parsed upload and its metadata, None if it's unknown or expired.
+        """
+        if not UPLOAD_ID_PATTERN.match(upload_id or ""):
+            return None
+        try:
+            info = self.storage.head(f"{upload_id}.json")
+            if self._expired(info.last_modified):
+                return None
+            entry = orjson.loads(self.storage.get_bytes(f"{upload_id}.json"))
+            frame_bytes = self.storage.get_bytes(f"{upload_id}.{entry['format']}")
+        except (ObjectNotFound, StorageError):
+            return None
+        return load_frame(frame_bytes, entry["format"]), entry["metadata"]
+
+    def get_metadata(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Only the metadata of a parsed upload (the frame isn't read), None if it's unknown or expired.
+        """
+        if not UPLOAD_ID_PATTERN.match(upload_id or ""):
+            return None
+        try:
+            info = self.storage.head(f"{upload_id}.json")
+            if self._expired(info.last_modified):
+                return None
+            return orjson.loads(self.storage.get_bytes(f"{upload_id}.json"))["metadata"]
+        except (ObjectNotFound, StorageError):
+            return None
+
+    def update_metadata(self, upload_id: str, metadata: Dict[str, Any]) -> bool:
+        """
+        Add to the metadata of a stored upload without parsing its file again, returns False if it's unknown or expired.
+        The frame is written again too, so both objects of the entry expire together.
+        """
+        if not UPLOAD_ID_PATTERN.match(upload_id or ""):
+            return False
+        try:
+            info = self.storage.head(f"{upload_id}.json")
+            if self._expired(info.last_modified):
+                return False
+            entry = orjson.loads(self.storage.get_bytes(f"{upload_id}.json"))
+            frame_key = f"{upload_id}.{entry['format']}"
+            self.storage.put(frame_key, self.storage.get_bytes(frame_key))
+            entry["metadata"] = {**entry["metadata"], **metadata}
+            entry["stored_at"] = time.time()
+            self.storage.put(f"{upload_id}.json", orjson.dumps(entry))
+        except (ObjectNotFound, StorageError):
+            return False
+        return True
+
+    def contains(self, upload_id: str) -> bool:
+        try:
+            return not self._expired(self.storage.head(f"{upload_id}.json").last_modified)
+        except (ObjectNotFound, StorageError):
+            return False
+
+    def purge_expired(self) -> int:
+        """
+        Delete the expired entries, returns how many were deleted.
+        """
+        purged = 0
+        for info in self.storage.list():
+            if self._expired(info.last_modified):
+                self.storage.delete(info.key)
+                purged += info.key.endswith(".json")
+        return purged